@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'patients.middleware.PerformanceMiddleware',
+    'patients.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,6 +84,92 @@ DATABASES = {
     }
 }
 
+# Production SQLite profile, enabled with DJANGO_DB_PROFILE=production:
+# WAL lets readers run alongside a writer, writes take the lock when their
+# transaction starts (BEGIN IMMEDIATE) and wait up to busy_timeout for it,
+# and connections are kept open between requests.
+
+SQLITE_PRODUCTION_OPTIONS = {
+    'transaction_mode': 'IMMEDIATE',
+    'pragmas': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,
+        'temp_store': 'MEMORY',
+    },
+}
+
+if os.environ.get('DJANGO_DB_PROFILE') == 'production':
+    DATABASES['default'].update({
+        'ENGINE': 'patient_management_system.sqlite3',
+        'OPTIONS': SQLITE_PRODUCTION_OPTIONS,
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+# Read replica, enabled with DJANGO_USE_REPLICA=1: reads go to the replica
+# unless the request writes or the client wrote within the last
+# REPLICA_STICKY_SECONDS. Locally the replica is a second SQLite file kept
+# up to date with `manage.py sync_replica`.
+
+DATABASE_ROUTERS = ['patients.routers.PrimaryReplicaRouter']
+
+DATABASE_REPLICAS = []
+
+REPLICA_STICKY_SECONDS = 10
+
+if os.environ.get('DJANGO_USE_REPLICA'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=BASE_DIR / 'db-replica.sqlite3',
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS = ['replica']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Any cache backend works for the availability cache; use a shared one
+# (Redis, Memcached) when running several worker processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'availability': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'availability',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+
+AVAILABILITY_CACHE_ALIAS = 'availability'
+
+# Patient and appointment lists and the patient page answer repeated GETs
+# with 304 Not Modified. Set this to a cache alias to also keep rendered
+# pages per user for RESPONSE_CACHE_TIMEOUT seconds (see patients.conditional).
+RESPONSE_CACHE_ALIAS = None
+RESPONSE_CACHE_TIMEOUT = 300
+
+
+# Completed and cancelled appointments older than this many days are moved
+# to the archive table by `manage.py archive_appointments`.
+
+APPOINTMENT_ARCHIVE_DAYS = 365
+
+
+# Performance instrumentation
+# Queries slower than this are logged to the 'patients.performance' logger
+# (None disables the log); /metrics is served to these addresses and to
+# staff users.
+
+PERFORMANCE_SLOW_QUERY_MS = 100
+
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
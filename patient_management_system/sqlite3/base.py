@@ -0,0 +1,51 @@
+"""
+SQLite backend with per-connection PRAGMAs and a configurable transaction
+mode, for running the site on SQLite with several worker processes.
+
+Two extra keys are read from ``OPTIONS`` (everything else still goes to
+``sqlite3.connect``):
+
+- ``pragmas``: ``{name: value}`` run on every new connection, e.g.
+  ``{'journal_mode': 'WAL', 'busy_timeout': 5000}``.
+- ``transaction_mode``: ``'DEFERRED'`` (SQLite's default), ``'IMMEDIATE'``
+  or ``'EXCLUSIVE'``, used by ``BEGIN`` for every ``transaction.atomic``
+  block. With ``IMMEDIATE`` a transaction takes the write lock up front and
+  waits for it under ``busy_timeout``, instead of failing with "database is
+  locked" when it later tries to upgrade a read lock.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+def apply_pragmas(connection, pragmas):
+    for name, value in pragmas.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, settings_dict, *args, **kwargs):
+        super().__init__(settings_dict, *args, **kwargs)
+        options = self.settings_dict['OPTIONS']
+        self.pragmas = dict(options.get('pragmas', {}))
+        self.transaction_mode = options.get('transaction_mode', 'DEFERRED').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode must be one of {", ".join(TRANSACTION_MODES)}, '
+                f'not {self.transaction_mode!r}'
+            )
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('pragmas', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        apply_pragmas(conn, self.pragmas)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
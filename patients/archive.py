@@ -0,0 +1,137 @@
+"""
+Archival of old appointments.
+
+Completed and cancelled appointments from before a horizon are moved from
+``Appointment`` to ``ArchivedAppointment``, so the hot table, its indexes
+and every list and conflict query on it stay the size of the working set
+instead of growing with the clinic's history.
+
+Rows are moved in small batches, each one ``INSERT ... SELECT`` plus
+``DELETE`` in its own short transaction: the write lock is held for one
+batch at a time, and bookings made between batches go through. A batch is
+all-or-nothing, so an interrupted run leaves every row in exactly one of
+the two tables and can simply be started again.
+
+``appointment_history()`` reads a patient's appointments from both tables
+in one ``UNION ALL`` query.
+"""
+import time as clock
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Value, BooleanField
+from django.utils import timezone
+
+from . import directory
+from .models import Appointment, ArchivedAppointment
+from .routers import pin_primary
+
+ARCHIVED_STATUSES = ('COMPLETED', 'CANCELLED')
+# Stays under SQLite's default limit of 999 query parameters
+DEFAULT_BATCH_SIZE = 500
+HISTORY_LIMIT = 50
+HISTORY_FIELDS = (
+    'id', 'appointment_date', 'appointment_time', 'status', 'timezone', 'notes',
+    'doctor_id',
+)
+_STATUS_LABELS = dict(Appointment.STATUS_CHOICES)
+# Columns copied as they are; archived_at is set by the INSERT
+_COPIED_FIELDS = (
+    'id', 'patient', 'doctor', 'appointment_date', 'appointment_time', 'status', 'notes',
+    'timezone', 'starts_at', 'created_by', 'created_at', 'updated_at',
+)
+
+
+def default_cutoff(days=None, today=None):
+    """First day kept in the hot table, ``days`` (default ``APPOINTMENT_ARCHIVE_DAYS``) ago"""
+    if days is None:
+        days = settings.APPOINTMENT_ARCHIVE_DAYS
+    return (today or timezone.localdate()) - timedelta(days=days)
+
+
+def archivable(cutoff):
+    return Appointment.objects.filter(appointment_date__lt=cutoff, status__in=ARCHIVED_STATUSES)
+
+
+def _move_sql(connection, ids):
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(Appointment._meta.get_field(name).column) for name in _COPIED_FIELDS)
+    placeholders = ', '.join(['%s'] * len(ids))
+    insert = (
+        f'INSERT INTO {quote(ArchivedAppointment._meta.db_table)} ({columns}, {quote("archived_at")}) '
+        f'SELECT {columns}, %s FROM {quote(Appointment._meta.db_table)} WHERE {quote("id")} IN ({placeholders})'
+    )
+    delete = f'DELETE FROM {quote(Appointment._meta.db_table)} WHERE {quote("id")} IN ({placeholders})'
+    return insert, delete
+
+
+def archive_batch(cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """Move up to ``batch_size`` rows older than ``cutoff``; returns how many moved"""
+    using = router.db_for_write(Appointment)
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        # Oldest first, along the (appointment_date, appointment_time) index
+        ids = list(
+            archivable(cutoff).using(using).order_by('appointment_date', 'appointment_time')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        insert, delete = _move_sql(connection, ids)
+        with connection.cursor() as cursor:
+            cursor.execute(insert, [timezone.now(), *ids])
+            cursor.execute(delete, ids)
+    # The moved rows are past and not bookable, so no cached availability
+    # (which only covers bookable days) changes
+    return len(ids)
+
+
+def archive_appointments(cutoff=None, batch_size=DEFAULT_BATCH_SIZE, pause=0.0, limit=None, progress=None):
+    """
+    Archive every completed or cancelled appointment dated before ``cutoff``
+    (default: ``APPOINTMENT_ARCHIVE_DAYS`` ago), sleeping ``pause`` seconds
+    between batches to leave room for other writers. Returns the row count.
+    """
+    cutoff = cutoff or default_cutoff()
+    moved = 0
+    with pin_primary():
+        while limit is None or moved < limit:
+            size = batch_size if limit is None else min(batch_size, limit - moved)
+            count = archive_batch(cutoff, size)
+            moved += count
+            if progress:
+                progress(moved)
+            if count < size:
+                break
+            if pause:
+                clock.sleep(pause)
+    return moved
+
+
+def appointment_history(patient, limit=HISTORY_LIMIT):
+    """
+    A patient's appointments from the hot table and the archive, newest
+    first, as dicts of ``HISTORY_FIELDS`` plus ``archived``, ``doctor_name``,
+    ``doctor__specialization`` (from the doctor directory) and
+    ``status_display``.
+    """
+    current = (
+        Appointment.objects.filter(patient=patient).order_by()
+        .values(*HISTORY_FIELDS).annotate(archived=Value(False, output_field=BooleanField()))
+    )
+    archived = (
+        ArchivedAppointment.objects.filter(patient=patient).order_by()
+        .values(*HISTORY_FIELDS).annotate(archived=Value(True, output_field=BooleanField()))
+    )
+    rows = list(
+        current.union(archived, all=True)
+        .order_by(F('appointment_date').desc(), F('appointment_time').desc())[:limit]
+    )
+    doctors = directory.resolve({row['doctor_id'] for row in rows})
+    for row in rows:
+        doctor = doctors[row['doctor_id']]
+        row['doctor_name'] = doctor.get_full_name()
+        row['doctor__specialization'] = doctor.specialization
+        row['status_display'] = _STATUS_LABELS.get(row['status'], row['status'])
+    return rows
@@ -0,0 +1,101 @@
+"""
+Autocomplete for the patient, doctor and time zone fields of the booking forms.
+
+``AutocompleteSelect`` renders only the selected option, plus a search box
+that fills the select from a JSON endpoint as the user types, so a booking
+page no longer carries every patient, doctor and time zone. The endpoints
+(``patient_autocomplete``, ``doctor_autocomplete`` and
+``timezone_autocomplete`` in ``views``) answer ``?q=`` with at most ``LIMIT``
+results::
+
+    {"results": [{"id": 7, "text": "John Smith (1980-04-02)"}], "more": true}
+
+where ``more`` says that there are further matches to narrow down.
+"""
+from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+from django.urls import reverse
+
+from .directory import get_directory
+from .models import Patient
+from .search import name_prefix_search
+from .timezones import timezone_choices
+
+LIMIT = 10
+
+
+def patient_label(patient):
+    # Enough to tell apart the many patients sharing a name
+    return f'{patient.get_full_name()} ({patient.date_of_birth:%Y-%m-%d})'
+
+
+class AutocompleteSelect(forms.Select):
+    template_name = 'patients/widgets/autocomplete_select.html'
+
+    class Media:
+        js = ['patients/autocomplete.js']
+
+    def __init__(self, url_name, attrs=None, choices=()):
+        super().__init__(attrs, choices)
+        self.url_name = url_name
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['url'] = reverse(self.url_name)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        selected = {str(option_value) for option_value in value if option_value not in (None, '')}
+        return [
+            (None, [self.create_option(name, option_value, label, str(option_value) in selected, index)], index)
+            for index, (option_value, label) in enumerate(self._selected_choices(selected))
+        ]
+
+    def _selected_choices(self, selected):
+        # Only the blank choice and the selected ones, instead of iterating
+        # every choice (for a model field, every row) like Select does
+        choices = self.choices
+        if isinstance(choices, ModelChoiceIterator):
+            if choices.field.empty_label is not None:
+                yield '', choices.field.empty_label
+            for option_value in selected:
+                try:
+                    obj = choices.field.to_python(option_value)
+                except ValidationError:
+                    continue  # a tampered or stale value, reported by the field
+                yield choices.choice(obj)
+            return
+        for option_value, label in choices:
+            if option_value == '' or str(option_value) in selected:
+                yield option_value, label
+
+
+def _response(items, label, limit):
+    return {
+        'results': [{'id': item.pk, 'text': label(item)} for item in items[:limit]],
+        'more': len(items) > limit,
+    }
+
+
+def patient_results(query, limit=LIMIT):
+    patients = name_prefix_search(Patient.objects.only('first_name', 'last_name', 'date_of_birth'), query, limit + 1)
+    return _response(patients, patient_label, limit)
+
+
+def doctor_results(query, limit=LIMIT):
+    """Available doctors only, like the booking forms; all of them for an empty query"""
+    directory = get_directory()
+    return _response(directory.search(query, directory.available)[:limit + 1], str, limit)
+
+
+def timezone_results(query, limit=LIMIT):
+    words = query.lower().split()
+    names = [
+        name for name, _ in timezone_choices()
+        if all(word in name.lower().replace('_', ' ') for word in words)
+    ]
+    return {
+        'results': [{'id': name, 'text': name} for name in names[:limit]],
+        'more': len(names) > limit,
+    }
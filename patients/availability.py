@@ -0,0 +1,309 @@
+"""
+Slot availability for doctors.
+
+A doctor's day is divided into ``slot_minutes`` long slots between
+``work_start`` and ``work_end``. Availability for a set of doctors over a
+date range is computed from a single query for the booked (non-cancelled)
+appointments in that range. Each doctor-day is kept as an integer bitmask
+where bit ``i`` is set when slot ``i`` is free, which keeps the merge cheap
+and the JSON payload small.
+
+Doctor-day masks are cached in the cache named by
+``settings.AVAILABILITY_CACHE_ALIAS``. Entries are dropped by the signal
+handlers in ``patients.signals`` whenever an appointment on that day changes,
+and every entry of a doctor is retired at once by bumping the doctor's
+generation when the doctor (availability, working hours) changes.
+"""
+import heapq
+import threading
+import time as clock
+from datetime import time, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .directory import get_directory
+from .models import Appointment
+from .routers import pin_primary
+from .timezones import get_zone, local_to_utc
+
+DEFAULT_DAYS = 14
+MAX_DAYS = 31
+MAX_DOCTORS = 50
+DEFAULT_EARLIEST = 5
+MAX_EARLIEST = 50
+# earliest_slots() reads bookings for this many days first, then for
+# windows twice as long as the last until it has enough slots
+EARLIEST_FIRST_DAYS = 1
+DOCTOR_SCHEDULE_FIELDS = ('id', 'is_available', 'work_start', 'work_end', 'slot_minutes')
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def slot_times(doctor):
+    """Start times of every slot in the doctor's working day"""
+    start, end, step = _minutes(doctor.work_start), _minutes(doctor.work_end), doctor.slot_minutes
+    return [time(m // 60, m % 60) for m in range(start, end - step + 1, step)]
+
+
+def slot_index(doctor, value, slot_count):
+    """Index of the slot ``value`` falls into, or None outside working hours"""
+    offset = _minutes(value) - _minutes(doctor.work_start)
+    index = offset // doctor.slot_minutes
+    if offset < 0 or index >= slot_count:
+        return None
+    return index
+
+
+def date_range(start_date, days):
+    return [start_date + timedelta(days=i) for i in range(days)]
+
+
+def get_doctors(doctor_ids):
+    return get_directory().in_bulk(doctor_ids)
+
+
+def get_specialists(specialization):
+    """Available doctors of ``specialization`` with their schedules and names"""
+    return get_directory().specialists(specialization)
+
+
+def booked_times(doctor_ids, dates):
+    """Map (doctor_id, date) to the booked appointment times, in one query"""
+    booked = {}
+    if not doctor_ids or not dates:
+        return booked
+    rows = Appointment.objects.filter(
+        doctor_id__in=doctor_ids,
+        appointment_date__range=(min(dates), max(dates)),
+    ).exclude(status='CANCELLED').order_by().values_list('doctor_id', 'appointment_date', 'appointment_time')
+    for doctor_id, appointment_date, appointment_time in rows:
+        booked.setdefault((doctor_id, appointment_date), []).append(appointment_time)
+    return booked
+
+
+def free_mask(doctor, booked, slots=None):
+    """Bitmask of free slots for one doctor-day given its booked times"""
+    slots = slots if slots is not None else slot_times(doctor)
+    if not doctor.is_available:
+        return 0
+    mask = (1 << len(slots)) - 1
+    for value in booked:
+        index = slot_index(doctor, value, len(slots))
+        if index is not None:
+            mask &= ~(1 << index)
+    return mask
+
+
+def hide_past_slots(doctor, day, mask, now, zone_name='UTC', slots=None):
+    """
+    Clear slots that have already started at the aware datetime ``now``,
+    as booked in ``zone_name``; Appointment.clean rejects them as past
+    """
+    today = now.astimezone(get_zone(zone_name)).date()
+    if day > today:
+        return mask
+    if day < today:
+        return 0
+    slots = slots if slots is not None else slot_times(doctor)
+    # Slots are in time order, so the started ones are the lowest bits;
+    # compared as UTC instants like Appointment.clean
+    started = 0
+    while started < len(slots) and local_to_utc(day, slots[started], zone_name) < now:
+        started += 1
+    return mask & ~((1 << started) - 1)
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def as_dict(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else None,
+            }
+
+
+cache_stats = CacheStats()
+
+
+def get_cache():
+    return caches[getattr(settings, 'AVAILABILITY_CACHE_ALIAS', 'default')]
+
+
+def _generation_key(doctor_id):
+    return f'slots-gen:{doctor_id}'
+
+
+def _day_key(doctor_id, generation, day):
+    return f'slots:{doctor_id}:{generation}:{day.isoformat()}'
+
+
+def _generations(cache, doctor_ids):
+    keys = {_generation_key(doctor_id): doctor_id for doctor_id in doctor_ids}
+    found = cache.get_many(keys)
+    generations = {keys[key]: value for key, value in found.items()}
+    for key, doctor_id in keys.items():
+        if doctor_id not in generations:
+            # A fresh, never used generation so entries written under an
+            # evicted generation can't come back to life
+            cache.add(key, clock.time_ns(), timeout=None)
+            generations[doctor_id] = cache.get(key)
+    return generations
+
+
+def invalidate_day(doctor_id, day):
+    cache = get_cache()
+    generation = cache.get(_generation_key(doctor_id))
+    if generation is not None:
+        cache.delete(_day_key(doctor_id, generation, day))
+
+
+def invalidate_doctor(doctor_id):
+    get_cache().set(_generation_key(doctor_id), clock.time_ns(), timeout=None)
+
+
+def cached_free_masks(doctors, dates):
+    """
+    Return {doctor_id: {date: free_mask}} reading through the cache.
+
+    Missing doctor-days are computed together from one appointment query and
+    written back; cached masks don't include the past-slot cut-off, which is
+    applied on every read.
+    """
+    cache = get_cache()
+    generations = _generations(cache, [doctor.pk for doctor in doctors])
+    keys = {
+        _day_key(doctor.pk, generations[doctor.pk], day): (doctor, day)
+        for doctor in doctors for day in dates
+    }
+    found = cache.get_many(keys)
+    masks = {doctor.pk: {} for doctor in doctors}
+    for key, mask in found.items():
+        doctor, day = keys[key]
+        masks[doctor.pk][day] = mask
+    missing = [key for key in keys if key not in found]
+    cache_stats.record(len(found), len(missing))
+    if missing:
+        missing_doctors = {keys[key][0].pk for key in missing}
+        missing_dates = [keys[key][1] for key in missing]
+        # Cached masks outlive replication lag, so they are built from the
+        # primary: a replica that hasn't seen a booking yet would otherwise
+        # keep its slot free until the entry expires
+        with pin_primary():
+            booked = booked_times(missing_doctors, missing_dates)
+        computed = {}
+        for key in missing:
+            doctor, day = keys[key]
+            computed[key] = masks[doctor.pk][day] = free_mask(doctor, booked.get((doctor.pk, day), ()))
+        cache.set_many(computed)
+    return masks
+
+
+def compute_availability(doctors, dates, booked=None, zone_name='UTC'):
+    """Return {doctor_id: {date: free_mask}} for every doctor and date, for bookings in ``zone_name``"""
+    if booked is None:
+        masks = cached_free_masks(doctors, dates)
+    else:
+        masks = {
+            doctor.pk: {day: free_mask(doctor, booked.get((doctor.pk, day), ())) for day in dates}
+            for doctor in doctors
+        }
+    now = timezone.now()
+    return {
+        doctor.pk: {day: hide_past_slots(doctor, day, masks[doctor.pk][day], now, zone_name) for day in dates}
+        for doctor in doctors
+    }
+
+
+def free_slots(doctor, dates, booked, now, zone_name='UTC'):
+    """
+    Yield ``(date, time, doctor_id)`` for each bookable slot, earliest
+    first. A day's mask is only built once the caller has consumed the
+    previous day.
+    """
+    slots = slot_times(doctor)
+    for day in dates:
+        mask = free_mask(doctor, booked.get((doctor.pk, day), ()), slots)
+        mask = hide_past_slots(doctor, day, mask, now, zone_name, slots)
+        while mask:
+            # Lowest set bit is the earliest free slot left
+            yield day, slots[(mask & -mask).bit_length() - 1], doctor.pk
+            mask &= mask - 1
+
+
+def _doubling_windows(dates, first):
+    start, size = 0, first
+    while start < len(dates):
+        yield dates[start:start + size]
+        start, size = start + size, size * 2
+
+
+def earliest_slots(doctors, dates, count=DEFAULT_EARLIEST, booked=None, zone_name='UTC'):
+    """
+    The ``count`` earliest free slots across ``doctors`` over ``dates``, as
+    ``[(date, time, doctor)]``, for bookings in ``zone_name``.
+
+    Booked times are read in one query per window of days: the first
+    ``EARLIEST_FIRST_DAYS`` days, then windows twice as long as the last,
+    stopping once ``count`` slots are found, so a typical search is one
+    query over a day's bookings and a full 31 day window at most five
+    (``booked``, if given, replaces the queries). The availability cache is
+    not used: reading one entry per doctor-day costs more than the query.
+    Within a window the per-doctor slot streams are merged lazily, so masks
+    are only built for the days the merge reaches.
+    """
+    if not doctors or count < 1:
+        return []
+    doctor_ids = [doctor.pk for doctor in doctors]
+    by_id = {doctor.pk: doctor for doctor in doctors}
+    now = timezone.now()
+    windows = [dates] if booked is not None else _doubling_windows(dates, EARLIEST_FIRST_DAYS)
+    found = []
+    for window in windows:
+        window_booked = booked if booked is not None else booked_times(doctor_ids, window)
+        merged = heapq.merge(*(free_slots(doctor, window, window_booked, now, zone_name) for doctor in doctors))
+        found.extend(islice(merged, count - len(found)))
+        if len(found) == count:
+            break
+    return [(day, value, by_id[doctor_id]) for day, value, doctor_id in found]
+
+
+def mask_to_string(mask, size):
+    """Render a mask as "1101..." with one character per slot, in slot order"""
+    return ''.join('1' if mask & (1 << i) else '0' for i in range(size))
+
+
+def serialize_availability(doctors, dates, availability):
+    payload = []
+    for doctor in doctors:
+        slots = slot_times(doctor)
+        payload.append({
+            'id': doctor.pk,
+            'slot_minutes': doctor.slot_minutes,
+            'slots': [value.strftime('%H:%M') for value in slots],
+            'free': {
+                day.isoformat(): mask_to_string(mask, len(slots))
+                for day, mask in availability[doctor.pk].items()
+            },
+        })
+    return {'start': dates[0].isoformat(), 'days': len(dates), 'doctors': payload}
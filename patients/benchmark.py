@@ -0,0 +1,200 @@
+"""
+Latency and query-count benchmarks for every route in ``patients/urls.py``.
+
+Each route is requested through the Django test client with sample
+arguments taken from the current database (run ``seed_data`` first); the
+response, including streamed bodies, is consumed in full before the clock
+stops. Results are plain dicts so they can be written as JSON and compared
+with a previous run.
+"""
+import time
+from contextlib import ExitStack
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.urls import URLPattern, resolve, reverse
+
+from .budgets import counts_against_budget, get_budget
+from .models import Patient, Doctor, Appointment
+
+BENCHMARK_USERNAME = 'benchmark'
+# Routes that end the session; the client logs back in after them
+LOGOUT_ROUTES = {'logout'}
+# Extra query strings, keyed by URL name; each entry adds a case
+ROUTE_QUERIES = {
+    'patient_list': [{}, {'q': 'smith'}, {'q': 'j'}],
+    'patient_search': [{'q': 'smith'}, {'q': 'j'}],
+    'doctor_list': [{}, {'q': 'card'}],
+    'appointment_list': [{}, {'status': 'SCHEDULED'}],
+    'patient_export': [{'q': 'smith'}],
+    'appointment_export': [{'status': 'SCHEDULED'}],
+    'doctor_availability': [lambda samples: {'doctor': samples['doctor_id'], 'days': 7}],
+    'patient_phone_lookup': [lambda samples: {'phone': samples['phone']}],
+    'earliest_available_slots': [{'specialization': 'CARD'}],
+    'patient_autocomplete': [{'q': 'smi'}, {'q': 'john smi'}],
+    'doctor_autocomplete': [{}, {'q': 'jo'}],
+    'timezone_autocomplete': [{'q': 'new york'}],
+    # GET only previews the change
+    'appointment_bulk_status': [lambda samples: {'date': samples['date'].isoformat(), 'status': 'COMPLETED'}],
+}
+# URL names of the async variants of sync routes; they take the same queries
+ASYNC_ROUTES = {
+    'patient_list': 'patient_list_async',
+    'patient_phone_lookup': 'patient_phone_lookup_async',
+    'doctor_list': 'doctor_list_async',
+    'appointment_list': 'appointment_list_async',
+    'available_time_slots': 'available_time_slots_async',
+    'doctor_availability': 'doctor_availability_async',
+}
+SYNC_ROUTES = {async_name: name for name, async_name in ASYNC_ROUTES.items()}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def get_samples():
+    """Ids to fill in route arguments, preferring rows that exercise the most code"""
+    appointment = (
+        Appointment.objects.filter(appointment_date__gte=date.today()).exclude(status='CANCELLED')
+        .order_by('appointment_date').values('pk', 'doctor_id').first()
+        or Appointment.objects.values('pk', 'doctor_id').first()
+    )
+    doctor_id = appointment['doctor_id'] if appointment else Doctor.objects.values_list('pk', flat=True).first()
+    patient = Patient.objects.values('pk', 'phone_number').first() or {'pk': None, 'phone_number': '5550100'}
+    return {
+        'patient_id': patient['pk'],
+        'phone': patient['phone_number'],
+        'doctor_id': doctor_id,
+        'appointment_id': appointment['pk'] if appointment else None,
+        'date': date.today() + timedelta(days=1),
+    }
+
+
+def _kwargs(name, params, samples):
+    kwargs = {}
+    for param in params:
+        if param == 'pk':
+            key = name.split('_')[0] + '_id'
+            value = samples.get(key)
+        elif param == 'doctor_id':
+            value = samples['doctor_id']
+        elif param == 'date_str':
+            value = samples['date'].isoformat()
+        else:
+            value = None
+        if value is None:
+            return None
+        kwargs[param] = value
+    return kwargs
+
+
+def route_cases(samples, urlpatterns=None):
+    """
+    Return ``[(label, url_name, url)]`` for every named route, skipping
+    routes whose arguments have no sample row (e.g. an empty table).
+    """
+    if urlpatterns is None:
+        from .urls import urlpatterns
+    cases = []
+    for pattern in urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name:
+            continue
+        kwargs = _kwargs(pattern.name, pattern.pattern.converters, samples)
+        if kwargs is None:
+            continue
+        url = reverse(pattern.name, kwargs=kwargs)
+        queries = ROUTE_QUERIES.get(SYNC_ROUTES.get(pattern.name, pattern.name), [{}])
+        for query in queries:
+            if callable(query):
+                query = query(samples)
+            label = pattern.name + (f'?{urlencode(query)}' if query else '')
+            cases.append((label, pattern.name, url + (f'?{urlencode(query)}' if query else '')))
+    return cases
+
+
+def get_benchmark_user():
+    user, created = User.objects.get_or_create(
+        username=BENCHMARK_USERNAME, defaults={'is_staff': True},
+    )
+    if created:
+        user.set_unusable_password()
+        user.save(update_fields=['password'])
+    return user
+
+
+def fetch(client, url):
+    """
+    GET ``url`` and read the whole body; returns (response, seconds,
+    queries), counting the queries that count against query budgets
+    """
+    queries = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        if counts_against_budget():
+            queries += 1
+        return execute(sql, params, many, context)
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(count))
+        started = time.perf_counter()
+        response = client.get(url)
+        if response.streaming:
+            for chunk in response.streaming_content:
+                pass
+        elapsed = time.perf_counter() - started
+    return response, elapsed, queries
+
+
+def run(client, user, cases, iterations=20, warmup=1):
+    """Benchmark ``cases`` and return ``{label: stats}``"""
+    client.force_login(user)
+    results = {}
+    for label, name, url in cases:
+        timings, queries = [], []
+        for i in range(warmup + iterations):
+            response, elapsed, count = fetch(client, url)
+            if name in LOGOUT_ROUTES:
+                client.force_login(user)
+            if i >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(count)
+        results[label] = {
+            'url': url,
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'queries': max(queries),
+            'budget': get_budget(resolve(urlsplit(url).path).func),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance=1.25, min_ms=1.0):
+    """
+    Return ``[(label, message)]`` for routes whose p95 grew by more than
+    ``tolerance`` times (and at least ``min_ms``), that run more queries
+    than in ``baseline`` or that are over their query budget.
+    """
+    regressions = []
+    for label, current in sorted(results.items()):
+        budget = current.get('budget')
+        if budget is not None and current['queries'] > budget:
+            regressions.append((label, f'{current["queries"]} queries, budget {budget}'))
+        previous = baseline.get(label)
+        if previous is None:
+            continue
+        if current['queries'] > previous['queries']:
+            regressions.append((label, f'queries {previous["queries"]} -> {current["queries"]}'))
+        if (current['p95_ms'] > previous['p95_ms'] * tolerance
+                and current['p95_ms'] - previous['p95_ms'] >= min_ms):
+            regressions.append((label, f'p95 {previous["p95_ms"]:.1f}ms -> {current["p95_ms"]:.1f}ms'))
+    return regressions
@@ -0,0 +1,48 @@
+"""
+Writing appointments.
+
+Slot conflicts are not checked up front: the conditional unique constraint
+``unique_active_appointment_slot`` rejects a second active appointment for
+the same doctor, date and time, so a booking is a single INSERT (or UPDATE)
+and two concurrent requests for the same slot can't both succeed.
+"""
+from django.db import IntegrityError, router, transaction
+
+from .models import Appointment
+
+SLOT_TAKEN_MESSAGE = 'This time slot is already booked for the selected doctor.'
+
+
+class SlotTaken(Exception):
+    pass
+
+
+def slot_is_taken(appointment, using=None):
+    # The write alias, never a replica: a lagging copy could miss the
+    # conflicting appointment
+    using = using or router.db_for_write(Appointment)
+    return Appointment.objects.using(using).filter(
+        doctor_id=appointment.doctor_id,
+        appointment_date=appointment.appointment_date,
+        appointment_time=appointment.appointment_time,
+    ).exclude(status='CANCELLED').exclude(pk=appointment.pk).exists()
+
+
+def save_appointment(appointment, using=None, **kwargs):
+    """
+    Save an already validated appointment, raising SlotTaken on a conflict.
+
+    Model validation is skipped (the form has run it); only the database
+    constraint is relied on for the slot check.
+    """
+    using = using or router.db_for_write(Appointment, instance=appointment)
+    try:
+        with transaction.atomic(using=using):
+            appointment.save(validate=False, using=using, **kwargs)
+    except IntegrityError:
+        # Only pay for the lookup on the failure path to tell a slot conflict
+        # apart from other integrity errors
+        if slot_is_taken(appointment, using=using):
+            raise SlotTaken(SLOT_TAKEN_MESSAGE)
+        raise
+    return appointment
@@ -0,0 +1,62 @@
+"""
+Per-view SQL query budgets.
+
+A view declares the most queries one request may run, session and user
+lookups included, with ``@query_budget(n)`` placed above its other
+decorators. The budget has to hold whatever the number of rows shown; the
+test suite checks that against two data sizes and ``PerformanceMiddleware``
+logs requests that go over it in production. Queries run while a streaming
+response is being consumed happen after the middleware has returned and are
+not counted at runtime.
+
+Queries run inside ``outside_budget()`` are still timed but don't count
+against the budget. They are upkeep of per-process state, such as the
+doctor directory's version check and reload. Whichever request happens to
+need the state first pays for them, once per interval or change, on behalf
+of every request of the process.
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger('patients.performance')
+
+_outside = ContextVar('outside_query_budget', default=False)
+
+# view function -> budget, for reports and the test harness
+QUERY_BUDGETS = {}
+
+
+def query_budget(limit):
+    def decorator(view):
+        view.query_budget = limit
+        QUERY_BUDGETS[view] = limit
+        return view
+    return decorator
+
+
+@contextmanager
+def outside_budget():
+    token = _outside.set(True)
+    try:
+        yield
+    finally:
+        _outside.reset(token)
+
+
+def counts_against_budget():
+    """Whether a query run now counts against the view's budget"""
+    return not _outside.get()
+
+
+def get_budget(view):
+    return getattr(view, 'query_budget', None)
+
+
+def check_budget(route, view, queries):
+    """Log and return True when ``queries`` is over ``view``'s budget"""
+    budget = get_budget(view)
+    if budget is None or queries <= budget:
+        return False
+    logger.warning('Query budget exceeded by %s: %d queries, budget %d', route, queries, budget)
+    return True
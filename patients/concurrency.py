@@ -0,0 +1,24 @@
+"""
+Helpers for the async views.
+
+Django 4.2's ``login_required`` only wraps sync views;
+``async_login_required`` is its async counterpart.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+
+
+def _is_authenticated(request):
+    # Loads the session and the user, which the sync thread has to do
+    return request.user.is_authenticated
+
+
+def async_login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(_is_authenticated)(request):
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,206 @@
+"""
+Conditional GET and the per-user page cache for list and detail pages.
+
+``@conditional_page(validator)`` asks ``validator`` for the state a page is
+rendered from, computed in one query from the ``updated_at`` columns (see
+``list_state()`` and ``patient_state()``), and turns it into an ETag along
+with the user and the full path. A request whose ``If-None-Match`` matches
+gets a 304 without the view running or a template being rendered.
+
+Deletions don't move ``MAX(updated_at)``, so list states include the row
+count; bulk ``UPDATE``s (``transitions``) set ``updated_at`` themselves.
+The ``Last-Modified`` header is informative only: ``If-Modified-Since``
+can't see a deletion, so only the ETag is checked.
+
+With ``RESPONSE_CACHE_ALIAS`` set, rendered pages are also kept in that
+cache per user and path, together with the ETag they were rendered for,
+and served without rendering while it still matches. Saving or deleting a
+patient, doctor or appointment bumps the cache generation (see
+``patients.signals``), which drops every stored page at once; the ETag
+check covers writes that send no signals or happen in another process.
+"""
+import hashlib
+import time as clock
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Value
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .models import Appointment, ArchivedAppointment, Doctor, Patient
+
+_GENERATION_KEY = 'pages-gen'
+
+
+def _aggregate(queryset, expression):
+    # A constant to group by keeps the aggregate over the whole queryset
+    # without a GROUP BY clause, so it can be used as a scalar subquery
+    return Subquery(
+        queryset.order_by().annotate(_all=Value(1, output_field=IntegerField()))
+        .values('_all').annotate(value=expression).values('value')
+    )
+
+
+def list_state(queryset, *related):
+    """
+    ``MAX(updated_at)`` and ``COUNT(*)`` of ``queryset`` plus ``MAX(updated_at)``
+    of each ``related`` model (whose names the page shows), in one query.
+    Each is its own scalar subquery so SQLite answers the MAX from the
+    ``updated_at`` index instead of scanning the table.
+    """
+    annotations = {
+        'latest': _aggregate(queryset, Max('updated_at')),
+        'count': _aggregate(queryset, Count('*')),
+    }
+    for model in related:
+        annotations[f'{model._meta.model_name}_latest'] = _aggregate(model.objects.all(), Max('updated_at'))
+    # The outer query only carries the subqueries; its table is empty only
+    # when queryset is
+    rows = list(queryset.model.objects.using(queryset.db).order_by().annotate(**annotations).values_list(
+        *annotations
+    )[:1])
+    return rows[0] if rows else (None, 0) + (None,) * len(related)
+
+
+def patient_state(pk):
+    """The patient's ``updated_at`` and the state of its appointment history, or None"""
+    appointments = Appointment.objects.filter(patient=OuterRef('pk'))
+    archived = ArchivedAppointment.objects.filter(patient=OuterRef('pk'))
+    return Patient.objects.filter(pk=pk).annotate(
+        appointments_latest=_aggregate(appointments, Max('updated_at')),
+        appointments_count=_aggregate(appointments, Count('*')),
+        archived_latest=_aggregate(archived, Max('updated_at')),
+        archived_count=_aggregate(archived, Count('*')),
+        doctors_latest=_aggregate(Doctor.objects.all(), Max('updated_at')),
+    ).values_list(
+        'updated_at', 'appointments_latest', 'appointments_count', 'archived_latest', 'archived_count',
+        'doctors_latest',
+    ).first()
+
+
+def get_cache():
+    alias = getattr(settings, 'RESPONSE_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def _generation(cache):
+    generation = cache.get(_GENERATION_KEY)
+    if generation is None:
+        cache.add(_GENERATION_KEY, clock.time_ns(), timeout=None)
+        generation = cache.get(_GENERATION_KEY)
+    return generation
+
+
+def invalidate_pages():
+    cache = get_cache()
+    if cache is not None:
+        cache.set(_GENERATION_KEY, clock.time_ns(), timeout=None)
+
+
+def _digest(value):
+    return hashlib.md5(value.encode(), usedforsecurity=False).hexdigest()
+
+
+def _has_messages(request):
+    # A page showing messages is neither answered with 304 nor cached; len()
+    # doesn't mark them used, so they are still shown when it's rendered
+    return len(messages.get_messages(request)) > 0
+
+
+def _state(validator, request, args, kwargs):
+    if request.method not in ('GET', 'HEAD') or _has_messages(request):
+        return None
+    return validator(request, *args, **kwargs)
+
+
+def _etag(request, state):
+    return quote_etag(_digest(repr((request.user.pk, request.get_full_path(), tuple(state)))))
+
+
+def _finish(response, etag, state):
+    response['ETag'] = etag
+    modified = [value for value in state if hasattr(value, 'timestamp')]
+    if modified:
+        response['Last-Modified'] = http_date(max(modified).timestamp())
+    # The browser may keep the page but has to ask before reusing it
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def conditional_page(validator):
+    """
+    Answer GETs of the decorated view with 304 while ``validator(request,
+    *args, **kwargs)`` returns the same state; None means "no validator"
+    (e.g. a 404) and the view runs as usual. Goes below ``login_required``
+    and works on sync and async views alike.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                state = await sync_to_async(_state)(validator, request, args, kwargs)
+                if state is None:
+                    return await view(request, *args, **kwargs)
+                etag = _etag(request, state)
+                response = get_conditional_response(request, etag=etag)
+                if response is None:
+                    response = await _acached_response(request, etag, view, args, kwargs)
+                return _finish(response, etag, state)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state = _state(validator, request, args, kwargs)
+            if state is None:
+                return view(request, *args, **kwargs)
+            etag = _etag(request, state)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = _cached_response(request, etag, view, args, kwargs)
+            return _finish(response, etag, state)
+        return wrapper
+    return decorator
+
+
+def _page_key(cache, request):
+    return f'page:{_generation(cache)}:{request.user.pk}:{_digest(request.get_full_path())}'
+
+
+def _cacheable(response):
+    return response.status_code == 200 and not response.streaming
+
+
+def _cached_response(request, etag, view, args, kwargs):
+    cache = get_cache()
+    if cache is None:
+        return view(request, *args, **kwargs)
+    key = _page_key(cache, request)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == etag:
+        return HttpResponse(cached[2], content_type=cached[1])
+    response = view(request, *args, **kwargs)
+    if _cacheable(response):
+        timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+        cache.set(key, (etag, response['Content-Type'], response.content), timeout)
+    return response
+
+
+async def _acached_response(request, etag, view, args, kwargs):
+    cache = get_cache()
+    if cache is None:
+        return await view(request, *args, **kwargs)
+    key = await sync_to_async(_page_key)(cache, request)
+    cached = await cache.aget(key)
+    if cached is not None and cached[0] == etag:
+        return HttpResponse(cached[2], content_type=cached[1])
+    response = await view(request, *args, **kwargs)
+    if _cacheable(response):
+        timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+        await cache.aset(key, (etag, response['Content-Type'], response.content), timeout)
+    return response
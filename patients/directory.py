@@ -0,0 +1,299 @@
+"""
+In-process directory of doctors.
+
+``Doctor`` is a small, read-mostly table that almost every page reads: the
+booking forms, the doctor pages, availability lookups and the doctor names
+of appointment rows. ``get_directory()`` keeps the whole table in memory,
+once per process, as light ``DirectoryDoctor`` records indexed by id,
+specialization and availability, so those reads cost no queries.
+
+Every process stamps its copy with a version kept in the database
+(``DataVersion``). Saving or deleting a doctor bumps it when the transaction
+commits (see ``patients.signals``); every process, gunicorn workers
+included, compares versions at most every ``CHECK_INTERVAL`` seconds and
+reloads when it moved. Those checks and reloads are left out of the
+requests' query budgets (see ``budgets.outside_budget``). Code that changes doctors without signals (a raw
+``UPDATE`` or ``bulk_create``) calls ``invalidate()`` itself; ``MAX_AGE``
+bounds how long a change that doesn't goes unseen. A doctor missing from a
+copy, e.g. one added in the last second, is read from the database.
+"""
+import re
+import sys
+import threading
+import time as clock
+import unicodedata
+from bisect import bisect_left
+
+from django.db import router
+from django.db.models import F
+
+from .budgets import outside_budget
+from .models import DataVersion, Doctor
+from .routers import pin_primary
+from .search import MAX_TOKENS
+
+FIELDS = (
+    'id', 'first_name', 'last_name', 'specialization', 'email', 'phone_number',
+    'is_available', 'work_start', 'work_end', 'slot_minutes',
+)
+# The columns the doctor search index covers (search.doctor_index)
+SEARCH_FIELDS = ('first_name', 'last_name', 'specialization', 'email')
+CHECK_INTERVAL = 1.0
+MAX_AGE = 300
+
+VERSION_NAME = 'doctor-directory'
+_SPECIALIZATIONS = dict(Doctor.SPECIALIZATION_CHOICES)
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def _words(text):
+    # Split and fold like the FTS5 unicode61 tokenizer: case and diacritics
+    # are ignored, anything but letters and digits separates words
+    text = text.lower()
+    if not text.isascii():
+        text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    return _WORD_RE.findall(text)
+
+
+class DirectoryDoctor:
+    """The ``Doctor`` fields the pages read, with its display methods; read-only"""
+    __slots__ = FIELDS
+
+    def __init__(self, id, first_name, last_name, specialization, email, phone_number,
+                 is_available, work_start, work_end, slot_minutes):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.specialization = specialization
+        self.email = email
+        self.phone_number = phone_number
+        self.is_available = is_available
+        self.work_start = work_start
+        self.work_end = work_end
+        self.slot_minutes = slot_minutes
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return f'Dr. {self.first_name} {self.last_name} - {self.get_specialization_display()}'
+
+    def get_full_name(self):
+        return f'Dr. {self.first_name} {self.last_name}'
+
+    def get_specialization_display(self):
+        return _SPECIALIZATIONS.get(self.specialization, self.specialization)
+
+    def as_model(self):
+        """A ``Doctor`` instance to assign to a foreign key; other fields load on access"""
+        return Doctor.from_db(router.db_for_read(Doctor), FIELDS, [getattr(self, name) for name in FIELDS])
+
+
+class DoctorDirectory:
+    def __init__(self, doctors, version):
+        self.version = version
+        self.loaded_at = self.checked_at = clock.monotonic()
+        # In the model's ordering: last name, first name, id
+        self.doctors = doctors
+        self.by_id = {doctor.id: doctor for doctor in doctors}
+        self.position = {doctor.id: index for index, doctor in enumerate(doctors)}
+        self.available = [doctor for doctor in doctors if doctor.is_available]
+        self.by_specialization = {}
+        for doctor in self.available:
+            self.by_specialization.setdefault(doctor.specialization, []).append(doctor)
+        self._word_index = None
+        self._footprint = None
+
+    def __len__(self):
+        return len(self.doctors)
+
+    def get(self, pk):
+        """The doctor with id ``pk``, read from the database if it's newer than the directory; or None"""
+        doctor = self.by_id.get(pk)
+        if doctor is None:
+            doctor = _fetch({pk}).get(pk)
+        return doctor
+
+    def in_bulk(self, ids):
+        """
+        The doctors with these ids, in directory order, then the ones read from
+        the database; unknown ids are skipped.
+        """
+        found = {pk for pk in ids if pk in self.by_id}
+        doctors = [self.by_id[pk] for pk in sorted(found, key=self.position.__getitem__)]
+        missing = _fetch(set(ids) - found)
+        return doctors + [missing[pk] for pk in sorted(missing)]
+
+    def specialists(self, specialization):
+        """Available doctors of ``specialization``"""
+        return self.by_specialization.get(specialization, [])
+
+    def _words_index(self):
+        # Positions of the doctors having each word, plus the words sorted
+        # for prefix lookups; built on the first search
+        if self._word_index is None:
+            positions = {}
+            for index, doctor in enumerate(self.doctors):
+                for word in {word for name in SEARCH_FIELDS for word in _words(getattr(doctor, name))}:
+                    positions.setdefault(word, []).append(index)
+            self._word_index = sorted(positions), positions
+        return self._word_index
+
+    def search(self, query, doctors=None):
+        """
+        The doctors among ``doctors`` (default: all) that match ``query`` like
+        ``search.filter_doctors`` does, where every word has to start a word
+        of the name, specialization or email, in directory order.
+        """
+        doctors = self.doctors if doctors is None else doctors
+        tokens = _words(query or '')[:MAX_TOKENS]
+        if not tokens:
+            return list(doctors)
+        words, positions = self._words_index()
+        matches = None
+        for token in tokens:
+            start = bisect_left(words, token)
+            end = bisect_left(words, token[:-1] + chr(ord(token[-1]) + 1), start)
+            found = set().union(*(positions[word] for word in words[start:end]))
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+        return [doctor for doctor in doctors if self.position[doctor.id] in matches]
+
+    def footprint(self):
+        """Approximate bytes held by the records, their values and the indexes"""
+        searched = self._word_index is not None
+        if self._footprint is None or self._footprint[0] != searched:
+            seen = set()
+
+            def size(obj):
+                if id(obj) in seen:
+                    return 0
+                seen.add(id(obj))
+                return sys.getsizeof(obj)
+
+            total = sum(size(container) for container in (
+                self.doctors, self.by_id, self.position, self.available, *self.by_specialization.values(),
+            ))
+            for doctor in self.doctors:
+                total += size(doctor) + sum(size(getattr(doctor, name)) for name in FIELDS)
+            if searched:
+                words, positions = self._word_index
+                total += size(words) + size(positions)
+                total += sum(size(word) + size(indexes) for word, indexes in positions.items())
+            self._footprint = searched, total
+        return self._footprint[1]
+
+
+_directory = None
+_lock = threading.Lock()
+loads = 0
+
+
+def _current_version():
+    # From the primary: a replica may not have seen the latest bump yet
+    with pin_primary():
+        return DataVersion.objects.filter(name=VERSION_NAME).values_list('version', flat=True).first() or 0
+
+
+def _fetch(ids):
+    # Ids past 64 bits (e.g. a tampered form value) match nothing, and
+    # SQLite refuses them as parameters
+    ids = {pk for pk in ids if pk is not None and -2 ** 63 <= pk < 2 ** 63}
+    if not ids:
+        return {}
+    with pin_primary():
+        return {row[0]: DirectoryDoctor(*row) for row in Doctor.objects.filter(pk__in=ids).values_list(*FIELDS)}
+
+
+def _load(version):
+    # Names, specializations and working hours repeat a lot; keeping one
+    # object per distinct value makes a record about a third smaller
+    shared = {}
+    share = shared.setdefault
+    with pin_primary():
+        rows = Doctor.objects.order_by('last_name', 'first_name', 'pk').values_list(*FIELDS)
+        doctors = [
+            DirectoryDoctor(
+                pk, share(first, first), share(last, last), share(code, code), email, phone,
+                available, share(start, start), share(end, end), minutes,
+            )
+            for pk, first, last, code, email, phone, available, start, end, minutes in rows
+        ]
+    return DoctorDirectory(doctors, version)
+
+
+def get_directory():
+    """This process's directory, reloaded when the shared version has moved"""
+    global _directory, loads
+    directory = _directory
+    now = clock.monotonic()
+    if directory is not None and now - directory.checked_at < CHECK_INTERVAL:
+        return directory
+    # Paid by one request per interval or change for the whole process
+    with outside_budget():
+        version = _current_version()
+        if directory is not None and directory.version == version and now - directory.loaded_at < MAX_AGE:
+            directory.checked_at = now
+            return directory
+        with _lock:
+            # Another thread may have reloaded while this one waited
+            current = _directory
+            if current is not None and current is not directory and current.version == version:
+                return current
+            _directory = _load(version)
+            loads += 1
+            return _directory
+
+
+def forget():
+    """Drop this process's copy; the next read reloads it"""
+    global _directory
+    _directory = None
+
+
+def invalidate():
+    """Make every process reload the directory; call it once changes are committed"""
+    if not DataVersion.objects.filter(name=VERSION_NAME).update(version=F('version') + 1):
+        # The first bump creates the row, unless a concurrent one just did
+        version, created = DataVersion.objects.get_or_create(name=VERSION_NAME, defaults={'version': 1})
+        if not created:
+            DataVersion.objects.filter(name=VERSION_NAME).update(version=F('version') + 1)
+    forget()
+
+
+def resolve(ids):
+    """
+    Map each id to its directory record. Doctors added since the directory
+    was loaded (in another process, before this one noticed) are read from
+    the database.
+    """
+    directory = get_directory()
+    doctors = {pk: directory.by_id[pk] for pk in ids if pk in directory.by_id}
+    doctors.update(_fetch(set(ids) - doctors.keys()))
+    return doctors
+
+
+def attach_doctors(rows):
+    """Set ``doctor`` on each of ``rows`` (with ``doctor_id`` loaded) from the directory"""
+    rows = list(rows)
+    doctors = resolve({row.doctor_id for row in rows})
+    for row in rows:
+        if row.doctor_id in doctors:
+            # Bypasses the descriptor's type check: the record stands in for
+            # the Doctor the row would otherwise load
+            type(row).doctor.field.set_cached_value(row, doctors[row.doctor_id])
+    return rows
+
+
+def stats():
+    directory = _directory
+    if directory is None:
+        return {'doctors': 0, 'bytes': 0, 'age_seconds': None, 'loads': loads}
+    return {
+        'doctors': len(directory),
+        'bytes': directory.footprint(),
+        'age_seconds': round(clock.monotonic() - directory.loaded_at, 1),
+        'loads': loads,
+    }
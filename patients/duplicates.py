@@ -0,0 +1,218 @@
+"""
+Duplicate patient detection.
+
+Comparing every patient with every other one is O(n²), so records are only
+compared within blocks that share a blocking key:
+
+- ``name_dob``: Soundex of the last name plus the date of birth, stored in
+  the indexed ``Patient.name_dob_key`` column;
+- ``phone``: the last ``MIN_SUFFIX_DIGITS`` digits of the phone number, read
+  from the indexed ``phone_digits_reversed`` column (see ``phones``);
+- ``email``: the lowercased email, backed by an index on ``LOWER(email)``.
+
+``find_duplicates()`` streams the table once per key in key order (an index
+scan, no sort), so each block is a run of consecutive rows and only one
+block is held in memory. Pairs are scored on name similarity, date of birth,
+phone and email; those scoring at least ``MIN_SCORE`` are candidates.
+
+``possible_duplicates()`` is the incremental check for a single new record:
+one query, an OR of index seeks on the same three keys.
+"""
+import unicodedata
+from collections import namedtuple
+from difflib import SequenceMatcher
+from itertools import combinations, groupby
+
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .phones import MIN_SUFFIX_DIGITS, lookup_condition, normalize_phone
+
+MIN_SCORE = 0.6
+# Blocks bigger than this (a clinic's switchboard number, a shared family
+# email) are skipped: they cost a quadratic number of comparisons and
+# rarely hold real duplicates
+MAX_BLOCK_SIZE = 50
+MAX_CANDIDATES = 5
+WEIGHTS = {'name': 0.45, 'date_of_birth': 0.25, 'phone': 0.15, 'email': 0.15}
+
+FIELDS = (
+    'pk', 'first_name', 'last_name', 'date_of_birth', 'email',
+    'phone_digits', 'phone_digits_reversed', 'name_dob_key',
+)
+Row = namedtuple('Row', FIELDS)
+Candidate = namedtuple('Candidate', 'patient duplicate score matched')
+
+_SOUNDEX_CODES = {
+    letter: digit
+    for letters, digit in (('BFPV', '1'), ('CGJKQSXZ', '2'), ('DT', '3'), ('L', '4'), ('MN', '5'), ('R', '6'))
+    for letter in letters
+}
+
+
+def _letters(value):
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    return ''.join(char for char in decomposed.upper() if 'A' <= char <= 'Z')
+
+
+def soundex(name):
+    """American Soundex code of ``name`` ('Robert' and 'Rupert' are R163)"""
+    letters = _letters(name)
+    if not letters:
+        return ''
+    code = letters[0]
+    previous = _SOUNDEX_CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = _SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # H and W don't separate letters with the same code; vowels do
+        if letter not in 'HW':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def name_dob_key(last_name, date_of_birth):
+    if not date_of_birth:
+        return ''
+    return soundex(last_name) + str(date_of_birth).replace('-', '')
+
+
+def _phone_key(row):
+    if len(row.phone_digits_reversed) < MIN_SUFFIX_DIGITS:
+        return None
+    return row.phone_digits_reversed[:MIN_SUFFIX_DIGITS]
+
+
+def _email_key(row):
+    return row.email.lower() if row.email else None
+
+
+# name: (filter and order the queryset by the key, key of a row)
+BLOCKING_KEYS = {
+    'name_dob': (
+        lambda queryset: queryset.exclude(name_dob_key='').order_by('name_dob_key'),
+        lambda row: row.name_dob_key,
+    ),
+    'phone': (
+        lambda queryset: queryset.exclude(phone_digits_reversed='').order_by('phone_digits_reversed'),
+        _phone_key,
+    ),
+    'email': (
+        lambda queryset: queryset.filter(email__isnull=False).exclude(email='').order_by(Lower('email')),
+        _email_key,
+    ),
+}
+
+
+def _name(first_name, last_name):
+    return _letters(first_name).lower(), _letters(last_name).lower()
+
+
+def name_similarity(a, b):
+    first_a, last_a = _name(a.first_name, a.last_name)
+    first_b, last_b = _name(b.first_name, b.last_name)
+    straight = SequenceMatcher(None, f'{first_a} {last_a}', f'{first_b} {last_b}').ratio()
+    # First and last name entered the wrong way round
+    swapped = SequenceMatcher(None, f'{first_a} {last_a}', f'{last_b} {first_b}').ratio()
+    return max(straight, swapped)
+
+
+def _phones_match(a, b):
+    if min(len(a.phone_digits), len(b.phone_digits)) < MIN_SUFFIX_DIGITS:
+        return a.phone_digits == b.phone_digits and bool(a.phone_digits)
+    return a.phone_digits.endswith(b.phone_digits) or b.phone_digits.endswith(a.phone_digits)
+
+
+def score(a, b):
+    """``(score, matched)`` for two rows; ``matched`` names the fields that agree"""
+    similarity = name_similarity(a, b)
+    total = WEIGHTS['name'] * similarity
+    matched = ['name'] if similarity >= 0.85 else []
+    if a.date_of_birth and str(a.date_of_birth) == str(b.date_of_birth):
+        total += WEIGHTS['date_of_birth']
+        matched.append('date of birth')
+    if _phones_match(a, b):
+        total += WEIGHTS['phone']
+        matched.append('phone')
+    if a.email and b.email and a.email.lower() == b.email.lower():
+        total += WEIGHTS['email']
+        matched.append('email')
+    return round(total, 3), matched
+
+
+def as_row(patient):
+    """A ``Row`` for an unsaved Patient, with its lookup columns computed"""
+    digits = normalize_phone(patient.phone_number)
+    return Row(
+        patient.pk, patient.first_name, patient.last_name, patient.date_of_birth, patient.email,
+        digits, digits[::-1], name_dob_key(patient.last_name, patient.date_of_birth),
+    )
+
+
+def iter_blocks(queryset, key, chunk_size=5000):
+    """Yield ``(key, [rows])`` for runs of rows sharing blocking ``key``"""
+    prepare, key_of = BLOCKING_KEYS[key]
+    rows = map(Row._make, prepare(queryset).values_list(*FIELDS).iterator(chunk_size=chunk_size))
+    for value, block in groupby(rows, key=key_of):
+        if value is not None:
+            yield value, list(block)
+
+
+def find_duplicates(queryset, keys=tuple(BLOCKING_KEYS), min_score=MIN_SCORE, max_block_size=MAX_BLOCK_SIZE,
+                    stats=None):
+    """
+    Candidate duplicate pairs in ``queryset``, best first. ``stats``, if
+    given, is a dict that receives block and comparison counts.
+    """
+    stats = stats if stats is not None else {}
+    stats.update(blocks=0, skipped_blocks=0, comparisons=0)
+    candidates = {}
+    for key in keys:
+        for value, block in iter_blocks(queryset, key):
+            if len(block) < 2:
+                continue
+            if len(block) > max_block_size:
+                stats['skipped_blocks'] += 1
+                continue
+            stats['blocks'] += 1
+            for a, b in combinations(block, 2):
+                pair = (min(a.pk, b.pk), max(a.pk, b.pk))
+                # The same pair shows up in every block it shares
+                if pair in candidates:
+                    continue
+                stats['comparisons'] += 1
+                total, matched = score(a, b)
+                if total >= min_score:
+                    first, second = (a, b) if a.pk < b.pk else (b, a)
+                    candidates[pair] = Candidate(first, second, total, matched)
+    return sorted(candidates.values(), key=lambda candidate: (-candidate.score, candidate.patient.pk))
+
+
+def candidate_condition(row):
+    condition = Q(name_dob_key=row.name_dob_key) if row.name_dob_key else Q(pk__in=[])
+    if len(row.phone_digits) >= MIN_SUFFIX_DIGITS:
+        condition |= lookup_condition(row.phone_digits)
+    if row.email:
+        condition |= Q(email_lower=row.email.lower())
+    return condition
+
+
+def possible_duplicates(queryset, patient, min_score=MIN_SCORE, limit=MAX_CANDIDATES):
+    """
+    Existing rows of ``queryset`` that ``patient`` (saved or not) may
+    duplicate, as ``[(row, score, matched)]`` best first. Runs one query.
+    """
+    row = as_row(patient)
+    queryset = queryset.alias(email_lower=Lower('email')).filter(candidate_condition(row))
+    if patient.pk:
+        queryset = queryset.exclude(pk=patient.pk)
+    # No ORDER BY, so the planner can answer the OR from the three indexes;
+    # the cap bounds the work for a number shared by many records
+    found = [Row._make(values) for values in queryset.order_by().values_list(*FIELDS)[:MAX_BLOCK_SIZE]]
+    scored = [(other, *score(row, other)) for other in found]
+    scored = [match for match in scored if match[1] >= min_score]
+    scored.sort(key=lambda match: -match[1])
+    return scored[:limit]
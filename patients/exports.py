@@ -0,0 +1,119 @@
+"""
+Streaming CSV / NDJSON extracts of patients and appointments.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` and encoded
+as they arrive, so memory stays flat however large the export is and the
+header goes out before the first query result. Appointment rows carry the
+patient and doctor names through a join instead of per-row lookups.
+"""
+import csv
+import json
+from datetime import date, datetime, time
+
+from .models import Patient, Appointment
+
+CHUNK_SIZE = 2000
+# Rows encoded per write, to keep per-chunk overhead of the response low
+ROWS_PER_WRITE = 500
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+PATIENT_COLUMNS = [
+    ('id', 'id'),
+    ('first_name', 'first_name'),
+    ('last_name', 'last_name'),
+    ('date_of_birth', 'date_of_birth'),
+    ('gender', 'gender'),
+    ('email', 'email'),
+    ('phone_number', 'phone_number'),
+    ('address', 'address'),
+    ('medical_history', 'medical_history'),
+    ('current_medications', 'current_medications'),
+    ('allergies', 'allergies'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+APPOINTMENT_COLUMNS = [
+    ('id', 'id'),
+    ('appointment_date', 'appointment_date'),
+    ('appointment_time', 'appointment_time'),
+    ('timezone', 'timezone'),
+    ('status', 'status'),
+    ('patient_id', 'patient_id'),
+    ('patient_first_name', 'patient__first_name'),
+    ('patient_last_name', 'patient__last_name'),
+    ('doctor_id', 'doctor_id'),
+    ('doctor_first_name', 'doctor__first_name'),
+    ('doctor_last_name', 'doctor__last_name'),
+    ('doctor_specialization', 'doctor__specialization'),
+    ('notes', 'notes'),
+    ('created_at', 'created_at'),
+]
+
+
+class Echo:
+    """File-like object whose write() returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def iter_rows(queryset, columns, chunk_size=CHUNK_SIZE):
+    lookups = [lookup for name, lookup in columns]
+    return queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+def csv_chunks(rows, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, lookup in columns])
+    buffer = []
+    for row in rows:
+        buffer.append(writer.writerow(['' if value is None else _plain(value) for value in row]))
+        if len(buffer) >= ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def ndjson_chunks(rows, columns):
+    names = [name for name, lookup in columns]
+    buffer = []
+    for row in rows:
+        buffer.append(json.dumps(dict(zip(names, map(_plain, row)))) + '\n')
+        if len(buffer) >= ROWS_PER_WRITE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_chunks(queryset, columns, fmt):
+    """Lazily encoded export of ``queryset``; nothing is queried until iterated"""
+    rows = iter_rows(queryset, columns)
+    if fmt == 'csv':
+        return csv_chunks(rows, columns)
+    return ndjson_chunks(rows, columns)
+
+
+def patient_export(queryset, fmt):
+    return export_chunks(queryset, PATIENT_COLUMNS, fmt)
+
+
+def appointment_export(queryset, fmt):
+    return export_chunks(queryset, APPOINTMENT_COLUMNS, fmt)
+
+
+EXPORTS = {
+    'patients': (Patient, patient_export),
+    'appointments': (Appointment, appointment_export),
+}
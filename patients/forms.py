@@ -1,8 +1,12 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import Patient, Doctor, Appointment
-import pytz
+from django.utils import timezone
+from zoneinfo import ZoneInfoNotFoundError
+from .autocomplete import AutocompleteSelect, patient_label
+from .directory import get_directory
+from .models import Patient, Doctor, Appointment, AppointmentSeries
+from .timezones import local_to_utc, timezone_choices
 
 
 class PatientForm(forms.ModelForm):
@@ -46,7 +50,10 @@ class UserRegisterForm(UserCreationForm):
 class DoctorForm(forms.ModelForm):
     class Meta:
         model = Doctor
-        fields = ['first_name', 'last_name', 'specialization', 'email', 'phone_number', 'is_available']
+        fields = [
+            'first_name', 'last_name', 'specialization', 'email', 'phone_number', 'is_available',
+            'work_start', 'work_end', 'slot_minutes',
+        ]
         widgets = {
             'first_name': forms.TextInput(attrs={'class': 'form-control'}),
             'last_name': forms.TextInput(attrs={'class': 'form-control'}),
@@ -54,13 +61,35 @@ class DoctorForm(forms.ModelForm):
             'email': forms.EmailInput(attrs={'class': 'form-control'}),
             'phone_number': forms.TextInput(attrs={'class': 'form-control'}),
             'is_available': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'work_start': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
+            'work_end': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
+            'slot_minutes': forms.NumberInput(attrs={'class': 'form-control', 'min': 5, 'max': 240}),
         }
 
 
+class AvailableDoctorField(forms.ModelChoiceField):
+    """Choice of an available doctor, resolved from the doctor directory instead of the database"""
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, Doctor):
+            value = value.pk
+        try:
+            doctor = get_directory().get(int(str(value)))
+        except ValueError:
+            doctor = None
+        if doctor is None or not doctor.is_available:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value},
+            )
+        return doctor.as_model()
+
+
 class AppointmentForm(forms.ModelForm):
     timezone = forms.ChoiceField(
-        choices=[(tz, tz) for tz in pytz.common_timezones],
-        widget=forms.Select(attrs={'class': 'form-control'}),
+        choices=timezone_choices,
+        widget=AutocompleteSelect('timezone_autocomplete', attrs={'class': 'form-control'}),
         initial='UTC'
     )
     
@@ -68,33 +97,73 @@ class AppointmentForm(forms.ModelForm):
         model = Appointment
         fields = ['patient', 'doctor', 'appointment_date', 'appointment_time', 'notes', 'timezone']
         widgets = {
-            'patient': forms.Select(attrs={'class': 'form-control'}),
-            'doctor': forms.Select(attrs={'class': 'form-control'}),
+            'patient': AutocompleteSelect('patient_autocomplete', attrs={'class': 'form-control'}),
+            'doctor': AutocompleteSelect('doctor_autocomplete', attrs={'class': 'form-control'}),
             'appointment_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
             'appointment_time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
             'notes': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
         }
+        field_classes = {'doctor': AvailableDoctorField}
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Filter only available doctors
         self.fields['doctor'].queryset = Doctor.objects.filter(is_available=True)
+        self.fields['patient'].label_from_instance = patient_label
+    
+    def _get_validation_exclusions(self):
+        # The patient and doctor fields already loaded both rows, and slot
+        # conflicts are caught by the database constraint when saving (see
+        # booking.save_appointment), so the model doesn't re-query them
+        exclude = super()._get_validation_exclusions()
+        exclude.update({'patient', 'doctor'})
+        return exclude
+
+
+class AppointmentSeriesForm(forms.ModelForm):
+    timezone = forms.ChoiceField(
+        choices=timezone_choices,
+        widget=AutocompleteSelect('timezone_autocomplete', attrs={'class': 'form-control'}),
+        initial='UTC'
+    )
+    
+    class Meta:
+        model = AppointmentSeries
+        fields = ['patient', 'doctor', 'start_date', 'appointment_time', 'frequency', 'occurrences', 'notes', 'timezone']
+        widgets = {
+            'patient': AutocompleteSelect('patient_autocomplete', attrs={'class': 'form-control'}),
+            'doctor': AutocompleteSelect('doctor_autocomplete', attrs={'class': 'form-control'}),
+            'start_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'appointment_time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
+            'frequency': forms.Select(attrs={'class': 'form-control'}),
+            'occurrences': forms.NumberInput(attrs={'class': 'form-control', 'min': 2, 'max': 52}),
+            'notes': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
+        }
+        labels = {
+            'start_date': 'First session',
+            'occurrences': 'Number of sessions',
+        }
+        field_classes = {'doctor': AvailableDoctorField}
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['doctor'].queryset = Doctor.objects.filter(is_available=True)
+        self.fields['patient'].label_from_instance = patient_label
     
     def clean(self):
         cleaned_data = super().clean()
-        doctor = cleaned_data.get('doctor')
-        appointment_date = cleaned_data.get('appointment_date')
-        appointment_time = cleaned_data.get('appointment_time')
-        
-        if doctor and appointment_date and appointment_time:
-            # Check if the time slot is already booked (excluding current instance if updating)
-            existing_appointment = Appointment.objects.filter(
-                doctor=doctor,
-                appointment_date=appointment_date,
-                appointment_time=appointment_time
-            ).exclude(pk=self.instance.pk).exclude(status='CANCELLED')
-            
-            if existing_appointment.exists():
-                raise forms.ValidationError('This time slot is already booked for the selected doctor.')
-        
+        start_date, at, zone = (cleaned_data.get(name) for name in ('start_date', 'appointment_time', 'timezone'))
+        if start_date and at and zone:
+            try:
+                starts_at = local_to_utc(start_date, at, zone)
+            except (ZoneInfoNotFoundError, ValueError):
+                return cleaned_data  # reported by the timezone field
+            if starts_at < timezone.now():
+                raise forms.ValidationError('The first session cannot be in the past.')
         return cleaned_data
+    
+    def _get_validation_exclusions(self):
+        # As in AppointmentForm: the fields already loaded both rows
+        exclude = super()._get_validation_exclusions()
+        exclude.update({'patient', 'doctor'})
+        return exclude
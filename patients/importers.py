@@ -0,0 +1,288 @@
+"""
+Streaming bulk import of patients, doctors and appointments.
+
+Rows are read lazily from CSV or NDJSON, validated and written in batches:
+each batch costs one existence query per foreign key, one conflict query for
+appointments and a single ``bulk_create`` inside its own transaction, so
+memory use depends on the batch size only, never on the file size. Invalid
+rows are reported with their line number and skipped; they never abort the
+load.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, router, transaction
+
+from . import availability, directory
+from .models import Patient, Doctor, Appointment
+
+DEFAULT_BATCH_SIZE = 1000
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y')
+
+
+class RowError:
+    def __init__(self, line, messages):
+        self.line = line
+        self.messages = messages
+
+    def __str__(self):
+        return f'line {self.line}: ' + '; '.join(self.messages)
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ndjson(stream):
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+            continue
+        if not isinstance(row, dict):
+            yield line_number, ValueError(f'expected an object, got {type(row).__name__}')
+            continue
+        yield line_number, row
+
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+def _error_messages(error):
+    if hasattr(error, 'message_dict'):
+        return [f'{field}: {message}' for field, messages in error.message_dict.items() for message in messages]
+    return list(error.messages)
+
+
+class Importer:
+    model = None
+    fields = ()
+    # Foreign keys given as ids (column "patient" or "patient_id"), checked
+    # in bulk per batch
+    foreign_keys = ()
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, using=None):
+        self.batch_size = batch_size
+        self.using = using or router.db_for_write(self.model)
+        self.imported = 0
+        self.errors = []
+        self._fields = {name: self.model._meta.get_field(name) for name in self.fields}
+        self._exclude = [
+            field.name for field in self.model._meta.concrete_fields
+            if field.is_relation or field.name not in self.fields
+        ]
+
+    def build(self, row):
+        instance = self.model()
+        for name, field in self._fields.items():
+            if name not in row or row[name] is None:
+                continue
+            value = row[name]
+            if isinstance(value, str):
+                value = value.strip()
+                if isinstance(field, models.BooleanField):
+                    value = value.lower() in TRUE_VALUES
+                elif value == '' and field.null:
+                    value = None
+            else:
+                # JSON numbers, lists and objects: date and time fields
+                # raise TypeError for anything but text
+                try:
+                    field.to_python(value)
+                except (TypeError, ValueError):
+                    raise ValidationError({name: [f'Enter a valid value, not a JSON {type(value).__name__}.']})
+            setattr(instance, field.attname, value)
+        for name in self.foreign_keys:
+            attname = self.model._meta.get_field(name).attname
+            value = row.get(name, row.get(attname))
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                value = None
+            # Ids past 64 bits can't be looked up in check_batch
+            if value is None or not -2 ** 63 <= value < 2 ** 63:
+                raise ValidationError({name: ['A valid id is required.']})
+            setattr(instance, attname, value)
+        try:
+            self.validate(instance)
+        except (TypeError, ValueError) as e:
+            raise ValidationError(f'Invalid value: {e}')
+        return instance
+
+    def validate(self, instance):
+        # Everything that doesn't need the database; relations and
+        # uniqueness are checked per batch
+        instance.clean_fields(exclude=self._exclude)
+        instance.clean()
+
+    def check_batch(self, batch):
+        """Return (line, messages) for rows that conflict with the database"""
+        problems = {}
+        for name in self.foreign_keys:
+            field = self.model._meta.get_field(name)
+            related = field.related_model
+            ids = {getattr(instance, field.attname) for line, instance in batch}
+            existing = set(related._default_manager.using(self.using).filter(pk__in=ids).values_list('pk', flat=True))
+            for line, instance in batch:
+                if getattr(instance, field.attname) not in existing:
+                    problems.setdefault(line, []).append(f'{name}: {related.__name__} does not exist.')
+        return problems
+
+    def after_write(self, instances):
+        pass
+
+    def write(self, instances):
+        try:
+            with transaction.atomic(using=self.using):
+                self.model._default_manager.using(self.using).bulk_create(instances)
+            return instances, []
+        except IntegrityError:
+            pass
+        # Something changed under us (e.g. a concurrent booking); fall back to
+        # row by row inserts so only the offending rows are rejected
+        written, failed = [], []
+        for instance in instances:
+            try:
+                with transaction.atomic(using=self.using):
+                    instance.save(force_insert=True, using=self.using, **self.save_kwargs())
+                written.append(instance)
+            except IntegrityError as e:
+                failed.append((instance, str(e)))
+        return written, failed
+
+    def save_kwargs(self):
+        return {}
+
+    def process_batch(self, rows):
+        batch = []
+        for line, row in rows:
+            if isinstance(row, Exception):
+                self.errors.append(RowError(line, [f'Invalid JSON: {row}']))
+                continue
+            try:
+                batch.append((line, self.build(row)))
+            except ValidationError as e:
+                self.errors.append(RowError(line, _error_messages(e)))
+        if not batch:
+            return
+        problems = self.check_batch(batch)
+        accepted = []
+        for line, instance in batch:
+            if line in problems:
+                self.errors.append(RowError(line, problems[line]))
+            else:
+                accepted.append((line, instance))
+        lines = {id(instance): line for line, instance in accepted}
+        written, failed = self.write([instance for line, instance in accepted])
+        for instance, message in failed:
+            self.errors.append(RowError(lines[id(instance)], [message]))
+        self.imported += len(written)
+        self.after_write(written)
+
+    def run(self, rows, on_batch=None):
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                break
+            self.process_batch(chunk)
+            if on_batch:
+                on_batch(self)
+        return self
+
+
+class PhoneImporter(Importer):
+    def validate(self, instance):
+        super().validate(instance)
+        # bulk_create skips save(), which keeps the phone lookup columns in sync
+        instance.set_phone_digits()
+
+
+class PatientImporter(PhoneImporter):
+    model = Patient
+    fields = (
+        'first_name', 'last_name', 'date_of_birth', 'gender', 'email', 'phone_number',
+        'address', 'medical_history', 'current_medications', 'allergies',
+    )
+
+    def validate(self, instance):
+        super().validate(instance)
+        instance.set_name_dob_key()
+
+
+class DoctorImporter(PhoneImporter):
+    model = Doctor
+    fields = (
+        'first_name', 'last_name', 'specialization', 'email', 'phone_number',
+        'is_available', 'work_start', 'work_end', 'slot_minutes',
+    )
+
+    def after_write(self, instances):
+        # bulk_create sends no post_save
+        if instances:
+            transaction.on_commit(directory.invalidate, using=self.using)
+
+
+class AppointmentImporter(Importer):
+    model = Appointment
+    fields = ('appointment_date', 'appointment_time', 'status', 'notes', 'timezone')
+    foreign_keys = ('patient', 'doctor')
+
+    def __init__(self, *args, allow_past=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.allow_past = allow_past
+
+    def validate(self, instance):
+        instance.clean_fields(exclude=self._exclude)
+        if not self.allow_past:
+            instance.clean()
+        # bulk_create skips save(), which keeps starts_at in sync
+        instance.starts_at = instance.get_starts_at()
+
+    def save_kwargs(self):
+        return {'validate': False}
+
+    def check_batch(self, batch):
+        problems = super().check_batch(batch)
+        active = [(line, instance) for line, instance in batch if instance.status != 'CANCELLED']
+        if not active:
+            return problems
+        # Earlier batches are already in the table, so one query against the
+        # database also covers conflicts with previous rows of the file
+        taken = set(Appointment.objects.using(self.using).filter(
+            doctor_id__in={instance.doctor_id for line, instance in active},
+            appointment_date__in={instance.appointment_date for line, instance in active},
+        ).exclude(status='CANCELLED').values_list('doctor_id', 'appointment_date', 'appointment_time'))
+        seen = {}
+        for line, instance in active:
+            key = (instance.doctor_id, instance.appointment_date, instance.appointment_time)
+            if key in taken:
+                problems.setdefault(line, []).append('This time slot is already booked for the selected doctor.')
+            elif key in seen:
+                problems.setdefault(line, []).append(f'Conflicts with line {seen[key]} of the file.')
+            else:
+                seen[key] = line
+        return problems
+
+    def after_write(self, instances):
+        days = {(instance.doctor_id, instance.appointment_date) for instance in instances}
+
+        def invalidate():
+            for doctor_id, day in days:
+                availability.invalidate_day(doctor_id, day)
+        transaction.on_commit(invalidate, using=self.using)
+
+
+IMPORTERS = {
+    'patients': PatientImporter,
+    'doctors': DoctorImporter,
+    'appointments': AppointmentImporter,
+}
@@ -0,0 +1,150 @@
+"""
+Concurrent load benchmark of the WSGI and ASGI request paths.
+
+Requests go through Django's own handlers in-process, with no test client in
+between: the sync views through ``WSGIHandler`` called from ``concurrency``
+threads, as a threaded WSGI server runs them, and their async variants
+(``benchmark.ASYNC_ROUTES``) through ``ASGIHandler`` with ``concurrency``
+requests in flight on one event loop, as an ASGI server worker runs them.
+Both share one process and its GIL, so the numbers compare the two paths,
+not two deployments.
+"""
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+
+from .benchmark import ASYNC_ROUTES, percentile
+
+HOST = 'testserver'
+
+
+def session_cookie(user):
+    client = Client()
+    client.force_login(user)
+    return f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+
+def wsgi_get(app, url, cookie):
+    """GET ``url`` from the WSGI ``app``, reading the whole body; returns the status code"""
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': parts.path, 'QUERY_STRING': parts.query,
+        'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': HOST, 'HTTP_COOKIE': cookie,
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    status = []
+    body = app(environ, lambda value, headers, exc_info=None: status.append(value))
+    try:
+        for chunk in body:
+            pass
+    finally:
+        # Sends request_finished, which closes the thread's connections
+        body.close()
+    return int(status[0].split()[0])
+
+
+async def asgi_get(app, url, cookie):
+    """GET ``url`` from the ASGI ``app``, reading the whole body; returns the status code"""
+    parts = urlsplit(url)
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': parts.path, 'raw_path': parts.path.encode(), 'query_string': parts.query.encode(),
+        'root_path': '', 'headers': [(b'host', HOST.encode()), (b'cookie', cookie.encode())],
+        'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+    }
+    sent_body = asyncio.Event()
+    status = []
+
+    async def receive():
+        if not sent_body.is_set():
+            sent_body.set()
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client stays connected until the handler is done
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+def _stats(latencies, statuses, elapsed):
+    return {
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'errors': sum(1 for status in statuses if status != 200),
+    }
+
+
+def run_wsgi(app, url, cookie, requests, concurrency):
+    def timed(_):
+        started = time.perf_counter()
+        status = wsgi_get(app, url, cookie)
+        return (time.perf_counter() - started) * 1000, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+    return _stats([latency for latency, _ in results], [status for _, status in results], elapsed)
+
+
+async def run_asgi(app, url, cookie, requests, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def timed():
+        async with slots:
+            started = time.perf_counter()
+            status = await asgi_get(app, url, cookie)
+            return (time.perf_counter() - started) * 1000, status
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(timed() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return _stats([latency for latency, _ in results], [status for _, status in results], elapsed)
+
+
+def route_pairs(cases):
+    """``[(label, sync_url, async_url)]`` for the routes in ``cases`` that have an async variant"""
+    urls = {}
+    for label, name, url in cases:
+        urls.setdefault(name, url)
+    return [
+        (name, urls[name], urls[async_name])
+        for name, async_name in ASYNC_ROUTES.items()
+        if name in urls and async_name in urls
+    ]
+
+
+def compare(pairs, user, requests=200, levels=(1, 10, 50), warmup=5):
+    """
+    Load each pair at each concurrency level over both paths; returns
+    ``[{'route', 'server', 'concurrency', 'requests_per_second', 'p50_ms',
+    'p95_ms', 'errors'}]``.
+    """
+    wsgi_app, asgi_app = get_wsgi_application(), get_asgi_application()
+    cookie = session_cookie(user)
+    results = []
+    for label, sync_url, async_url in pairs:
+        run_wsgi(wsgi_app, sync_url, cookie, warmup, 1)
+        asyncio.run(run_asgi(asgi_app, async_url, cookie, warmup, 1))
+        for concurrency in levels:
+            for server, stats in (
+                ('wsgi', run_wsgi(wsgi_app, sync_url, cookie, requests, concurrency)),
+                ('asgi', asyncio.run(run_asgi(asgi_app, async_url, cookie, requests, concurrency))),
+            ):
+                results.append({'route': label, 'server': server, 'concurrency': concurrency, **stats})
+    return results
@@ -0,0 +1,55 @@
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.archive import DEFAULT_BATCH_SIZE, archivable, archive_appointments, default_cutoff
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = (
+        'Move completed and cancelled appointments older than the archive horizon '
+        'to the archive table, in short batches that other writers can interleave with.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.APPOINTMENT_ARCHIVE_DAYS,
+                            help='Archive appointments dated more than this many days ago')
+        parser.add_argument('--before', type=parse_date, help='Archive appointments dated before this day (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+        parser.add_argument('--limit', type=int, help='Archive at most this many appointments')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        # Every id of a batch is a query parameter
+        if not 0 < options['batch_size'] <= 900:
+            raise CommandError('--batch-size must be between 1 and 900')
+        cutoff = options['before'] or default_cutoff(options['days'])
+        if options['dry_run']:
+            count = archivable(cutoff).count()
+            self.stdout.write(f'{count} appointment(s) dated before {cutoff} would be archived')
+            return
+
+        started = time.perf_counter()
+
+        def progress(moved):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{moved} archived')
+
+        moved = archive_appointments(
+            cutoff, options['batch_size'], options['pause'], options['limit'], progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} appointment(s) dated before {cutoff} in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,83 @@
+import fnmatch
+import json
+import platform
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+from patients import benchmark
+from patients.models import Patient, Doctor, Appointment
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every route in patients/urls.py through the test client against '
+        'the current database and report p50/p95 latency and query counts. '
+        'Seed data first with seed_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=1)
+        parser.add_argument('--routes', nargs='*', help='Only routes matching these patterns, e.g. "patient_*"')
+        parser.add_argument('--output', help='Write results to this JSON file')
+        parser.add_argument('--baseline', help='Compare with the results in this JSON file')
+        parser.add_argument('--tolerance', type=float, default=1.25, help='Allowed p95 growth over the baseline')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as f:
+                    baseline = json.load(f)['routes']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f'Cannot read baseline: {e}')
+
+        setup_test_environment()
+        cases = benchmark.route_cases(benchmark.get_samples())
+        if options['routes']:
+            cases = [
+                case for case in cases
+                if any(fnmatch.fnmatch(case[1], pattern) for pattern in options['routes'])
+            ]
+        results = benchmark.run(
+            Client(), benchmark.get_benchmark_user(), cases,
+            iterations=options['iterations'], warmup=options['warmup'],
+        )
+
+        self.stdout.write(f'{"route":<48} {"status":>6} {"p50 ms":>9} {"p95 ms":>9} {"queries":>8} {"budget":>7}')
+        for label, stats in results.items():
+            self.stdout.write(
+                f'{label:<48} {stats["status"]:>6} {stats["p50_ms"]:>9.2f} '
+                f'{stats["p95_ms"]:>9.2f} {stats["queries"]:>8} {stats["budget"] if stats["budget"] is not None else "-":>7}'
+            )
+
+        if options['output']:
+            report = {
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'iterations': options['iterations'],
+                'rows': {
+                    'patients': Patient.objects.count(),
+                    'doctors': Doctor.objects.count(),
+                    'appointments': Appointment.objects.count(),
+                },
+                'routes': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        if baseline is not None:
+            regressions = benchmark.compare(results, baseline, options['tolerance'])
+            for label, message in regressions:
+                self.stdout.write(self.style.WARNING(f'{label}: {message}'))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+            elif options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regression(s) against the baseline')
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from patients.models import Appointment
+from patients.transitions import ALLOWED_TRANSITIONS, transition
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = (
+        "Close out a day: mark its scheduled and confirmed appointments completed "
+        "(or another status with --status), in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=parse_date, help='Day to close out (YYYY-MM-DD), default today')
+        parser.add_argument('--doctor', type=int, action='append', help='Only this doctor; may be repeated')
+        parser.add_argument('--status', choices=sorted(ALLOWED_TRANSITIONS), default='COMPLETED')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would change')
+
+    def handle(self, *args, **options):
+        day = options['date'] or timezone.localdate()
+        queryset = Appointment.objects.filter(appointment_date=day)
+        if options['doctor']:
+            queryset = queryset.filter(doctor_id__in=options['doctor'])
+        result = transition(queryset, options['status'], dry_run=options['dry_run'])
+        rejected = ', '.join(f'{count} {status.lower()}' for status, count in sorted(result['rejected'].items()))
+        verb = 'would be set' if options['dry_run'] else 'set'
+        self.stdout.write(self.style.SUCCESS(
+            f'{result["updated"]} appointment(s) on {day} {verb} to {options["status"]}, '
+            f'{result["unchanged"]} already {options["status"].lower()}'
+            + (f', left unchanged: {rejected}' if rejected else '')
+        ))
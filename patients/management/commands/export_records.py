@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.exports import EXPORTS, FORMATS
+from patients.search import filter_appointments, filter_patients
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Stream patients or appointments as CSV or NDJSON, with the same filters as the list pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', default='-', help='Output file, or - for stdout')
+        parser.add_argument('--q', default='', help='Search text')
+        parser.add_argument('--status', default='', help='Appointment status')
+        parser.add_argument('--from', dest='date_from', type=parse_date, help='First appointment date (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', type=parse_date, help='Last appointment date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        model, export = EXPORTS[options['kind']]
+        queryset = model.objects.all()
+        if options['kind'] == 'patients':
+            queryset = filter_patients(queryset, options['q'])
+        else:
+            queryset = filter_appointments(
+                queryset, options['q'], options['status'], options['date_from'], options['date_to']
+            )
+        chunks = export(queryset, options['format'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        try:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        except OSError as e:
+            raise CommandError(e)
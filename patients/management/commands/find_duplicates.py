@@ -0,0 +1,57 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.duplicates import BLOCKING_KEYS, MAX_BLOCK_SIZE, MIN_SCORE, find_duplicates
+from patients.models import Patient
+
+COLUMNS = ['patient_id', 'duplicate_id', 'score', 'matched', 'patient', 'duplicate']
+
+
+class Command(BaseCommand):
+    help = (
+        'List likely duplicate patients as CSV, best first. Records are only compared '
+        'with others sharing a blocking key: phonetic last name and date of birth, '
+        'phone number suffix or email.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', nargs='+', choices=list(BLOCKING_KEYS), default=list(BLOCKING_KEYS))
+        parser.add_argument('--min-score', type=float, default=MIN_SCORE)
+        parser.add_argument('--max-block-size', type=int, default=MAX_BLOCK_SIZE)
+        parser.add_argument('--output', default='-', help='Output file, or - for stdout')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['min_score'] <= 1:
+            raise CommandError('--min-score must be between 0 and 1')
+        started = time.perf_counter()
+        stats = {}
+        candidates = find_duplicates(
+            Patient.objects.all(), keys=options['keys'], min_score=options['min_score'],
+            max_block_size=options['max_block_size'], stats=stats,
+        )
+        try:
+            output = self.stdout if options['output'] == '-' else open(
+                options['output'], 'w', newline='', encoding='utf-8'
+            )
+        except OSError as e:
+            raise CommandError(e)
+        try:
+            writer = csv.writer(output)
+            writer.writerow(COLUMNS)
+            for candidate in candidates:
+                writer.writerow([
+                    candidate.patient.pk, candidate.duplicate.pk, f'{candidate.score:.3f}',
+                    '; '.join(candidate.matched),
+                    f'{candidate.patient.first_name} {candidate.patient.last_name}',
+                    f'{candidate.duplicate.first_name} {candidate.duplicate.last_name}',
+                ])
+        finally:
+            if output is not self.stdout:
+                output.close()
+        self.stderr.write(
+            f'{len(candidates)} candidate pair(s) from {stats["comparisons"]} comparisons in '
+            f'{stats["blocks"]} blocks ({stats["skipped_blocks"]} oversized blocks skipped), '
+            f'{time.perf_counter() - started:.1f}s'
+        )
@@ -0,0 +1,78 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.importers import DEFAULT_BATCH_SIZE, IMPORTERS, READERS
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream patients, doctors or appointments from a CSV or NDJSON file. '
+        'Rows are validated and inserted in batches; invalid rows are reported '
+        'and skipped. Target throughput on SQLite with the default batch size '
+        'is at least 4,000 rows/s for patients and appointments.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path', help='Input file, or - for stdin')
+        parser.add_argument('--format', choices=sorted(READERS), help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--errors', help='Write rejected rows to this CSV file instead of stderr')
+        parser.add_argument(
+            '--allow-past', action='store_true',
+            help='Accept appointments in the past (e.g. when loading history)',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if path == '-' and not options['format']:
+            raise CommandError('--format is required when reading from stdin')
+        kwargs = {'batch_size': options['batch_size']}
+        if options['kind'] == 'appointments':
+            kwargs['allow_past'] = options['allow_past']
+        importer = IMPORTERS[options['kind']](**kwargs)
+
+        try:
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+            errors_file = open(options['errors'], 'w', newline='', encoding='utf-8') if options['errors'] else None
+        except OSError as e:
+            raise CommandError(e)
+        error_writer = csv.writer(errors_file) if errors_file else None
+        if error_writer:
+            error_writer.writerow(['line', 'errors'])
+        started = time.monotonic()
+        rejected = 0
+
+        def report(importer):
+            # Drain errors after every batch so memory stays bounded on files
+            # with many bad rows
+            nonlocal rejected
+            for error in importer.errors:
+                if error_writer:
+                    error_writer.writerow([error.line, '; '.join(error.messages)])
+                else:
+                    self.stderr.write(str(error))
+            rejected += len(importer.errors)
+            importer.errors.clear()
+            if options['verbosity'] > 1:
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'{importer.imported} imported, {rejected} rejected, {elapsed:.1f}s')
+
+        try:
+            importer.run(READERS[fmt](stream), on_batch=report)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        if errors_file:
+            errors_file.close()
+        elapsed = time.monotonic() - started
+
+        rate = importer.imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.imported} {options["kind"]}, rejected {rejected} '
+            f'in {elapsed:.1f}s ({rate:.0f} rows/s)'
+        ))
@@ -0,0 +1,57 @@
+import fnmatch
+import json
+import platform
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment
+
+from patients import benchmark, loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        'Load the routes that have an async variant with concurrent requests, the sync '
+        'views through the WSGI handler and the async ones through the ASGI handler, and '
+        'report throughput and p50/p95 latency per concurrency level. Seed data first with seed_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per route, path and level')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--routes', nargs='*', help='Only routes matching these patterns, e.g. "patient_*"')
+        parser.add_argument('--output', help='Write results to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or min(options['concurrency']) < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+        setup_test_environment()
+        pairs = loadtest.route_pairs(benchmark.route_cases(benchmark.get_samples()))
+        if options['routes']:
+            pairs = [
+                pair for pair in pairs
+                if any(fnmatch.fnmatch(pair[0], pattern) for pattern in options['routes'])
+            ]
+        if not pairs:
+            raise CommandError('No routes to load')
+        results = loadtest.compare(
+            pairs, benchmark.get_benchmark_user(), requests=options['requests'], levels=options['concurrency'],
+        )
+
+        self.stdout.write(f'{"route":<24} {"server":>6} {"conc":>5} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"errors":>7}')
+        for row in results:
+            self.stdout.write(
+                f'{row["route"]:<24} {row["server"]:>6} {row["concurrency"]:>5} {row["requests_per_second"]:>9.1f} '
+                f'{row["p50_ms"]:>9.2f} {row["p95_ms"]:>9.2f} {row["errors"]:>7}'
+            )
+
+        if options['output']:
+            report = {
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'requests': options['requests'],
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
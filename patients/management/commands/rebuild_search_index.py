@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from patients.search import patient_index, doctor_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the patient and doctor full-text search indexes from scratch'
+
+    def handle(self, *args, **options):
+        for index in (patient_index, doctor_index):
+            if not index.uses_fts():
+                self.stdout.write(f'{index.model.__name__}: full-text search requires SQLite, skipped')
+                continue
+            count = index.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'{index.model.__name__}: indexed {count} rows'))
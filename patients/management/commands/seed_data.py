@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.benchmark import get_benchmark_user
+from patients.seeding import DEFAULT_BATCH_SIZE, SCALES, scale_counts, seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic patients, doctors and appointments with bulk inserts. '
+        'A scale sets the number of patients; doctors and appointments follow '
+        'from it unless given explicitly. Rows are added to existing data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+        parser.add_argument('--patients', type=int, help='Overrides the scale')
+        parser.add_argument('--doctors', type=int)
+        parser.add_argument('--appointments', type=int)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible data')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        patients = options['patients'] if options['patients'] is not None else SCALES[options['scale']]
+        counts = scale_counts(patients)
+        for name in ('doctors', 'appointments'):
+            if options[name] is not None:
+                counts[name] = options[name]
+        if min(counts.values()) < 0 or options['batch_size'] < 1:
+            raise CommandError('Counts must not be negative and the batch size must be positive')
+        self.stdout.write(
+            f'Seeding {counts["patients"]} patients, {counts["doctors"]} doctors, '
+            f'{counts["appointments"]} appointments'
+        )
+        started = time.monotonic()
+
+        def progress(model, total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{model.__name__}: {total} ({time.monotonic() - started:.1f}s)')
+
+        written = seed(
+            counts['patients'], counts['doctors'], counts['appointments'],
+            seed=options['seed'], batch_size=options['batch_size'], progress=progress,
+            # Pages show who created a row; the benchmark renders them with one
+            created_by=get_benchmark_user(),
+        )
+        elapsed = time.monotonic() - started
+        rate = sum(written.values()) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {written["patients"]} patients, {written["doctors"]} doctors and '
+            f'{written["appointments"]} appointments in {elapsed:.1f}s ({rate:.0f} rows/s)'
+        ))
@@ -0,0 +1,177 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from patient_management_system.sqlite3.base import apply_pragmas
+from patients.benchmark import percentile
+
+# What Django's stock sqlite3 backend does: rollback journal, deferred BEGIN
+# and the sqlite3 module's 5 second busy handler
+DEFAULT_PROFILE = {'transaction_mode': 'DEFERRED', 'pragmas': {'journal_mode': 'DELETE'}}
+
+READ_QUERIES = [
+    'SELECT id, first_name, last_name, date_of_birth, phone_number FROM patients_patient '
+    'ORDER BY created_at DESC, id DESC LIMIT 25',
+    'SELECT a.id, a.appointment_time, a.status, p.first_name, p.last_name FROM patients_appointment a '
+    'JOIN patients_patient p ON p.id = a.patient_id WHERE a.doctor_id = ? AND a.appointment_date = ?',
+]
+CONFLICT_SQL = (
+    'SELECT 1 FROM patients_appointment WHERE doctor_id = ? AND appointment_date = ? '
+    "AND appointment_time = ? AND status != 'CANCELLED'"
+)
+INSERT_SQL = (
+    'INSERT INTO patients_appointment (patient_id, doctor_id, appointment_date, appointment_time, '
+    'status, notes, timezone, created_at, updated_at) '
+    "VALUES (?, ?, ?, ?, 'SCHEDULED', '', 'UTC', ?, ?)"
+)
+
+
+class Workload:
+    def __init__(self, path, profile, seconds, patient_ids, doctor_ids):
+        self.path = path
+        self.mode = profile['transaction_mode']
+        self.pragmas = profile['pragmas']
+        self.seconds = seconds
+        self.patient_ids = patient_ids
+        self.doctor_ids = doctor_ids
+        self.lock = threading.Lock()
+        self.reads = 0
+        self.writes = 0
+        self.conflicts = 0
+        self.locked = 0
+        self.write_ms = []
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        apply_pragmas(conn, self.pragmas)
+        return conn
+
+    def reader(self, deadline, rng):
+        conn = self.connect()
+        reads = locked = 0
+        while time.monotonic() < deadline:
+            sql = rng.choice(READ_QUERIES)
+            params = (rng.choice(self.doctor_ids), date.today().isoformat()) if '?' in sql else ()
+            try:
+                conn.execute(sql, params).fetchall()
+                reads += 1
+            except sqlite3.OperationalError:
+                locked += 1
+        conn.close()
+        with self.lock:
+            self.reads += reads
+            self.locked += locked
+
+    def writer(self, deadline, rng):
+        conn = self.connect()
+        writes = conflicts = locked = 0
+        timings = []
+        while time.monotonic() < deadline:
+            # Far future days so the writes never collide with real bookings
+            day = (date(2100, 1, 1) + timedelta(days=rng.randrange(3650))).isoformat()
+            slot = f'{rng.randrange(8, 18):02d}:00:00'
+            doctor_id = rng.choice(self.doctor_ids)
+            started = time.perf_counter()
+            try:
+                conn.execute(f'BEGIN {self.mode}')
+                if conn.execute(CONFLICT_SQL, (doctor_id, day, slot)).fetchone():
+                    conflicts += 1
+                    conn.execute('ROLLBACK')
+                    continue
+                now = datetime.now().isoformat(sep=' ')
+                conn.execute(INSERT_SQL, (rng.choice(self.patient_ids), doctor_id, day, slot, now, now))
+                conn.execute('COMMIT')
+                writes += 1
+                timings.append((time.perf_counter() - started) * 1000)
+            except sqlite3.IntegrityError:
+                conflicts += 1
+                conn.execute('ROLLBACK')
+            except sqlite3.OperationalError:
+                locked += 1
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+        conn.close()
+        with self.lock:
+            self.writes += writes
+            self.conflicts += conflicts
+            self.locked += locked
+            self.write_ms.extend(timings)
+
+    def run(self, readers, writers, seed=0):
+        deadline = time.monotonic() + self.seconds
+        threads = [
+            threading.Thread(target=target, args=(deadline, random.Random(seed + i)))
+            for i, target in enumerate([self.reader] * readers + [self.writer] * writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+            'reads_per_s': self.reads / self.seconds,
+            'writes_per_s': self.writes / self.seconds,
+            'write_p95_ms': percentile(self.write_ms, 95) if self.write_ms else None,
+            'locked_errors': self.locked,
+            'conflicts': self.conflicts,
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure concurrent read and write throughput on a copy of the database, '
+        "with Django's default SQLite setup and with the production profile "
+        '(SQLITE_PRODUCTION_OPTIONS). Reader and writer threads each use their own connection.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark only applies to SQLite databases')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM patients_patient')
+            patient_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute('SELECT id FROM patients_doctor')
+            doctor_ids = [row[0] for row in cursor.fetchall()]
+        if not patient_ids or not doctor_ids:
+            raise CommandError('The database has no patients or doctors; run seed_data first')
+        connection.ensure_connection()
+
+        profiles = [('default', DEFAULT_PROFILE), ('production', settings.SQLITE_PRODUCTION_OPTIONS)]
+        self.stdout.write(
+            f'{options["readers"]} readers, {options["writers"]} writers, {options["seconds"]:.0f}s per profile'
+        )
+        self.stdout.write(f'{"profile":<12} {"reads/s":>10} {"writes/s":>10} {"write p95 ms":>13} {"locked":>8}')
+        for name, profile in profiles:
+            # Every profile starts from an identical copy of the database
+            fd, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+            try:
+                target = sqlite3.connect(path)
+                connection.connection.backup(target)
+                target.close()
+                result = Workload(path, profile, options['seconds'], patient_ids, doctor_ids).run(
+                    options['readers'], options['writers'],
+                )
+            finally:
+                for suffix in ('', '-wal', '-shm', '-journal'):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+            p95 = f'{result["write_p95_ms"]:.1f}' if result['write_p95_ms'] is not None else '-'
+            self.stdout.write(
+                f'{name:<12} {result["reads_per_s"]:>10.0f} {result["writes_per_s"]:>10.0f} '
+                f'{p95:>13} {result["locked_errors"]:>8}'
+            )
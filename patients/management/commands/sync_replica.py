@@ -0,0 +1,42 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from patients.routers import PRIMARY, replica_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database into the replica files with the SQLite '
+        'backup API. Stands in for replication when running with a local replica '
+        '(DJANGO_USE_REPLICA=1); use --interval to keep copying.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Repeat every N seconds until interrupted')
+
+    def handle(self, *args, **options):
+        replicas = replica_aliases()
+        if not replicas:
+            raise CommandError('No replicas configured (settings.DATABASE_REPLICAS is empty)')
+        primary = connections[PRIMARY]
+        if primary.vendor != 'sqlite' or any(connections[alias].vendor != 'sqlite' for alias in replicas):
+            raise CommandError('sync_replica only copies SQLite databases')
+        while True:
+            self.sync(primary, replicas)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, primary, replicas):
+        primary.ensure_connection()
+        for alias in replicas:
+            started = time.monotonic()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f'{alias}: synced in {time.monotonic() - started:.2f}s')
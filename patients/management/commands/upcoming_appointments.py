@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.reminders import due_reminders
+from patients.timezones import get_zone
+
+
+class Command(BaseCommand):
+    help = 'List active appointments starting within the next few hours, in every time zone (for reminders)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=2)
+
+    def handle(self, *args, **options):
+        if options['hours'] <= 0:
+            raise CommandError('--hours must be positive')
+        count = 0
+        for appointment in due_reminders(timedelta(hours=options['hours'])).iterator(chunk_size=500):
+            local = appointment.starts_at.astimezone(get_zone(appointment.timezone))
+            self.stdout.write(
+                f'{appointment.starts_at:%Y-%m-%d %H:%M} UTC  '
+                f'({local:%H:%M} {appointment.timezone})  '
+                f'{appointment.patient.get_full_name()} with {appointment.doctor.get_full_name()}'
+            )
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'{count} appointment(s) in the next {options["hours"]:g} hours'))
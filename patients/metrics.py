@@ -0,0 +1,105 @@
+"""
+In-process request metrics rendered in the Prometheus text format.
+
+Histograms are kept per route (the URL name from ``patients/urls.py``) and
+per process; with several workers, scrape each one or put them behind a
+shared exporter.
+"""
+import threading
+from bisect import bisect_left
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250, 500)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # route -> [bucket counts..., +Inf count, sum]
+        self.series = {}
+
+    def observe(self, route, value):
+        series = self.series.get(route)
+        if series is None:
+            series = self.series[route] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for route, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{route}",le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{view="{route}",le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{route}"}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{view="{route}"}} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, route, amount=1):
+        self.series[route] = self.series.get(route, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for route, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{{view="{route}"}} {value}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.duration = Histogram(
+                'pms_request_duration_seconds', 'Wall time per request.', DURATION_BUCKETS,
+            )
+            self.sql_queries = Histogram(
+                'pms_request_sql_queries', 'SQL queries per request.', QUERY_BUCKETS,
+            )
+            self.sql_duration = Histogram(
+                'pms_request_sql_duration_seconds', 'Time spent in SQL per request.', DURATION_BUCKETS,
+            )
+            self.template_duration = Histogram(
+                'pms_request_template_duration_seconds', 'Template render time per request.', DURATION_BUCKETS,
+            )
+            self.slow_queries = Counter('pms_slow_queries_total', 'SQL queries over the slow query threshold.')
+            self.budget_exceeded = Counter(
+                'pms_query_budget_exceeded_total', "Requests that ran more queries than their view's budget.",
+            )
+
+    def observe(self, route, stats):
+        with self._lock:
+            self.duration.observe(route, stats.total)
+            self.sql_queries.observe(route, stats.sql_count)
+            self.sql_duration.observe(route, stats.sql_time)
+            self.template_duration.observe(route, stats.template_time)
+            if stats.slow_queries:
+                self.slow_queries.inc(route, stats.slow_queries)
+            if stats.over_budget:
+                self.budget_exceeded.inc(route)
+
+    def render(self, extra=()):
+        with self._lock:
+            lines = []
+            for metric in (self.duration, self.sql_queries, self.sql_duration,
+                           self.template_duration, self.slow_queries, self.budget_exceeded):
+                lines.extend(metric.render())
+        lines.extend(extra)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
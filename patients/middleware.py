@@ -0,0 +1,199 @@
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template
+
+from . import routers
+from .budgets import check_budget, counts_against_budget
+from .metrics import registry
+
+logger = logging.getLogger('patients.performance')
+
+current_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.total = 0.0
+        self.sql_count = 0
+        # Queries that count against the view's query budget
+        self.budgeted_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.slow_queries = 0
+        self.over_budget = False
+
+    def server_timing(self):
+        return ', '.join([
+            f'total;dur={self.total * 1000:.1f}',
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+        ])
+
+
+def _instrument_templates():
+    # Template rendering has no hook outside the test runner, so time the
+    # backend's render(); included templates are part of the outer render
+    if getattr(Template.render, '_timed', False):
+        return
+    render = Template.render
+
+    def timed_render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None:
+            return render(self, context, request)
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+    timed_render._timed = True
+    Template.render = timed_render
+
+
+def _sql_wrapper(stats, threshold):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.sql_count += 1
+            if counts_against_budget():
+                stats.budgeted_count += 1
+            stats.sql_time += elapsed
+            if threshold is not None and elapsed * 1000 >= threshold:
+                stats.slow_queries += 1
+                logger.warning('Slow query (%.1f ms) on %s: %s', elapsed * 1000, context['connection'].alias, sql)
+    return wrapper
+
+
+@contextmanager
+def track_queries(stats=None):
+    """
+    Count and time the queries run on this thread's connections into
+    ``stats`` (default: the current request's). Connections are per thread,
+    so code that queries from another thread enters this there.
+    """
+    stats = stats or current_stats.get()
+    if stats is None:
+        yield
+        return
+    wrapper = _sql_wrapper(stats, getattr(settings, 'PERFORMANCE_SLOW_QUERY_MS', None))
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
+
+
+class PerformanceMiddleware:
+    """
+    Time every request and report it as a Server-Timing header and in the
+    per-route histograms served at /metrics.
+
+    SQL is measured with ``connection.execute_wrapper`` on every database
+    alias; queries slower than ``PERFORMANCE_SLOW_QUERY_MS`` and requests over
+    their view's query budget (see ``budgets``, which also says which
+    queries are left out of it) are logged to the
+    ``patients.performance`` logger.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        _instrument_templates()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            with track_queries(stats):
+                response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self._report(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        tracking = ExitStack()
+        try:
+            # The sync code of an ASGI request, the ORM included, runs on
+            # one thread per request, so the wrappers are installed there
+            await sync_to_async(tracking.enter_context)(track_queries(stats))
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(tracking.close)()
+        finally:
+            current_stats.reset(token)
+        return self._report(request, response, stats, started)
+
+    def _report(self, request, response, stats, started):
+        stats.total = time.perf_counter() - started
+        match = request.resolver_match
+        route = match.view_name if match else 'unresolved'
+        if match:
+            stats.over_budget = check_budget(route, match.func, stats.budgeted_count)
+        registry.observe(route, stats)
+        response['Server-Timing'] = stats.server_timing()
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Pin a request's reads to the primary database when it is a write request
+    or comes from a client that wrote recently, and mark clients that write
+    with a short-lived cookie. Goes before SessionMiddleware so the session
+    and user lookups are routed too.
+    """
+
+    cookie_name = 'pms_primary'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with routers.track_request(self._pinned(request)) as state:
+            response = self.get_response(request)
+        return self._mark(response, state)
+
+    async def __acall__(self, request):
+        with routers.track_request(self._pinned(request)) as state:
+            response = await self.get_response(request)
+        return self._mark(response, state)
+
+    def _pinned(self, request):
+        return request.method not in self.safe_methods or self.cookie_name in request.COOKIES
+
+    def _mark(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                self.cookie_name, '1', max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10),
+                httponly=True, samesite='Lax',
+            )
+        return response
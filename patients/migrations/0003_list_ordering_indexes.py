@@ -0,0 +1,21 @@
+# Generated by Django 4.2.26 on 2026-10-18 05:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0002_doctor_appointment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['last_name', 'first_name'], name='patients_do_last_na_9597d3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['created_at'], name='patients_pa_created_542792_idx'),
+        ),
+    ]
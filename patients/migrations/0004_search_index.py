@@ -0,0 +1,99 @@
+from django.db import migrations
+
+PHONE_DIGITS = "replace(replace(replace(replace(replace(replace({0}, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', '')"
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS patients_patient_fts USING fts5(
+        first_name, last_name, phone, email,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_patient_fts_ai AFTER INSERT ON patients_patient BEGIN
+        INSERT INTO patients_patient_fts (rowid, first_name, last_name, phone, email)
+        VALUES (new.id, new.first_name, new.last_name,
+                new.phone_number || ' ' || %s, coalesce(new.email, ''));
+    END
+    """ % PHONE_DIGITS.format('new.phone_number'),
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_patient_fts_ad AFTER DELETE ON patients_patient BEGIN
+        DELETE FROM patients_patient_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_patient_fts_au
+    AFTER UPDATE OF first_name, last_name, phone_number, email ON patients_patient BEGIN
+        DELETE FROM patients_patient_fts WHERE rowid = old.id;
+        INSERT INTO patients_patient_fts (rowid, first_name, last_name, phone, email)
+        VALUES (new.id, new.first_name, new.last_name,
+                new.phone_number || ' ' || %s, coalesce(new.email, ''));
+    END
+    """ % PHONE_DIGITS.format('new.phone_number'),
+    """
+    INSERT INTO patients_patient_fts (rowid, first_name, last_name, phone, email)
+    SELECT id, first_name, last_name, phone_number || ' ' || %s, coalesce(email, '')
+    FROM patients_patient
+    """ % PHONE_DIGITS.format('phone_number'),
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS patients_doctor_fts USING fts5(
+        first_name, last_name, specialization, email,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_doctor_fts_ai AFTER INSERT ON patients_doctor BEGIN
+        INSERT INTO patients_doctor_fts (rowid, first_name, last_name, specialization, email)
+        VALUES (new.id, new.first_name, new.last_name, new.specialization, new.email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_doctor_fts_ad AFTER DELETE ON patients_doctor BEGIN
+        DELETE FROM patients_doctor_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS patients_doctor_fts_au
+    AFTER UPDATE OF first_name, last_name, specialization, email ON patients_doctor BEGIN
+        DELETE FROM patients_doctor_fts WHERE rowid = old.id;
+        INSERT INTO patients_doctor_fts (rowid, first_name, last_name, specialization, email)
+        VALUES (new.id, new.first_name, new.last_name, new.specialization, new.email);
+    END
+    """,
+    """
+    INSERT INTO patients_doctor_fts (rowid, first_name, last_name, specialization, email)
+    SELECT id, first_name, last_name, specialization, email FROM patients_doctor
+    """,
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS patients_patient_fts_ai',
+    'DROP TRIGGER IF EXISTS patients_patient_fts_ad',
+    'DROP TRIGGER IF EXISTS patients_patient_fts_au',
+    'DROP TABLE IF EXISTS patients_patient_fts',
+    'DROP TRIGGER IF EXISTS patients_doctor_fts_ai',
+    'DROP TRIGGER IF EXISTS patients_doctor_fts_ad',
+    'DROP TRIGGER IF EXISTS patients_doctor_fts_au',
+    'DROP TABLE IF EXISTS patients_doctor_fts',
+]
+
+
+def run_sqlite(statements):
+    # FTS5 is SQLite specific; other backends fall back to LIKE searches
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_list_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(CREATE_SQL), run_sqlite(DROP_SQL)),
+    ]
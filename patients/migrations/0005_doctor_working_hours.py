@@ -0,0 +1,30 @@
+# Generated by Django 4.2.26 on 2026-10-18 05:47
+
+import datetime
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='slot_minutes',
+            field=models.PositiveSmallIntegerField(default=60, validators=[django.core.validators.MinValueValidator(5), django.core.validators.MaxValueValidator(240)]),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='work_end',
+            field=models.TimeField(default=datetime.time(17, 0)),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='work_start',
+            field=models.TimeField(default=datetime.time(9, 0)),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:08
+
+from zoneinfo import ZoneInfoNotFoundError
+
+from django.db import migrations, models
+import patients.timezones
+
+BATCH_SIZE = 2000
+
+
+def backfill_starts_at(apps, schema_editor):
+    Appointment = apps.get_model('patients', 'Appointment')
+    manager = Appointment.objects.using(schema_editor.connection.alias)
+    last_pk = 0
+    while True:
+        batch = list(
+            manager.filter(pk__gt=last_pk).order_by('pk')
+            .only('appointment_date', 'appointment_time', 'timezone')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for appointment in batch:
+            try:
+                appointment.starts_at = patients.timezones.local_to_utc(
+                    appointment.appointment_date, appointment.appointment_time, appointment.timezone,
+                )
+            except (ZoneInfoNotFoundError, ValueError):
+                # Unknown zone names are left for the validator to report
+                # the next time the appointment is edited
+                appointment.starts_at = None
+        manager.bulk_update(batch, ['starts_at'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_appointment_active_slot_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='starts_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='timezone',
+            field=models.CharField(default='UTC', max_length=50, validators=[patients.timezones.validate_timezone]),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['starts_at'], name='patients_ap_starts__ae8200_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'starts_at'], name='patients_ap_doctor__29ea86_idx'),
+        ),
+        migrations.RunPython(backfill_starts_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:10
+
+from django.db import migrations, models
+
+import patients.phones
+
+BATCH_SIZE = 2000
+
+
+def backfill_phone_digits(apps, schema_editor):
+    connection = schema_editor.connection
+    for model_name in ('Patient', 'Doctor'):
+        model = apps.get_model('patients', model_name)
+        if connection.vendor == 'sqlite':
+            # One UPDATE with the normalizer registered as an SQL function
+            # instead of a round trip per row
+            connection.ensure_connection()
+            connection.connection.create_function('normalize_phone', 1, patients.phones.normalize_phone)
+            connection.connection.create_function('reverse_text', 1, lambda value: value[::-1])
+            schema_editor.execute(
+                f'UPDATE {model._meta.db_table} SET phone_digits = normalize_phone(phone_number), '
+                'phone_digits_reversed = reverse_text(normalize_phone(phone_number))'
+            )
+            continue
+        manager = model.objects.using(connection.alias)
+        last_pk = 0
+        while True:
+            batch = list(manager.filter(pk__gt=last_pk).order_by('pk').only('phone_number')[:BATCH_SIZE])
+            if not batch:
+                break
+            for row in batch:
+                row.phone_digits = patients.phones.normalize_phone(row.phone_number)
+                row.phone_digits_reversed = row.phone_digits[::-1]
+            manager.bulk_update(batch, ['phone_digits', 'phone_digits_reversed'])
+            last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_appointment_starts_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='phone_digits',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='phone_digits_reversed',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='phone_digits',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='phone_digits_reversed',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(backfill_phone_digits, migrations.RunPython.noop),
+    ]
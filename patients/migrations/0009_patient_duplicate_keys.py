@@ -0,0 +1,51 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:19
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+import patients.duplicates
+
+BATCH_SIZE = 2000
+
+
+def backfill_name_dob_key(apps, schema_editor):
+    connection = schema_editor.connection
+    Patient = apps.get_model('patients', 'Patient')
+    if connection.vendor == 'sqlite':
+        # As in 0008: one UPDATE with the key function registered in SQL
+        connection.ensure_connection()
+        connection.connection.create_function('name_dob_key', 2, patients.duplicates.name_dob_key)
+        schema_editor.execute(
+            f'UPDATE {Patient._meta.db_table} SET name_dob_key = name_dob_key(last_name, date_of_birth)'
+        )
+        return
+    manager = Patient.objects.using(connection.alias)
+    last_pk = 0
+    while True:
+        batch = list(manager.filter(pk__gt=last_pk).order_by('pk').only('last_name', 'date_of_birth')[:BATCH_SIZE])
+        if not batch:
+            break
+        for row in batch:
+            row.name_dob_key = patients.duplicates.name_dob_key(row.last_name, row.date_of_birth)
+        manager.bulk_update(batch, ['name_dob_key'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0008_phone_digits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='name_dob_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='patient_email_lower_idx'),
+        ),
+        migrations.RunPython(backfill_name_dob_key, migrations.RunPython.noop),
+    ]
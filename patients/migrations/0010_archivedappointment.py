@@ -0,0 +1,38 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('patients', '0009_patient_duplicate_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('appointment_date', models.DateField()),
+                ('appointment_time', models.TimeField()),
+                ('status', models.CharField(choices=[('SCHEDULED', 'Scheduled'), ('CONFIRMED', 'Confirmed'), ('CANCELLED', 'Cancelled'), ('COMPLETED', 'Completed')], max_length=10)),
+                ('notes', models.TextField(blank=True)),
+                ('timezone', models.CharField(default='UTC', max_length=50)),
+                ('starts_at', models.DateTimeField(null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_appointments', to='patients.doctor')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_appointments', to='patients.patient')),
+            ],
+            options={
+                'ordering': ['appointment_date', 'appointment_time'],
+                'indexes': [models.Index(fields=['patient', 'appointment_date'], name='patients_ar_patient_c9d5e5_idx')],
+            },
+        ),
+    ]
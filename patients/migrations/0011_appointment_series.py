@@ -0,0 +1,43 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:29
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import patients.timezones
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('patients', '0010_archivedappointment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('appointment_time', models.TimeField()),
+                ('frequency', models.CharField(choices=[('DAILY', 'Daily'), ('WEEKLY', 'Weekly'), ('BIWEEKLY', 'Every two weeks')], default='WEEKLY', max_length=10)),
+                ('occurrences', models.PositiveSmallIntegerField(default=10, validators=[django.core.validators.MinValueValidator(2), django.core.validators.MaxValueValidator(52)])),
+                ('notes', models.TextField(blank=True)),
+                ('timezone', models.CharField(default='UTC', max_length=50, validators=[patients.timezones.validate_timezone])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointment_series', to='patients.doctor')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointment_series', to='patients.patient')),
+            ],
+            options={
+                'verbose_name_plural': 'appointment series',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='series',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointments', to='patients.appointmentseries'),
+        ),
+    ]
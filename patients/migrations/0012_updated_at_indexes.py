@@ -0,0 +1,25 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0011_appointment_series'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['updated_at'], name='patients_ap_updated_536aae_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['updated_at'], name='patients_do_updated_e464a0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['updated_at'], name='patients_pa_updated_efb345_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:51
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0012_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(django.db.models.functions.text.Lower('last_name'), django.db.models.functions.text.Lower('first_name'), name='patient_last_first_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(django.db.models.functions.text.Lower('first_name'), django.db.models.functions.text.Lower('last_name'), name='patient_first_last_lower_idx'),
+        ),
+    ]
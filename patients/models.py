@@ -1,12 +1,39 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Lower
 from django.utils import timezone
-from datetime import datetime, date
+from datetime import date, time, timedelta
+from zoneinfo import ZoneInfoNotFoundError
+
+from .duplicates import name_dob_key
+from .phones import normalize_phone
+from .timezones import local_to_utc, validate_timezone
 
 # Create your models here.
 
-class Patient(models.Model):
+class PhoneLookupModel(models.Model):
+    """Keeps the indexed, normalized copies of phone_number used by phones.lookup()"""
+    phone_digits = models.CharField(max_length=20, editable=False, db_index=True, default='')
+    phone_digits_reversed = models.CharField(max_length=20, editable=False, db_index=True, default='')
+    
+    class Meta:
+        abstract = True
+    
+    def set_phone_digits(self):
+        self.phone_digits = normalize_phone(self.phone_number)
+        self.phone_digits_reversed = self.phone_digits[::-1]
+    
+    def save(self, *args, **kwargs):
+        self.set_phone_digits()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone_number' in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'phone_digits', 'phone_digits_reversed']
+        super().save(*args, **kwargs)
+
+
+class Patient(PhoneLookupModel):
     GENDER_CHOICES = [
         ('M', 'Male'),
         ('F', 'Female'),
@@ -26,9 +53,20 @@ class Patient(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # Soundex of last_name plus date_of_birth, the blocking key used by
+    # duplicates.find_duplicates(); kept in sync by save()
+    name_dob_key = models.CharField(max_length=16, editable=False, db_index=True, default='')
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['updated_at']),
+            models.Index(Lower('email'), name='patient_email_lower_idx'),
+            # Name prefix lookups (search.name_prefix_search), by surname or by first name
+            models.Index(Lower('last_name'), Lower('first_name'), name='patient_last_first_lower_idx'),
+            models.Index(Lower('first_name'), Lower('last_name'), name='patient_first_last_lower_idx'),
+        ]
     
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -42,9 +80,19 @@ class Patient(models.Model):
             (today.month, today.day) < (self.date_of_birth.month, self.date_of_birth.day)
         )
         return age
+    
+    def set_name_dob_key(self):
+        self.name_dob_key = name_dob_key(self.last_name, self.date_of_birth)
+    
+    def save(self, *args, **kwargs):
+        self.set_name_dob_key()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'last_name', 'date_of_birth'} & set(update_fields):
+            kwargs['update_fields'] = [*update_fields, 'name_dob_key']
+        super().save(*args, **kwargs)
 
 
-class Doctor(models.Model):
+class Doctor(PhoneLookupModel):
     SPECIALIZATION_CHOICES = [
         ('GP', 'General Practitioner'),
         ('CARD', 'Cardiologist'),
@@ -63,17 +111,30 @@ class Doctor(models.Model):
     email = models.EmailField()
     phone_number = models.CharField(max_length=20)
     is_available = models.BooleanField(default=True)
+    work_start = models.TimeField(default=time(9, 0))
+    work_end = models.TimeField(default=time(17, 0))
+    slot_minutes = models.PositiveSmallIntegerField(
+        default=60, validators=[MinValueValidator(5), MaxValueValidator(240)]
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['last_name', 'first_name']
+        indexes = [
+            models.Index(fields=['last_name', 'first_name']),
+            models.Index(fields=['updated_at']),
+        ]
     
     def __str__(self):
         return f"Dr. {self.first_name} {self.last_name} - {self.get_specialization_display()}"
     
     def get_full_name(self):
         return f"Dr. {self.first_name} {self.last_name}"
+    
+    def clean(self):
+        if self.work_start and self.work_end and self.work_start >= self.work_end:
+            raise ValidationError('Working hours must end after they start.')
 
 
 class Appointment(models.Model):
@@ -90,33 +151,139 @@ class Appointment(models.Model):
     appointment_time = models.TimeField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='SCHEDULED')
     notes = models.TextField(blank=True)
-    timezone = models.CharField(max_length=50, default='UTC')
+    timezone = models.CharField(max_length=50, default='UTC', validators=[validate_timezone])
+    # appointment_date/appointment_time in the appointment's time zone as a
+    # UTC instant, kept in sync by save() for range queries across zones
+    starts_at = models.DateTimeField(null=True, editable=False)
+    series = models.ForeignKey(
+        'AppointmentSeries', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='appointments',
+    )
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['appointment_date', 'appointment_time']
-        # Prevent double booking - one doctor cannot have overlapping appointments
-        unique_together = [['doctor', 'appointment_date', 'appointment_time']]
+        constraints = [
+            # Prevent double booking - one doctor cannot have overlapping
+            # appointments, but a cancelled slot can be booked again
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date', 'appointment_time'],
+                condition=~models.Q(status='CANCELLED'),
+                name='unique_active_appointment_slot',
+            ),
+        ]
         indexes = [
             models.Index(fields=['appointment_date', 'appointment_time']),
             models.Index(fields=['doctor', 'appointment_date']),
             models.Index(fields=['patient', 'appointment_date']),
+            models.Index(fields=['starts_at']),
+            models.Index(fields=['doctor', 'starts_at']),
+            models.Index(fields=['updated_at']),
         ]
     
     def __str__(self):
         return f"{self.patient.get_full_name()} with {self.doctor.get_full_name()} on {self.appointment_date} at {self.appointment_time}"
     
+    def get_starts_at(self):
+        """The appointment's start as a UTC datetime, or None if incomplete"""
+        if not (self.appointment_date and self.appointment_time and self.timezone):
+            return None
+        return local_to_utc(self.appointment_date, self.appointment_time, self.timezone)
+    
     def clean(self):
-        # Validate appointment is not in the past
-        if self.appointment_date and self.appointment_time:
-            appointment_datetime = datetime.combine(self.appointment_date, self.appointment_time)
-            if timezone.is_aware(appointment_datetime):
-                appointment_datetime = timezone.make_naive(appointment_datetime)
-            if appointment_datetime < timezone.now().replace(tzinfo=None):
-                raise ValidationError('Cannot book appointments in the past.')
+        # Validate appointment is not in the past, in its own time zone
+        try:
+            starts_at = self.get_starts_at()
+        except (ZoneInfoNotFoundError, ValueError):
+            return  # reported by the timezone field's validator
+        if starts_at and starts_at < timezone.now():
+            raise ValidationError('Cannot book appointments in the past.')
     
-    def save(self, *args, **kwargs):
-        self.full_clean()
+    def save(self, *args, validate=True, **kwargs):
+        # Callers that already validated (see booking.save_appointment) pass
+        # validate=False and rely on the database constraints instead
+        if validate:
+            self.full_clean()
+        self.starts_at = self.get_starts_at()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'appointment_date', 'appointment_time', 'timezone'} & set(update_fields):
+            kwargs['update_fields'] = [*update_fields, 'starts_at']
         super().save(*args, **kwargs)
+
+
+class AppointmentSeries(models.Model):
+    """A recurring booking; its appointments are created by series.book_series()"""
+    FREQUENCY_CHOICES = [
+        ('DAILY', 'Daily'),
+        ('WEEKLY', 'Weekly'),
+        ('BIWEEKLY', 'Every two weeks'),
+    ]
+    INTERVAL_DAYS = {'DAILY': 1, 'WEEKLY': 7, 'BIWEEKLY': 14}
+    
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='appointment_series')
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='appointment_series')
+    start_date = models.DateField()
+    appointment_time = models.TimeField()
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='WEEKLY')
+    occurrences = models.PositiveSmallIntegerField(
+        default=10, validators=[MinValueValidator(2), MaxValueValidator(52)]
+    )
+    notes = models.TextField(blank=True)
+    timezone = models.CharField(max_length=50, default='UTC', validators=[validate_timezone])
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'appointment series'
+    
+    def __str__(self):
+        return f"{self.occurrences} x {self.get_frequency_display().lower()} {self.patient.get_full_name()} with {self.doctor.get_full_name()} from {self.start_date}"
+    
+    def get_dates(self):
+        step = timedelta(days=self.INTERVAL_DAYS[self.frequency])
+        return [self.start_date + step * i for i in range(self.occurrences)]
+
+
+class ArchivedAppointment(models.Model):
+    """
+    Past completed and cancelled appointments, moved out of Appointment by
+    ``manage.py archive_appointments`` (see patients.archive). Rows keep the
+    id and timestamps they had in Appointment.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='archived_appointments')
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='archived_appointments')
+    appointment_date = models.DateField()
+    appointment_time = models.TimeField()
+    status = models.CharField(max_length=10, choices=Appointment.STATUS_CHOICES)
+    notes = models.TextField(blank=True)
+    timezone = models.CharField(max_length=50, default='UTC')
+    starts_at = models.DateTimeField(null=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['appointment_date', 'appointment_time']
+        indexes = [
+            models.Index(fields=['patient', 'appointment_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.patient.get_full_name()} with {self.doctor.get_full_name()} on {self.appointment_date} at {self.appointment_time} (archived)"
+
+
+class DataVersion(models.Model):
+    """
+    A counter bumped whenever the rows behind a per-process copy change, so
+    every worker can tell its copy is stale (see patients.directory).
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name} v{self.version}"
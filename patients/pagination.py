@@ -0,0 +1,251 @@
+import base64
+import binascii
+import json
+from bisect import bisect_left, bisect_right
+from functools import cmp_to_key
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """A single page of results produced by KeysetPaginator"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # Only filled in when the exact count is explicitly requested
+        self.count = None
+        self.next_query = ''
+        self.previous_query = ''
+        self.count_query = ''
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def set_links(self, params):
+        """Build next/previous query strings that keep the current filters"""
+        params = params.copy()
+        params.pop('cursor', None)
+        if self.has_next:
+            params['cursor'] = self.next_cursor
+            self.next_query = params.urlencode()
+        if self.has_previous:
+            params['cursor'] = self.previous_cursor
+            self.previous_query = params.urlencode()
+        params.pop('cursor', None)
+        params['count'] = '1'
+        self.count_query = params.urlencode()
+
+
+def _ordering_keys(model, ordering):
+    ordering = list(ordering or model._meta.ordering)
+    if not any(name.lstrip('-') in ('pk', 'id') for name in ordering):
+        ordering.append('-pk' if ordering and ordering[0].startswith('-') else 'pk')
+    keys = []
+    for name in ordering:
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+        keys.append((name, field, descending))
+    return keys
+
+
+class KeysetPaginator:
+    """
+    Cursor based paginator keyed on the queryset ordering.
+
+    Pages are fetched with a WHERE clause on the ordering columns instead of
+    an OFFSET, so every page costs the same regardless of how deep it is and
+    no COUNT(*) is needed to render navigation. The primary key is appended
+    to the ordering as a tie-breaker so cursors stay stable when several rows
+    share the same key.
+    """
+
+    def __init__(self, queryset, ordering=None, per_page=DEFAULT_PAGE_SIZE):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.keys = _ordering_keys(queryset.model, ordering or queryset.query.order_by)
+
+    def encode_cursor(self, obj, direction):
+        values = [field.value_to_string(obj) for name, field, descending in self.keys]
+        payload = json.dumps([direction, values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if direction not in ('n', 'p') or len(values) != len(self.keys):
+                raise InvalidCursor(cursor)
+            values = [field.to_python(value) for (name, field, descending), value in zip(self.keys, values)]
+        except (ValueError, TypeError, binascii.Error, ValidationError):
+            raise InvalidCursor(cursor)
+        return direction, values
+
+    def _seek(self, values, forward):
+        # (a, b, c) > (x, y, z) expanded into an OR of prefix matches, with
+        # the comparison flipped for descending columns
+        condition = Q()
+        for i, (name, field, descending) in enumerate(self.keys):
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{f'{name}__{lookup}': values[i]})
+            for j in range(i):
+                term &= Q(**{self.keys[j][0]: values[j]})
+            condition |= term
+        return condition
+
+    def page_queryset(self, cursor=None):
+        """Return the (unevaluated) queryset for the page after ``cursor``"""
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+        else:
+            direction, values = 'n', None
+        forward = direction == 'n'
+        ordering = [
+            ('-' if descending == forward else '') + name
+            for name, field, descending in self.keys
+        ]
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        return queryset.order_by(*ordering)[:self.per_page + 1]
+
+    def build_page(self, rows, cursor=None):
+        """Turn the rows fetched with page_queryset() into a KeysetPage"""
+        direction = self.decode_cursor(cursor)[0] if cursor else 'n'
+        rows = list(rows)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'p':
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows)
+        if direction == 'n':
+            has_next, has_previous = has_more, cursor is not None
+        else:
+            has_next, has_previous = True, has_more
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], 'n') if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], 'p') if has_previous else None,
+        )
+
+    def page(self, cursor=None):
+        return self.build_page(self.page_queryset(cursor), cursor)
+
+    def count(self):
+        return self.queryset.count()
+
+
+class ListKeysetPaginator(KeysetPaginator):
+    """
+    KeysetPaginator over ``rows``, a list of ``model`` rows (or records with
+    the same attributes) already sorted by ``ordering``, such as the doctor
+    directory. Cursors are interchangeable with the queryset paginator's.
+    """
+
+    def __init__(self, rows, model, ordering=None, per_page=DEFAULT_PAGE_SIZE):
+        self.rows = rows
+        self.per_page = per_page
+        self.keys = _ordering_keys(model, ordering)
+        self._sort_key = cmp_to_key(self._compare)
+
+    def _compare(self, left, right):
+        for (name, field, descending), a, b in zip(self.keys, left, right):
+            if a != b:
+                return (a > b) - (a < b) if not descending else (a < b) - (a > b)
+        return 0
+
+    def _values(self, row):
+        return self._sort_key([getattr(row, name) for name, field, descending in self.keys])
+
+    def page_queryset(self, cursor=None):
+        """The rows of the page after ``cursor``, in the order build_page() expects"""
+        if not cursor:
+            return self.rows[:self.per_page + 1]
+        direction, values = self.decode_cursor(cursor)
+        if direction == 'n':
+            start = bisect_right(self.rows, self._sort_key(values), key=self._values)
+            return self.rows[start:start + self.per_page + 1]
+        end = bisect_left(self.rows, self._sort_key(values), key=self._values)
+        return self.rows[max(0, end - self.per_page - 1):end][::-1]
+
+    def count(self):
+        return len(self.rows)
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE):
+    try:
+        per_page = int(request.GET.get('per_page', default))
+    except ValueError:
+        return default
+    return max(1, min(per_page, MAX_PAGE_SIZE))
+
+
+def _valid_cursor(paginator, request):
+    cursor = request.GET.get('cursor') or None
+    if cursor:
+        try:
+            paginator.decode_cursor(cursor)
+        except InvalidCursor:
+            return None
+    return cursor
+
+
+def _paginate(request, paginator):
+    cursor = _valid_cursor(paginator, request)
+    page = paginator.page(cursor)
+    if request.GET.get('count') == '1':
+        page.count = paginator.count()
+    page.set_links(request.GET)
+    return page
+
+
+def paginate(request, queryset, ordering=None):
+    """
+    Paginate ``queryset`` for a list view.
+
+    The cursor comes from ``?cursor=``; an invalid or stale cursor falls back
+    to the first page. The exact total is only computed when the request asks
+    for it with ``?count=1``.
+    """
+    return _paginate(request, KeysetPaginator(queryset, ordering=ordering, per_page=get_page_size(request)))
+
+
+def paginate_list(request, rows, model, ordering=None):
+    """``paginate()`` for a sorted list of rows (see ListKeysetPaginator)"""
+    return _paginate(request, ListKeysetPaginator(rows, model, ordering=ordering, per_page=get_page_size(request)))
+
+
+async def apaginate(request, queryset, ordering=None):
+    """``paginate()`` for async views"""
+    paginator = KeysetPaginator(queryset, ordering=ordering, per_page=get_page_size(request))
+    cursor = _valid_cursor(paginator, request)
+    page = paginator.build_page([row async for row in paginator.page_queryset(cursor)], cursor)
+    if request.GET.get('count') == '1':
+        page.count = await paginator.queryset.acount()
+    page.set_links(request.GET)
+    return page
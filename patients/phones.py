@@ -0,0 +1,72 @@
+"""
+Phone number normalization and caller-ID lookups.
+
+Numbers are stored as typed in ``phone_number`` and, for lookups, as their
+digits only (``phone_digits``) and those digits reversed
+(``phone_digits_reversed``); both columns are indexed. An incoming number
+matches a record when the digits are equal, or when one is a suffix of the
+other (a caller's full international number against a locally formatted
+record, or the other way round):
+
+- stored number is a suffix of the incoming one: ``phone_digits IN`` the
+  incoming number's suffixes;
+- incoming number is a suffix of the stored one: a range on the reversed
+  column, ``reversed >= r AND reversed < r || ':'`` (':' sorts right after
+  '9').
+
+All three are index seeks, so a lookup costs O(log n) whatever the table
+size.
+"""
+import re
+
+from django.db.models import Q
+
+# Shorter suffixes match too many unrelated numbers
+MIN_SUFFIX_DIGITS = 7
+MAX_MATCHES = 20
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_phone(value):
+    """Digits only, without the international call prefix ("+" or "00")"""
+    digits = _NON_DIGITS.sub('', value or '')
+    if digits.startswith('00'):
+        digits = digits[2:]
+    return digits
+
+
+def lookup_condition(digits):
+    reversed_digits = digits[::-1]
+    condition = Q(phone_digits=digits)
+    suffixes = [digits[i:] for i in range(1, len(digits) - MIN_SUFFIX_DIGITS + 1)]
+    if suffixes:
+        condition |= Q(phone_digits__in=suffixes)
+    if len(digits) >= MIN_SUFFIX_DIGITS:
+        condition |= Q(phone_digits_reversed__gte=reversed_digits, phone_digits_reversed__lt=reversed_digits + ':')
+    return condition
+
+
+def lookup(queryset, phone, limit=MAX_MATCHES):
+    """
+    Rows of ``queryset`` whose number matches ``phone``, as
+    ``[(row, 'exact' | 'suffix')]`` with exact matches first.
+    """
+    digits = normalize_phone(phone)
+    if not digits:
+        return []
+    return _label(list(queryset.filter(lookup_condition(digits)).order_by('pk')[:limit]), digits)
+
+
+async def alookup(queryset, phone, limit=MAX_MATCHES):
+    """``lookup()`` for async views"""
+    digits = normalize_phone(phone)
+    if not digits:
+        return []
+    return _label([row async for row in queryset.filter(lookup_condition(digits)).order_by('pk')[:limit]], digits)
+
+
+def _label(rows, digits):
+    matches = [(row, 'exact' if row.phone_digits == digits else 'suffix') for row in rows]
+    matches.sort(key=lambda match: match[1] != 'exact')
+    return matches
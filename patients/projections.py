@@ -0,0 +1,61 @@
+"""
+Slim querysets for the list pages.
+
+Each projection loads only the columns its template renders, joins the
+relations it displays with select_related (doctors come from the doctor
+directory instead), and computes display values in SQL so rendering a page
+never triggers per-row queries. Ordering columns are
+always kept because the keyset paginator reads them to build cursors.
+"""
+from datetime import date
+
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import ExtractYear
+
+from .models import Patient, Appointment
+
+PATIENT_LIST_FIELDS = (
+    'first_name', 'last_name', 'date_of_birth', 'gender',
+    'phone_number', 'email', 'created_at',
+)
+
+# Doctors are attached from the doctor directory (directory.attach_doctors)
+APPOINTMENT_LIST_FIELDS = (
+    'appointment_date', 'appointment_time', 'status', 'timezone', 'doctor',
+    'patient__first_name', 'patient__last_name',
+)
+
+UPCOMING_APPOINTMENT_FIELDS = (
+    'appointment_date', 'appointment_time', 'status',
+    'patient__first_name', 'patient__last_name',
+)
+
+
+def age_expression(today=None):
+    """SQL equivalent of Patient.get_age()"""
+    today = today or date.today()
+    birthday_pending = (
+        Q(date_of_birth__month__gt=today.month) |
+        Q(date_of_birth__month=today.month, date_of_birth__day__gt=today.day)
+    )
+    return Value(today.year) - ExtractYear('date_of_birth') - Case(
+        When(birthday_pending, then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def patient_list_queryset(queryset=None):
+    if queryset is None:
+        queryset = Patient.objects.all()
+    return queryset.only(*PATIENT_LIST_FIELDS).annotate(age=age_expression())
+
+
+def appointment_list_queryset(queryset=None):
+    if queryset is None:
+        queryset = Appointment.objects.all()
+    return queryset.select_related('patient').only(*APPOINTMENT_LIST_FIELDS)
+
+
+def upcoming_appointment_queryset(queryset):
+    return queryset.select_related('patient').only(*UPCOMING_APPOINTMENT_FIELDS)
@@ -0,0 +1,31 @@
+"""
+Appointments by their real start time, across time zones.
+
+Queries use the indexed UTC ``starts_at`` column, so "everything starting
+in the next two hours" is one index range scan whatever zones the
+appointments were booked in.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Appointment
+
+DEFAULT_WINDOW = timedelta(hours=2)
+
+
+def starting_between(start, end, queryset=None):
+    """Active appointments with ``start <= starts_at < end``, soonest first"""
+    if queryset is None:
+        queryset = Appointment.objects.all()
+    return (
+        queryset.filter(starts_at__gte=start, starts_at__lt=end)
+        .exclude(status__in=['CANCELLED', 'COMPLETED'])
+        .select_related('patient', 'doctor')
+        .order_by('starts_at')
+    )
+
+
+def due_reminders(within=DEFAULT_WINDOW, now=None):
+    now = now or timezone.now()
+    return starting_between(now, now + within)
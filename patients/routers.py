@@ -0,0 +1,86 @@
+"""
+Primary/replica database routing.
+
+Writes always go to ``default``. Reads go to one of the aliases listed in
+``settings.DATABASE_REPLICAS`` unless they are pinned to the primary, which
+happens:
+
+- inside ``pin_primary()``, for reads that must not see replication lag
+  (booking conflict checks, filling the availability cache);
+- for requests that are not GET/HEAD/OPTIONS, and for the rest of any
+  request once it has written;
+- for requests from a client that wrote within the last
+  ``REPLICA_STICKY_SECONDS`` (see ``ReplicaRoutingMiddleware``), so users see
+  their own writes.
+
+Without ``DATABASE_REPLICAS`` every read goes to ``default``.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY = 'default'
+# Apps whose rows are always read from the primary: a session created on the
+# primary and missing from a lagging replica would log the user out
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_pinned = ContextVar('pin_primary', default=False)
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+class RequestState:
+    def __init__(self):
+        self.wrote = False
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextmanager
+def pin_primary(pinned=True):
+    """Send reads in this block (and this context) to the primary"""
+    token = _pinned.set(pinned or _pinned.get())
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextmanager
+def track_request(pinned=False):
+    """Route one request; the yielded state records whether it wrote"""
+    state = RequestState()
+    state_token = _request_state.set(state)
+    try:
+        with pin_primary(pinned):
+            yield state
+    finally:
+        _request_state.reset(state_token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        state = _request_state.get()
+        if not replicas or _pinned.get() or (state is not None and state.wrote):
+            return PRIMARY
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas are copies of the primary, so any pair of rows can relate
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema together with the data from the primary
+        return db not in replica_aliases()
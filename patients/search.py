@@ -0,0 +1,294 @@
+"""
+Full-text search over patients and doctors.
+
+On SQLite the searchable columns are mirrored into FTS5 tables (created by
+migration 0004) that are kept in sync by triggers, so bulk inserts and
+queryset updates are indexed as well as regular saves. Every token in the query is
+matched as a prefix and all tokens must match, e.g. "smi jo" finds
+"John Smith". Other database backends fall back to the original
+``icontains`` filters.
+
+The cost of a search stays flat as the tables grow:
+
+- The index keeps prefix entries for two and three characters, so words of
+  at least ``MIN_TOKEN_LENGTH`` letters are looked up directly. One-letter
+  words are left out of the match, and a query made only of them goes to
+  the lowercased name indexes instead (see ``name_prefix_search``).
+- A filter takes at most the newest ``MAX_MATCHES`` matches, so "jo" doesn't
+  hand the list query an id set covering a tenth of the table. Ranked
+  searches rank within those same matches.
+"""
+import re
+import sys
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.db.models.expressions import RawSQL
+
+from .models import Patient, Doctor
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TOKENS = 8
+# The shortest word looked up in the FTS index; its prefix indexes cover
+# two and three characters (migration 0004)
+MIN_TOKEN_LENGTH = 2
+MAX_MATCHES = 1000
+PHONE_DIGITS_SQL = (
+    "replace(replace(replace(replace(replace(replace("
+    "{row}.phone_number, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', '')"
+)
+
+
+class SearchIndex:
+    def __init__(self, model, table, columns, fallback_fields):
+        self.model = model
+        self.table = table
+        # FTS column name -> SQL expression over a source row, with {row}
+        # standing for the row alias ("new" inside triggers)
+        self.columns = columns
+        self.fallback_fields = fallback_fields
+
+    def _insert_sql(self, row):
+        names = ', '.join(self.columns)
+        values = ', '.join(expression.format(row=row) for expression in self.columns.values())
+        return f'INSERT INTO {self.table} (rowid, {names}) SELECT {row}.id, {values}'
+
+    def trigger_sql(self):
+        source = self.model._meta.db_table
+        watched = ', '.join(self.watched_columns)
+        return [
+            f'CREATE TRIGGER IF NOT EXISTS {self.table}_ai AFTER INSERT ON {source} BEGIN '
+            f'{self._insert_sql("new")}; END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.table}_ad AFTER DELETE ON {source} BEGIN '
+            f'DELETE FROM {self.table} WHERE rowid = old.id; END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.table}_au AFTER UPDATE OF {watched} ON {source} BEGIN '
+            f'DELETE FROM {self.table} WHERE rowid = old.id; {self._insert_sql("new")}; END',
+        ]
+
+    @property
+    def watched_columns(self):
+        return [self.model._meta.get_field(name).column for name in self.fallback_fields]
+
+    def install_triggers(self, using):
+        """
+        (Re)create the sync triggers.
+
+        SQLite migrations that alter a table rebuild it, which silently drops
+        its triggers, so this runs after every migrate.
+        """
+        connection = connections[using]
+        if connection.vendor != 'sqlite' or self.table not in connection.introspection.table_names():
+            return
+        with connection.cursor() as cursor:
+            for statement in self.trigger_sql():
+                cursor.execute(statement)
+
+    def uses_fts(self, using=None):
+        using = using or router.db_for_read(self.model)
+        return connections[using].vendor == 'sqlite'
+
+    def condition(self, query, relation=None, columns=None, using=None):
+        """
+        Q object matching ``query``, optionally through a foreign key
+        ``relation`` and restricted to some ``columns`` of the index.
+        """
+        if not self.uses_fts(using):
+            condition = Q()
+            for field in columns or self.fallback_fields:
+                lookup = f'{relation}__{field}__icontains' if relation else f'{field}__icontains'
+                condition |= Q(**{lookup: query})
+            return condition
+        lookup = f'{relation}__in' if relation else 'pk__in'
+        expression = build_match_expression(query, columns)
+        if not expression:
+            # Only one-letter words: each name index yields its first
+            # matches in name order
+            groups = _name_prefix_groups(self.model._default_manager.using(using), query)
+            condition = Q()
+            for matches in groups:
+                condition |= Q(**{lookup: matches.values('pk')[:MAX_MATCHES]})
+            return condition
+        ids = RawSQL(
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rowid DESC LIMIT %s',
+            [expression, MAX_MATCHES],
+        )
+        return Q(**{lookup: ids})
+
+    def filter(self, queryset, query):
+        """Restrict ``queryset`` to rows matching ``query``"""
+        if not query_tokens(query):
+            return queryset
+        return queryset.filter(self.condition(query, using=queryset.db))
+
+    def ranked_ids(self, query, limit=20, using=None):
+        """Return ids of the best ``limit`` matches, best match first"""
+        if not query_tokens(query):
+            return []
+        using = using or router.db_for_read(self.model)
+        queryset = self.model._default_manager.using(using)
+        if not self.uses_fts(using):
+            return list(self.filter(queryset, query).values_list('pk', flat=True)[:limit])
+        expression = build_match_expression(query)
+        if not expression:
+            return [row.pk for row in name_prefix_search(queryset.only('pk'), query, limit)]
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM (SELECT rowid, rank FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY rowid DESC LIMIT %s) ORDER BY rank LIMIT %s',
+                [expression, MAX_MATCHES, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def search(self, query, limit=20, using=None, fields=None):
+        """Return matching model instances ordered by relevance, optionally with only ``fields`` loaded"""
+        using = using or router.db_for_read(self.model)
+        queryset = self.model._default_manager.using(using)
+        if fields:
+            queryset = queryset.only(*fields)
+        if self.uses_fts(using) and query_tokens(query) and not build_match_expression(query):
+            # The name lookups already read the rows
+            return name_prefix_search(queryset, query, limit)
+        ids = self.ranked_ids(query, limit=limit, using=using)
+        if not ids:
+            return []
+        objects = queryset.in_bulk(ids)
+        return [objects[pk] for pk in ids if pk in objects]
+
+    def rebuild(self, using=None):
+        using = using or router.db_for_write(self.model)
+        if not self.uses_fts(using):
+            return 0
+        source = self.model._meta.db_table
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(f'{self._insert_sql(source)} FROM {source}')
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+            cursor.execute(f'SELECT count(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+
+patient_index = SearchIndex(
+    Patient,
+    table='patients_patient_fts',
+    columns={
+        'first_name': '{row}.first_name',
+        'last_name': '{row}.last_name',
+        'phone': "{row}.phone_number || ' ' || " + PHONE_DIGITS_SQL,
+        'email': "coalesce({row}.email, '')",
+    },
+    fallback_fields=['first_name', 'last_name', 'phone_number', 'email'],
+)
+
+doctor_index = SearchIndex(
+    Doctor,
+    table='patients_doctor_fts',
+    columns={
+        'first_name': '{row}.first_name',
+        'last_name': '{row}.last_name',
+        'specialization': '{row}.specialization',
+        'email': '{row}.email',
+    },
+    fallback_fields=['first_name', 'last_name', 'specialization', 'email'],
+)
+
+
+def query_tokens(query):
+    return TOKEN_RE.findall(query or '')[:MAX_TOKENS]
+
+
+def build_match_expression(query, columns=None):
+    """
+    Turn free text into an FTS5 query where every token is a prefix match,
+    leaving out tokens shorter than ``MIN_TOKEN_LENGTH``
+    """
+    tokens = [token for token in query_tokens(query) if len(token) >= MIN_TOKEN_LENGTH]
+    expression = ' '.join(f'"{token}"*' for token in tokens)
+    if expression and columns:
+        expression = '{%s} : (%s)' % (' '.join(columns), expression)
+    return expression
+
+
+def filter_patients(queryset, query):
+    return patient_index.filter(queryset, query)
+
+
+def filter_doctors(queryset, query):
+    return doctor_index.filter(queryset, query)
+
+
+def filter_appointments(queryset, query='', status='', date_from=None, date_to=None):
+    """The appointment_list filters: patient/doctor name, status and date range"""
+    if query_tokens(query):
+        names = ['first_name', 'last_name']
+        queryset = queryset.filter(
+            patient_index.condition(query, relation='patient', columns=names, using=queryset.db) |
+            doctor_index.condition(query, relation='doctor', columns=names, using=queryset.db)
+        )
+    if status:
+        queryset = queryset.filter(status=status)
+    if date_from:
+        queryset = queryset.filter(appointment_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(appointment_date__lte=date_to)
+    return queryset
+
+
+def search_patients(query, limit=20, fields=None):
+    return patient_index.search(query, limit=limit, fields=fields)
+
+
+def _prefix_range(alias, prefix):
+    # A range on the lowercased column instead of LIKE, which SQLite can't
+    # answer from an expression index
+    condition = Q(**{f'{alias}__gte': prefix})
+    # The upper bound bumps the last character that has a successor; a
+    # prefix of nothing but U+10FFFF has no upper bound
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if stem:
+        successor = ord(stem[-1]) + 1
+        if 0xD800 <= successor <= 0xDFFF:
+            # Surrogates can't be encoded as UTF-8; text sorts by code point
+            successor = 0xE000
+        condition &= Q(**{f'{alias}__lt': stem[:-1] + chr(successor)})
+    return condition
+
+
+def name_prefix_search(queryset, query, limit):
+    """
+    Up to ``limit`` rows of ``queryset`` whose last name starts with the first
+    word of ``query`` and first name with the rest ("smi jo"), then those
+    matched the other way round ("jo smi"), each group in name order.
+
+    Unlike the FTS prefix match, which has to collect every row matching a
+    short prefix before ranking them, each group is read in order from the
+    lowercased name indexes and stops after ``limit`` rows, so one letter
+    costs as little as a full name.
+    """
+    found = []
+    for matches in _name_prefix_groups(queryset, query):
+        if found:
+            matches = matches.exclude(pk__in=[row.pk for row in found])
+        found += matches[:limit - len(found)]
+        if len(found) >= limit:
+            break
+    return found
+
+
+def _name_prefix_groups(queryset, query):
+    """The surname-first and first-name-first matches of ``query``, each in index order"""
+    words = (query or '').lower().split()
+    if not words:
+        return []
+    groups = []
+    for major, minor in (('last_name', 'first_name'), ('first_name', 'last_name')):
+        matches = queryset.alias(_major=Lower(major), _minor=Lower(minor)).filter(_prefix_range('_major', words[0]))
+        if len(words) > 1:
+            matches = matches.filter(_prefix_range('_minor', ' '.join(words[1:])))
+        groups.append(matches.order_by('_major', '_minor', 'pk'))
+    return groups
+
+
+def install_triggers(using='default', **kwargs):
+    for index in (patient_index, doctor_index):
+        index.install_triggers(using)
@@ -0,0 +1,226 @@
+"""
+Synthetic patients, doctors and appointments for load and benchmark runs.
+
+Rows are generated from a seeded ``random.Random`` so the same scale and seed
+always produce the same data, and written with ``bulk_create`` in batches,
+one transaction per batch. Appointments are laid out doctor-day by doctor-day
+over each doctor's working hours so they never violate the active-slot
+constraint: roughly two thirds in the past (completed or cancelled), the
+rest upcoming.
+"""
+import random
+from datetime import date, datetime, time, timedelta
+
+from django.db import router, transaction
+
+from . import availability, directory
+from .models import Patient, Doctor, Appointment
+from .routers import pin_primary
+from .timezones import local_to_utc
+
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+PATIENTS_PER_DOCTOR = 200
+APPOINTMENTS_PER_PATIENT = 2
+DEFAULT_BATCH_SIZE = 5000
+# Share of each doctor's slots that get booked
+FILL_RATE = 0.5
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+    'Daniel', 'Nancy', 'Matthew', 'Lisa', 'Anthony', 'Betty', 'Mark', 'Margaret', 'Steven', 'Sandra',
+    'Ahmed', 'Fatima', 'Wei', 'Mei', 'Carlos', 'Sofia', 'Hiroshi', 'Yuki', 'Ivan', 'Olga',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson',
+    'Khan', 'Ahmed', 'Chen', 'Wang', 'Tanaka', 'Sato', 'Ivanov', 'Petrov', 'Muller', 'Schmidt',
+]
+STREETS = ['Main Street', 'Oak Avenue', 'Maple Drive', 'Cedar Lane', 'Park Road', 'Elm Street', 'Lake View', 'Hill Road']
+CITIES = ['Springfield', 'Riverside', 'Franklin', 'Greenville', 'Fairview', 'Madison', 'Georgetown', 'Salem']
+CONDITIONS = ['Hypertension', 'Type 2 diabetes', 'Asthma', 'Migraine', 'Hypothyroidism', 'Arthritis', 'Eczema']
+MEDICATIONS = ['Lisinopril 10mg', 'Metformin 500mg', 'Albuterol inhaler', 'Levothyroxine 50mcg', 'Ibuprofen 200mg']
+ALLERGIES = ['Penicillin', 'Peanuts', 'Latex', 'Pollen', 'Shellfish', 'Sulfa drugs']
+NOTES = ['Follow-up visit', 'Annual check-up', 'Review test results', 'New symptoms', 'Prescription renewal', '']
+TIMEZONES = ['UTC', 'US/Eastern', 'US/Central', 'US/Pacific', 'Europe/London', 'Asia/Karachi']
+SHIFTS = [(time(8, 0), time(16, 0)), (time(9, 0), time(17, 0)), (time(10, 0), time(18, 0))]
+SLOT_LENGTHS = [15, 20, 30, 30, 60]
+
+
+def scale_counts(patients):
+    """Default doctor and appointment counts for a number of patients"""
+    return {
+        'patients': patients,
+        'doctors': max(5, patients // PATIENTS_PER_DOCTOR),
+        'appointments': patients * APPOINTMENTS_PER_PATIENT,
+    }
+
+
+def _phone(rng):
+    return f'+1 ({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}'
+
+
+def _pick_some(rng, choices, chance):
+    if rng.random() >= chance:
+        return ''
+    return ', '.join(rng.sample(choices, rng.randint(1, 2)))
+
+
+def generate_patients(rng, count, start=0, created_by=None):
+    today = date.today()
+    for number in range(start, start + count):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        patient = Patient(
+            first_name=first_name,
+            last_name=last_name,
+            date_of_birth=today - timedelta(days=rng.randint(365, 95 * 365)),
+            gender=rng.choice('MFO' if rng.random() < 0.02 else 'MF'),
+            email=f'{first_name}.{last_name}.{number}@example.com'.lower() if rng.random() < 0.8 else None,
+            phone_number=_phone(rng),
+            address=f'{rng.randint(1, 9999)} {rng.choice(STREETS)}, {rng.choice(CITIES)}',
+            medical_history=_pick_some(rng, CONDITIONS, 0.4),
+            current_medications=_pick_some(rng, MEDICATIONS, 0.3),
+            allergies=_pick_some(rng, ALLERGIES, 0.2),
+            created_by=created_by,
+        )
+        patient.set_phone_digits()
+        patient.set_name_dob_key()
+        yield patient
+
+
+def generate_doctors(rng, count, start=0):
+    specializations = [code for code, label in Doctor.SPECIALIZATION_CHOICES]
+    for number in range(start, start + count):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        work_start, work_end = rng.choice(SHIFTS)
+        doctor = Doctor(
+            first_name=first_name,
+            last_name=last_name,
+            specialization=rng.choice(specializations),
+            email=f'dr.{last_name}.{number}@clinic.example.com'.lower(),
+            phone_number=_phone(rng),
+            is_available=rng.random() < 0.95,
+            work_start=work_start,
+            work_end=work_end,
+            slot_minutes=rng.choice(SLOT_LENGTHS),
+        )
+        doctor.set_phone_digits()
+        yield doctor
+
+
+def generate_appointments(rng, count, doctors, patient_ids, today=None, created_by=None):
+    """
+    Yield ``count`` appointments spread over ``doctors`` (a list of Doctor
+    instances with their working hours) and ``patient_ids``.
+
+    Each doctor-day gets about ``FILL_RATE`` of its slots booked, so the date
+    range widens with the number of appointments per doctor.
+    """
+    today = today or date.today()
+    slots = {doctor.pk: availability.slot_times(doctor) for doctor in doctors}
+    per_day = sum(max(1, int(len(slots[doctor.pk]) * FILL_RATE)) for doctor in doctors)
+    days = max(1, -(-count // per_day))
+    first_day = today - timedelta(days=days * 2 // 3)
+    now = datetime.now()
+    made = 0
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        for doctor in doctors:
+            times = slots[doctor.pk]
+            for slot in sorted(rng.sample(times, max(1, int(len(times) * FILL_RATE)))):
+                if made >= count:
+                    return
+                if datetime.combine(day, slot) < now:
+                    status = 'CANCELLED' if rng.random() < 0.08 else 'COMPLETED'
+                else:
+                    status = 'CONFIRMED' if rng.random() < 0.4 else 'SCHEDULED'
+                zone = rng.choice(TIMEZONES)
+                yield Appointment(
+                    patient_id=rng.choice(patient_ids),
+                    doctor_id=doctor.pk,
+                    appointment_date=day,
+                    appointment_time=slot,
+                    starts_at=local_to_utc(day, slot, zone),
+                    status=status,
+                    notes=rng.choice(NOTES),
+                    timezone=zone,
+                    created_by=created_by,
+                )
+                made += 1
+
+
+def bulk_insert(model, objects, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Insert ``objects`` in batches, one transaction each; returns the count"""
+    using = router.db_for_write(model)
+    manager = model._default_manager.using(using)
+    total = 0
+    batch = []
+
+    def flush():
+        nonlocal total
+        with transaction.atomic(using=using):
+            manager.bulk_create(batch, batch_size=batch_size)
+        total += len(batch)
+        batch.clear()
+        if progress:
+            progress(model, total)
+
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return total
+
+
+def seed(patients, doctors=None, appointments=None, seed=0, batch_size=DEFAULT_BATCH_SIZE, progress=None,
+         created_by=None):
+    """
+    Add synthetic rows on top of whatever is already in the database and
+    return the number of rows written per model. Patients and appointments
+    are recorded as created by the ``created_by`` user, if given.
+    """
+    counts = scale_counts(patients)
+    if doctors is not None:
+        counts['doctors'] = doctors
+    if appointments is not None:
+        counts['appointments'] = appointments
+    rng = random.Random(seed)
+    # Counts and ids are read back to build the next model's rows, so they
+    # must come from the database being written to
+    with pin_primary():
+        return _seed(counts, rng, batch_size, progress, created_by)
+
+
+def _seed(counts, rng, batch_size, progress, created_by):
+    patient_start = Patient.objects.count()
+    doctor_start = Doctor.objects.count()
+    written = {
+        'patients': bulk_insert(Patient, generate_patients(rng, counts['patients'], patient_start, created_by), batch_size, progress),
+        'doctors': bulk_insert(Doctor, generate_doctors(rng, counts['doctors'], doctor_start), batch_size, progress),
+        'appointments': 0,
+    }
+    if written['doctors']:
+        # bulk_create sends no post_save
+        directory.invalidate()
+
+    if counts['appointments']:
+        # Only the new rows: older appointments would collide with the
+        # generated slots
+        doctor_list = list(Doctor.objects.only(*availability.DOCTOR_SCHEDULE_FIELDS).order_by('pk')[doctor_start:])
+        patient_ids = list(Patient.objects.order_by('pk').values_list('pk', flat=True))
+        if doctor_list and patient_ids:
+            written['appointments'] = bulk_insert(
+                Appointment,
+                generate_appointments(rng, counts['appointments'], doctor_list, patient_ids, created_by=created_by),
+                batch_size, progress,
+            )
+    # bulk_create sends no signals, so cached availability is dropped here
+    availability.get_cache().clear()
+    return written
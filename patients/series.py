@@ -0,0 +1,112 @@
+"""
+Booking recurring appointment series.
+
+All occurrences of a series are checked against the doctor's existing
+appointments with one query, which also yields the free slots used to
+suggest alternatives for the dates that clash. The series and its
+appointments are then written in one transaction, the appointments with a
+single ``bulk_create``. ``bulk_create`` skips ``Appointment.save()`` and the
+signal handlers, so ``starts_at`` is filled in here and the cached
+availability of the booked days is dropped on commit.
+"""
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+
+from . import availability
+from .models import Appointment
+from .timezones import local_to_utc
+
+MAX_ALTERNATIVES = 3
+
+
+class SeriesConflict(Exception):
+    """Some occurrences clash; ``conflicts`` maps each date to alternative free times"""
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(f'{len(conflicts)} session(s) clash with existing appointments.')
+
+
+def booked_on(doctor_id, dates, using=None):
+    """Map each of ``dates`` to the doctor's booked times, in one query"""
+    booked = {}
+    rows = Appointment.objects.using(using).filter(
+        doctor_id=doctor_id, appointment_date__in=dates,
+    ).exclude(status='CANCELLED').order_by().values_list('appointment_date', 'appointment_time')
+    for day, value in rows:
+        booked.setdefault(day, set()).add(value)
+    return booked
+
+
+def alternatives(doctor, day, wanted, booked, now, zone_name='UTC', limit=MAX_ALTERNATIVES):
+    """
+    Up to ``limit`` free slots of ``doctor`` on ``day`` closest to
+    ``wanted``, in time order, for bookings in ``zone_name``
+    """
+    slots = availability.slot_times(doctor)
+    mask = availability.free_mask(doctor, booked, slots)
+    mask = availability.hide_past_slots(doctor, day, mask, now, zone_name, slots)
+    free = [value for index, value in enumerate(slots) if mask & (1 << index)]
+    wanted_minutes = wanted.hour * 60 + wanted.minute
+    free.sort(key=lambda value: abs(value.hour * 60 + value.minute - wanted_minutes))
+    return sorted(free[:limit])
+
+
+def plan(series, overrides=None, skip=()):
+    """``[(date, time)]`` of the series, with ``overrides`` ({date: time}) and without ``skip``"""
+    overrides = overrides or {}
+    return [
+        (day, overrides.get(day, series.appointment_time))
+        for day in series.get_dates() if day not in skip
+    ]
+
+
+def book_series(series, overrides=None, skip=(), using=None, retry=True):
+    """
+    Save the unsaved ``series`` and create its appointments, or raise
+    SeriesConflict without writing anything if any occurrence clashes.
+    Returns the created appointments.
+    """
+    # The write alias, never a replica, as in booking.slot_is_taken
+    using = using or router.db_for_write(Appointment)
+    occurrences = plan(series, overrides, skip)
+    try:
+        with transaction.atomic(using=using):
+            booked = booked_on(series.doctor_id, [day for day, _ in occurrences], using)
+            clashes = [(day, value) for day, value in occurrences if value in booked.get(day, ())]
+            if clashes:
+                now = timezone.now()
+                raise SeriesConflict({
+                    day: alternatives(series.doctor, day, value, booked.get(day, ()), now, series.timezone)
+                    for day, value in clashes
+                })
+            series.save(using=using)
+            appointments = Appointment.objects.using(using).bulk_create([
+                Appointment(
+                    patient_id=series.patient_id,
+                    doctor_id=series.doctor_id,
+                    appointment_date=day,
+                    appointment_time=value,
+                    starts_at=local_to_utc(day, value, series.timezone),
+                    notes=series.notes,
+                    timezone=series.timezone,
+                    created_by=series.created_by,
+                    series=series,
+                )
+                for day, value in occurrences
+            ])
+    except IntegrityError:
+        # A slot was booked between the check and the insert; a second
+        # attempt sees it and reports it as a conflict
+        series.pk = None
+        if not retry:
+            raise
+        return book_series(series, overrides, skip, using, retry=False)
+
+    doctor_id, days = series.doctor_id, [day for day, _ in occurrences]
+
+    def invalidate():
+        for day in days:
+            availability.invalidate_day(doctor_id, day)
+    transaction.on_commit(invalidate, using=using)
+    return appointments
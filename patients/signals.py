@@ -0,0 +1,92 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import availability, conditional, directory
+from .models import Doctor, Appointment, Patient
+from .transitions import status_changed
+
+audit_logger = logging.getLogger('patients.audit')
+
+
+def _slot_key(appointment):
+    return appointment.doctor_id, appointment.appointment_date
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_slot(sender, instance, **kwargs):
+    # Keep the day the appointment was loaded with so moving it to another
+    # day or doctor also frees the day it left. Read the raw values: touching
+    # a field deferred by only() here would load it with another instance
+    # and recurse
+    values = instance.__dict__
+    instance._loaded_slot_key = values.get('doctor_id'), values.get('appointment_date')
+
+
+@receiver(post_save, sender=Appointment)
+def invalidate_appointment_availability(sender, instance, using, **kwargs):
+    keys = {_slot_key(instance), instance._loaded_slot_key}
+    instance._loaded_slot_key = _slot_key(instance)
+
+    def invalidate():
+        for doctor_id, day in keys:
+            if doctor_id is not None and day is not None:
+                availability.invalidate_day(doctor_id, day)
+    transaction.on_commit(invalidate, using=using)
+
+
+@receiver(post_delete, sender=Appointment)
+def invalidate_deleted_appointment_availability(sender, instance, using, **kwargs):
+    doctor_id, day = _slot_key(instance)
+    transaction.on_commit(lambda: availability.invalidate_day(doctor_id, day), using=using)
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_doctor_directory(sender, using, **kwargs):
+    # Not before the commit: a reload in between would read the change
+    # under the old version, or one that is then rolled back
+    transaction.on_commit(directory.invalidate, using=using)
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_doctor_availability(sender, instance, using, **kwargs):
+    doctor_id = instance.pk
+    transaction.on_commit(lambda: availability.invalidate_doctor(doctor_id), using=using)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def invalidate_cached_pages(sender, using, **kwargs):
+    transaction.on_commit(conditional.invalidate_pages, using=using)
+
+
+@receiver(status_changed, sender=Appointment)
+def invalidate_cached_pages_after_transition(sender, **kwargs):
+    conditional.invalidate_pages()
+
+
+@receiver(status_changed, sender=Appointment)
+def invalidate_transitioned_availability(sender, appointments, status, **kwargs):
+    # Sent on commit, so the days can be dropped right away. Only a
+    # cancellation frees a slot; the other moves keep it taken
+    if status != 'CANCELLED':
+        return
+    for doctor_id, day in {(row.doctor_id, row.appointment_date) for row in appointments}:
+        availability.invalidate_day(doctor_id, day)
+
+
+@receiver(status_changed, sender=Appointment)
+def audit_status_change(sender, appointments, status, user=None, **kwargs):
+    audit_logger.info(
+        'Status of %d appointment(s) set to %s by %s: %s',
+        len(appointments), status, user.get_username() if user else 'system',
+        ', '.join(f'{row.pk} ({row.previous_status})' for row in appointments),
+    )
@@ -0,0 +1,6 @@
+// Reloads the changelist when a value is picked in an autocomplete filter
+// (see AutocompleteFilter in patients/admin.py); clearing it drops the filter
+django.jQuery(document).on('change', '.autocomplete-filter select', function () {
+    this.disabled = !this.value;
+    this.form.submit();
+});
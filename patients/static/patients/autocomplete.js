@@ -0,0 +1,43 @@
+// Fills the select following each search box with the matches of its
+// autocomplete endpoint (see patients/autocomplete.py) as the user types
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('input[data-autocomplete-url]').forEach(function (input) {
+        var select = document.getElementById(input.dataset.autocompleteFor);
+        var timer = null;
+        var latest = 0;
+
+        function show(data) {
+            var blank = select.querySelector('option[value=""]');
+            select.innerHTML = '';
+            if (blank) {
+                select.add(blank);
+            }
+            data.results.forEach(function (result) {
+                select.add(new Option(result.text, result.id));
+            });
+            if (data.more) {
+                var more = new Option('Keep typing to narrow down...', '');
+                more.disabled = true;
+                select.add(more);
+            }
+            if (data.results.length) {
+                select.value = String(data.results[0].id);
+            }
+        }
+
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () {
+                var request = ++latest;
+                fetch(input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(input.value), {credentials: 'same-origin'})
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        // Answers can arrive out of order; only the last one counts
+                        if (request === latest) {
+                            show(data);
+                        }
+                    });
+            }, 200);
+        });
+    });
+});
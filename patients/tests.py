@@ -1,3 +1,1344 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from patient_management_system.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+
+from . import (
+    admin as patients_admin, archive, autocomplete, availability, benchmark, conditional, directory, duplicates, routers, search, seeding,
+    transitions, urls, views,
+)
+from .booking import SLOT_TAKEN_MESSAGE, SlotTaken, save_appointment
+from .forms import AppointmentForm
+from .metrics import registry
+from .models import Patient, Doctor, Appointment, AppointmentSeries, ArchivedAppointment
+from .pagination import KeysetPaginator, ListKeysetPaginator
+from .projections import patient_list_queryset
+from .reminders import due_reminders
+from .routers import PrimaryReplicaRouter
+from .series import alternatives
+from .search import filter_doctors, filter_patients, name_prefix_search, search_patients
+from .timezones import get_zone
+
+
+def make_patient(**kwargs):
+    fields = {
+        'first_name': 'John',
+        'last_name': 'Smith',
+        'date_of_birth': date(1980, 5, 17),
+        'gender': 'M',
+        'email': 'john.smith@example.com',
+        'phone_number': '+1 (555) 123-4567',
+        'address': '1 Main Street',
+    }
+    fields.update(kwargs)
+    return Patient.objects.create(**fields)
+
+
+def make_doctor(**kwargs):
+    fields = {
+        'first_name': 'Alice',
+        'last_name': 'Jones',
+        'specialization': 'CARD',
+        'email': 'alice.jones@example.com',
+        'phone_number': '555-987-6543',
+    }
+    fields.update(kwargs)
+    # Run the on-commit invalidation of the doctor directory, as a real
+    # commit would
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        return Doctor.objects.create(**fields)
+
+
+def make_appointment(patient, doctor, days=1, hour=9, **kwargs):
+    kwargs.setdefault('created_by', User.objects.get_or_create(username='booker')[0])
+    kwargs.setdefault('appointment_date', date.today() + timedelta(days=days))
+    kwargs.setdefault('appointment_time', time(hour, 0))
+    return Appointment.objects.create(patient=patient, doctor=doctor, **kwargs)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def walk(self, paginator):
+        seen = []
+        page = paginator.page()
+        while True:
+            seen.extend(obj.pk for obj in page)
+            if not page.has_next:
+                return seen, page
+            page = paginator.page(page.next_cursor)
+
+    def test_forward_and_backward_walk_matches_ordering(self):
+        for i in range(7):
+            make_patient(first_name=f'P{i}')
+        expected = list(Patient.objects.values_list('pk', flat=True))
+        paginator = KeysetPaginator(Patient.objects.all(), per_page=3)
+        seen, last_page = self.walk(paginator)
+        self.assertEqual(seen, expected)
+
+        previous = paginator.page(last_page.previous_cursor)
+        self.assertEqual([p.pk for p in previous], expected[3:6])
+        self.assertTrue(previous.has_next)
+
+    def test_appointment_ordering_with_ties(self):
+        patient = make_patient()
+        doctors = [make_doctor(email=f'd{i}@example.com') for i in range(3)]
+        for days in (1, 2):
+            for doctor in doctors:
+                make_appointment(patient, doctor, days=days)
+        expected = list(Appointment.objects.values_list('pk', flat=True))
+        seen, _ = self.walk(KeysetPaginator(Appointment.objects.all(), per_page=2))
+        self.assertEqual(seen, expected)
+
+    def test_list_view_keeps_filters_in_links_and_skips_count(self):
+        for i in range(4):
+            make_patient(first_name=f'Match{i}')
+        make_patient(first_name='Other')
+        response = self.client.get(reverse('patient_list'), {'q': 'Match', 'per_page': 2})
+        page = response.context['page']
+        self.assertEqual(len(page), 2)
+        self.assertIsNone(page.count)
+        self.assertIn('q=Match', page.next_query)
+
+        response = self.client.get(reverse('patient_list') + '?' + page.next_query)
+        self.assertEqual(len(response.context['page']), 2)
+        self.assertFalse(response.context['page'].has_next)
+
+        response = self.client.get(reverse('patient_list'), {'q': 'Match', 'count': '1'})
+        self.assertEqual(response.context['page'].count, 4)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        make_patient()
+        response = self.client.get(reverse('appointment_list'), {'cursor': 'not-a-cursor', 'status': 'SCHEDULED'})
+        self.assertEqual(response.status_code, 200)
+
+
+class ListProjectionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def test_sql_age_matches_model(self):
+        born = date.today().replace(year=date.today().year - 30) + timedelta(days=1)
+        patient = make_patient(date_of_birth=born)
+        row = patient_list_queryset().get(pk=patient.pk)
+        self.assertEqual(row.age, patient.get_age())
+        self.assertIn('medical_history', row.get_deferred_fields())
+
+    def test_appointment_list_queries_do_not_grow_with_rows(self):
+        doctor = make_doctor()
+        make_appointment(make_patient(), doctor, days=1)
+        directory.get_directory()
+        with self.assertNumQueries(4):
+            self.client.get(reverse('appointment_list'))
+        for days in range(2, 12):
+            make_appointment(make_patient(), doctor, days=days)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('appointment_list'))
+        self.assertContains(response, 'Dr. Alice Jones', count=11)
+
+    def test_doctor_detail_with_deferred_upcoming_appointments(self):
+        doctor = make_doctor()
+        make_appointment(make_patient(), doctor, days=1)
+        response = self.client.get(reverse('doctor_detail', args=[doctor.pk]))
+        self.assertContains(response, 'John Smith')
+
+
+class SearchIndexTests(TestCase):
+    def test_prefix_multi_token_search_is_ranked(self):
+        john = make_patient(first_name='John', last_name='Smith', phone_number='020 7946 0018')
+        make_patient(first_name='Jane', last_name='Smithers', email='jane@example.com')
+        make_patient(first_name='Bob', last_name='Brown', email='bob@example.com')
+        self.assertEqual(search_patients('smi jo'), [john])
+        self.assertEqual(set(filter_patients(Patient.objects.all(), 'smi')), set(Patient.objects.filter(last_name__startswith='Smith')))
+        self.assertEqual(list(filter_patients(Patient.objects.all(), '0207946')), [john])
+
+    def test_index_follows_updates_and_deletes(self):
+        patient = make_patient(first_name='John', last_name='Smith', email=None)
+        patient.last_name = 'Walker'
+        patient.save()
+        self.assertEqual(search_patients('smith'), [])
+        self.assertEqual(search_patients('walk'), [patient])
+        patient.delete()
+        self.assertEqual(search_patients('walk'), [])
+
+    def test_one_letter_queries_use_the_name_indexes_and_matches_are_bounded(self):
+        john = make_patient(first_name='John', last_name='Smith')
+        jane = make_patient(first_name='Jane', last_name='Smithers', email='jane@example.com')
+        jack = make_patient(first_name='Jack', last_name='Jones', email='jack@example.com')
+        make_patient(first_name='Bob', last_name='Brown', email='bob@example.com')
+        self.assertEqual(set(filter_patients(Patient.objects.all(), 'j')), {john, jane, jack})
+        self.assertEqual(search_patients('j'), [jack, jane, john])
+        # One-letter words are left out of a longer query
+        self.assertEqual(set(filter_patients(Patient.objects.all(), 'smith j')), {john, jane})
+        with mock.patch.object(search, 'MAX_MATCHES', 1):
+            self.assertEqual(list(filter_patients(Patient.objects.all(), 'smi')), [jane])
+            # Jack is first in both name indexes
+            self.assertEqual(list(filter_patients(Patient.objects.all(), 'j')), [jack])
+
+    def test_search_endpoint_returns_ranked_matches(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123'))
+        john = make_patient(first_name='John', last_name='Smith')
+        make_patient(first_name='Jane', last_name='Smithers', email='jane@example.com')
+        response = self.client.get(reverse('patient_search'), {'q': 'smi jo'})
+        self.assertEqual(
+            [(row['id'], row['name']) for row in response.json()['results']], [(john.pk, 'John Smith')],
+        )
+        self.assertEqual(len(self.client.get(reverse('patient_search'), {'q': 'smi'}).json()['results']), 2)
+
+    def test_rebuild_command(self):
+        doctor = make_doctor()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(list(filter_doctors(Doctor.objects.all(), 'card ali')), [doctor])
+
+    def test_triggers_survive_table_rebuilds(self):
+        # Migrations that add columns rebuild the table on SQLite, dropping
+        # its triggers; they are reinstalled after migrate
+        doctor = make_doctor(last_name='Rebuilt')
+        self.assertEqual(list(filter_doctors(Doctor.objects.all(), 'rebuilt')), [doctor])
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.patient = make_patient()
+        self.doctor = make_doctor()
+        availability.get_cache().clear()
+        availability.cache_stats.reset()
+
+    def test_multi_doctor_range_uses_one_appointment_query(self):
+        other = make_doctor(email='b@example.com', work_start=time(8, 0), work_end=time(10, 0), slot_minutes=30)
+        make_appointment(self.patient, self.doctor, days=1, hour=10)
+        make_appointment(self.patient, other, days=2, hour=8, status='CANCELLED')
+        Appointment.objects.create(
+            patient=self.patient, doctor=other, created_by=self.user,
+            appointment_date=date.today() + timedelta(days=2), appointment_time=time(9, 40),
+        )
+        start = date.today() + timedelta(days=1)
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('doctor_availability'), {
+                'doctor': f'{self.doctor.pk},{other.pk}', 'start': start.isoformat(), 'days': 3,
+            })
+        doctors = {row['id']: row for row in response.json()['doctors']}
+        self.assertEqual(doctors[self.doctor.pk]['free'][start.isoformat()], '10111111')
+        other_row = doctors[other.pk]
+        self.assertEqual(other_row['slots'], ['08:00', '08:30', '09:00', '09:30'])
+        self.assertEqual(other_row['free'][(start + timedelta(days=1)).isoformat()], '1110')
+
+    def test_unavailable_doctor_has_no_free_slots(self):
+        day = date.today() + timedelta(days=3)
+        self.client.get(reverse('available_time_slots', args=[self.doctor.pk, day.isoformat()]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.is_available = False
+            self.doctor.save()
+        response = self.client.get(reverse('available_time_slots', args=[self.doctor.pk, day.isoformat()]))
+        self.assertFalse(any(slot['available'] for slot in response.json()['time_slots']))
+
+    def test_invalid_parameters(self):
+        response = self.client.get(reverse('available_time_slots', args=[self.doctor.pk, 'tomorrow']))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('doctor_availability'), {'doctor': self.doctor.pk, 'days': 90})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('doctor_availability'), {'doctor': self.doctor.pk, 'timezone': 'Mars/Olympus'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_started_slots_follow_the_booking_time_zone(self):
+        doctor = make_doctor(email='hourly@example.com', work_start=time(9, 0), work_end=time(17, 0), slot_minutes=60)
+        today = timezone.now().date()
+        now = datetime.combine(today, time(12, 30), tzinfo=dt_timezone.utc)
+        expected = {
+            # 12:30 in UTC, 21:30 in Tokyo, 07:30 or 08:30 in New York and
+            # 02:30 the next day in Kiritimati
+            'UTC': ['00001111', '11111111'],
+            'Asia/Tokyo': ['00000000', '11111111'],
+            'America/New_York': ['11111111', '11111111'],
+            'Pacific/Kiritimati': ['00000000', '11111111'],
+        }
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            for zone_name, free in expected.items():
+                with self.subTest(zone=zone_name):
+                    response = self.client.get(reverse('doctor_availability'), {
+                        'doctor': doctor.pk, 'start': today.isoformat(), 'days': 2, 'timezone': zone_name,
+                    })
+                    days = response.json()['doctors'][0]['free']
+                    self.assertEqual([days[day.isoformat()] for day in (today, today + timedelta(days=1))], free)
+                    # What is offered is exactly what Appointment.clean accepts
+                    for index, value in enumerate(availability.slot_times(doctor)):
+                        appointment = Appointment(appointment_date=today, appointment_time=value, timezone=zone_name)
+                        try:
+                            appointment.clean()
+                            bookable = '1'
+                        except ValidationError:
+                            bookable = '0'
+                        self.assertEqual(free[0][index], bookable)
+            self.assertEqual(alternatives(doctor, today, time(13, 0), [], now, 'UTC'), [time(13), time(14), time(15)])
+            self.assertEqual(alternatives(doctor, today, time(13, 0), [], now, 'Asia/Tokyo'), [])
+
+    def free_slots(self, day):
+        masks = availability.compute_availability([self.doctor], [day])
+        return availability.mask_to_string(masks[self.doctor.pk][day], 8)
+
+    def test_cache_hits_and_signal_invalidation(self):
+        day = date.today() + timedelta(days=2)
+        self.assertEqual(self.free_slots(day), '11111111')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.free_slots(day), '11111111')
+        self.assertEqual(availability.cache_stats.as_dict(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = make_appointment(self.patient, self.doctor, days=2, hour=9)
+        self.assertEqual(self.free_slots(day), '01111111')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('appointment_cancel', args=[appointment.pk]))
+        self.assertEqual(self.free_slots(day), '11111111')
+
+    def test_moving_an_appointment_frees_the_old_day(self):
+        first, second = date.today() + timedelta(days=2), date.today() + timedelta(days=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = make_appointment(self.patient, self.doctor, days=2, hour=9)
+        self.assertEqual(self.free_slots(first), '01111111')
+        self.assertEqual(self.free_slots(second), '11111111')
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.get(pk=appointment.pk)
+            appointment.appointment_date = second
+            appointment.save()
+        self.assertEqual(self.free_slots(first), '11111111')
+        self.assertEqual(self.free_slots(second), '01111111')
+
+
+class BookingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.patient = make_patient()
+        self.doctor = make_doctor()
+        self.day = date.today() + timedelta(days=3)
+
+    def booking_data(self, **kwargs):
+        data = {
+            'patient': self.patient.pk, 'doctor': self.doctor.pk,
+            'appointment_date': self.day.isoformat(), 'appointment_time': '10:00',
+            'timezone': 'UTC', 'notes': '',
+        }
+        data.update(kwargs)
+        return data
+
+    def test_booking_is_validated_once_and_inserted(self):
+        self.client.get(reverse('patient_list'))
+        # session, user, patient, doctor directory version and rows,
+        # savepoint, insert, release
+        with self.assertNumQueries(8):
+            response = self.client.post(reverse('appointment_book'), self.booking_data())
+        self.assertEqual(response.status_code, 302)
+
+    def test_taken_slot_is_reported_and_cancelled_slot_can_be_rebooked(self):
+        self.client.post(reverse('appointment_book'), self.booking_data())
+        response = self.client.post(reverse('appointment_book'), self.booking_data())
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(response, SLOT_TAKEN_MESSAGE, status_code=409)
+
+        Appointment.objects.update(status='CANCELLED')
+        response = self.client.post(reverse('appointment_book'), self.booking_data())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_concurrent_bookings_for_the_same_slot(self):
+        forms = [AppointmentForm(self.booking_data()) for _ in range(2)]
+        self.assertTrue(all(form.is_valid() for form in forms))
+        first, second = (form.save(commit=False) for form in forms)
+        for appointment in (first, second):
+            appointment.created_by = self.user
+        save_appointment(first)
+        with self.assertRaises(SlotTaken):
+            save_appointment(second)
+
+
+class ImportRecordsTests(TestCase):
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+        return path
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_import_reports_bad_rows_and_keeps_going(self):
+        path = self.write('patients.csv', (
+            'first_name,last_name,date_of_birth,gender,email,phone_number,address\n'
+            'Ann,Lee,1990-01-02,F,,555 0100,1 Road\n'
+            'Bad,Row,01/02/1990,F,,555 0101,2 Road\n'
+            'Tom,Ray,1985-03-04,M,tom@example.com,555 0102,3 Road\n'
+        ))
+        stderr = StringIO()
+        call_command('import_records', 'patients', path, '--batch-size', '2', stdout=StringIO(), stderr=stderr)
+        self.assertEqual(sorted(Patient.objects.values_list('first_name', flat=True)), ['Ann', 'Tom'])
+        self.assertIn('line 3: date_of_birth', stderr.getvalue())
+        self.assertEqual(search_patients('lee'), list(Patient.objects.filter(last_name='Lee')))
+
+    def test_appointment_conflicts_in_file_and_database(self):
+        patient, doctor = make_patient(), make_doctor()
+        existing = make_appointment(patient, doctor, days=5, hour=9)
+        day = existing.appointment_date.isoformat()
+        rows = [
+            {'patient': patient.pk, 'doctor': doctor.pk, 'appointment_date': day, 'appointment_time': '09:00'},
+            {'patient': patient.pk, 'doctor': doctor.pk, 'appointment_date': day, 'appointment_time': '10:00'},
+            {'patient': patient.pk, 'doctor': doctor.pk, 'appointment_date': day, 'appointment_time': '11:00'},
+            {'patient': patient.pk, 'doctor': doctor.pk, 'appointment_date': day, 'appointment_time': '10:00'},
+            {'patient': 999, 'doctor': doctor.pk, 'appointment_date': day, 'appointment_time': '12:00'},
+        ]
+        path = self.write('appointments.ndjson', '\n'.join(json.dumps(row) for row in rows))
+        errors = os.path.join(self.tmpdir, 'errors.csv')
+        call_command('import_records', 'appointments', path, '--batch-size', '3', '--errors', errors, stdout=StringIO())
+        self.assertEqual(Appointment.objects.count(), 3)
+        with open(errors, encoding='utf-8') as handle:
+            rejected = {int(row['line']): row['errors'] for row in csv.DictReader(handle)}
+        self.assertEqual(sorted(rejected), [1, 4, 5])
+        self.assertIn('already booked', rejected[1])
+        self.assertIn('already booked', rejected[4])
+        self.assertIn('Patient does not exist', rejected[5])
+        self.assertFalse(Appointment.objects.filter(starts_at__isnull=True).exists())
+
+    def test_ndjson_lines_that_are_not_objects_are_row_errors(self):
+        doctor = {'first_name': 'Ann', 'last_name': 'Lee', 'specialization': 'CARD', 'email': 'ann@example.com',
+                  'phone_number': '555 0100'}
+        path = self.write('doctors.ndjson', '\n'.join([json.dumps(doctor), '[1, 2]', '"x"', '3', '{not json']))
+        errors = os.path.join(self.tmpdir, 'errors.csv')
+        directory.get_directory()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_records', 'doctors', path, '--errors', errors, stdout=StringIO())
+        self.assertEqual(list(Doctor.objects.values_list('last_name', flat=True)), ['Lee'])
+        self.assertEqual([str(doctor) for doctor in directory.get_directory().search('lee')], ['Dr. Ann Lee - Cardiologist'])
+        with open(errors, encoding='utf-8') as handle:
+            rejected = {int(row['line']): row['errors'] for row in csv.DictReader(handle)}
+        self.assertEqual(sorted(rejected), [2, 3, 4, 5])
+        self.assertIn('expected an object, got list', rejected[2])
+
+    def test_values_of_the_wrong_type_are_row_errors(self):
+        patient = {'first_name': 'Ann', 'last_name': 'Lee', 'date_of_birth': '1990-01-02', 'gender': 'F',
+                   'phone_number': '555 0100', 'address': '1 Road'}
+        path = self.write('patients.ndjson', '\n'.join([
+            json.dumps(dict(patient, date_of_birth=20240101)),
+            json.dumps(dict(patient, date_of_birth=['1990-01-02'])),
+            json.dumps(patient),
+        ]))
+        errors = os.path.join(self.tmpdir, 'errors.csv')
+        call_command('import_records', 'patients', path, '--errors', errors, stdout=StringIO())
+        self.assertEqual(Patient.objects.count(), 1)
+        with open(errors, encoding='utf-8') as handle:
+            rejected = {int(row['line']): row['errors'] for row in csv.DictReader(handle)}
+        self.assertEqual(sorted(rejected), [1, 2])
+        self.assertIn('date_of_birth: Enter a valid value, not a JSON int.', rejected[1])
+
+    def test_ids_past_64_bits_are_row_errors(self):
+        patient, doctor = make_patient(), make_doctor()
+        day = (date.today() + timedelta(days=5)).isoformat()
+        rows = [
+            {'patient': 2 ** 63, 'doctor': doctor.pk, 'appointment_date': day, 'appointment_time': '09:00'},
+            {'patient': patient.pk, 'doctor': -2 ** 64, 'appointment_date': day, 'appointment_time': '10:00'},
+            {'patient': patient.pk, 'doctor': doctor.pk, 'appointment_date': day, 'appointment_time': '11:00'},
+        ]
+        path = self.write('appointments.ndjson', '\n'.join(json.dumps(row) for row in rows))
+        errors = os.path.join(self.tmpdir, 'errors.csv')
+        call_command('import_records', 'appointments', path, '--errors', errors, stdout=StringIO())
+        self.assertEqual(Appointment.objects.count(), 1)
+        with open(errors, encoding='utf-8') as handle:
+            rejected = {int(row['line']): row['errors'] for row in csv.DictReader(handle)}
+        self.assertEqual(rejected, {1: 'patient: A valid id is required.', 2: 'doctor: A valid id is required.'})
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def test_patient_csv_export_uses_list_filters(self):
+        make_patient(first_name='Ann', last_name='Lee')
+        make_patient(first_name='Tom', last_name='Ray')
+        response = self.client.get(reverse('patient_export'), {'q': 'lee'})
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['last_name'] for row in rows], ['Lee'])
+
+    def test_appointment_ndjson_export_joins_names_in_one_query(self):
+        doctor = make_doctor()
+        for days in range(1, 6):
+            make_appointment(make_patient(), doctor, days=days, status='CONFIRMED' if days % 2 else 'SCHEDULED')
+        last = date.today() + timedelta(days=4)
+        response = self.client.get(reverse('appointment_export'), {
+            'format': 'ndjson', 'status': 'CONFIRMED', 'to': last.isoformat(),
+        })
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content).decode()
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['doctor_last_name'], 'Jones')
+
+    def test_export_command(self):
+        make_patient(first_name='Ann', last_name='Lee')
+        stdout = StringIO()
+        call_command('export_records', 'patients', '--format', 'ndjson', stdout=stdout)
+        self.assertEqual(json.loads(stdout.getvalue())['first_name'], 'Ann')
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user('staff', password='secret-pass-123')
+        self.client.force_login(self.user)
+
+    def test_server_timing_and_route_histograms(self):
+        make_patient()
+        response = self.client.get(reverse('patient_list'))
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="4 queries", tpl;dur=[\d.]+$')
+        self.assertGreater(registry.template_duration.series['patient_list'][-1], 0)
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('pms_request_sql_queries_bucket{view="patient_list",le="5"} 1', body)
+        self.assertIn('pms_request_duration_seconds_count{view="patient_list"} 1', body)
+
+    @override_settings(PERFORMANCE_SLOW_QUERY_MS=0)
+    def test_slow_query_log(self):
+        with self.assertLogs('patients.performance', level='WARNING') as logs:
+            self.client.get(reverse('doctor_list'))
+        self.assertIn('Slow query', logs.output[0])
+        self.assertEqual(registry.slow_queries.series['doctor_list'], len(logs.output))
+
+    @override_settings(METRICS_ALLOWED_IPS=[])
+    def test_metrics_requires_staff_or_allowed_ip(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def test_seed_data_respects_slot_constraint(self):
+        out = StringIO()
+        call_command('seed_data', patients=40, doctors=3, appointments=120, stdout=out)
+        self.assertEqual((Patient.objects.count(), Doctor.objects.count(), Appointment.objects.count()), (40, 3, 120))
+        self.assertTrue(Appointment.objects.filter(appointment_date__gte=date.today()).exists())
+        self.assertTrue(Appointment.objects.filter(status='COMPLETED').exists())
+        # Seeding twice adds rows instead of colliding with the first run
+        seeding.seed(10, doctors=1, appointments=20, seed=1)
+        self.assertEqual(Appointment.objects.count(), 140)
+
+    def test_benchmark_covers_every_route(self):
+        seeding.seed(20, doctors=2, appointments=40)
+        cases = benchmark.route_cases(benchmark.get_samples())
+        results = benchmark.run(self.client, benchmark.get_benchmark_user(), cases, iterations=2)
+        named = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual({name for label, name, url in cases}, named)
+        self.assertTrue(all(stats['status'] == 200 for label, stats in results.items() if label != 'logout'))
+        self.assertLessEqual(results['patient_list']['p50_ms'], results['patient_list']['p95_ms'])
+
+        slower = {label: dict(stats, p95_ms=stats['p95_ms'] * 2 + 5, queries=stats['queries'] + 1)
+                  for label, stats in results.items()}
+        regressions = benchmark.compare(slower, results)
+        self.assertIn(('patient_list', f'queries {results["patient_list"]["queries"]} -> {results["patient_list"]["queries"] + 1}'), regressions)
+        self.assertEqual(benchmark.compare(results, results), [])
+
+
+class QueryBudgetTests(TestCase):
+    def route_queries(self):
+        availability.get_cache().clear()
+        # Seeding invalidated the doctor directory, so the first request
+        # reloads it and later ones check its version as time passes; both
+        # are left out of the budgets
+        cases = benchmark.route_cases(benchmark.get_samples())
+        results = benchmark.run(self.client, benchmark.get_benchmark_user(), cases, iterations=1, warmup=0)
+        # Keyed by URL name: labels carry sample ids that change with the data
+        queries = {}
+        for label, name, url in cases:
+            stats = results[label]
+            queries[name] = (max(stats['queries'], queries.get(name, (0,))[0]), stats['budget'])
+        return queries
+
+    def test_every_route_stays_within_its_budget_at_two_sizes(self):
+        # Rows with a creator, like the ones the site makes, so the detail
+        # pages show it
+        user = benchmark.get_benchmark_user()
+        seeding.seed(10, doctors=2, appointments=30, created_by=user)
+        small = self.route_queries()
+        seeding.seed(60, doctors=4, appointments=200, seed=1, created_by=user)
+        large = self.route_queries()
+
+        self.assertEqual(set(small), set(large))
+        for name, (queries, budget) in large.items():
+            with self.subTest(route=name):
+                self.assertIsNotNone(budget, 'every view needs a @query_budget')
+                self.assertLessEqual(queries, budget)
+                self.assertLessEqual(queries, small[name][0], 'query count grows with rows')
+
+    def test_runtime_violations_are_logged(self):
+        registry.reset()
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123'))
+        with mock.patch.object(views.patient_list, 'query_budget', 1):
+            with self.assertLogs('patients.performance', level='WARNING') as logs:
+                self.client.get(reverse('patient_list'))
+        self.assertIn('Query budget exceeded by patient_list: 4 queries, budget 1', logs.output[0])
+        self.assertEqual(registry.budget_exceeded.series, {'patient_list': 1})
+
+    def test_doctor_directory_upkeep_is_left_out_of_budgets(self):
+        registry.reset()
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123'))
+        doctor = make_doctor()
+        url = reverse('doctor_detail', args=[doctor.pk])
+        # A reload, a version check, then neither
+        directory.forget()
+        with mock.patch.object(directory, 'CHECK_INTERVAL', 0):
+            responses = [self.client.get(url) for _ in range(2)]
+        responses.append(self.client.get(url))
+        queries = [int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1)) for response in responses]
+        self.assertEqual(queries, [queries[2] + 2, queries[2] + 1, queries[2]])
+        # Timed and shown like any query, but not held against the budget
+        with mock.patch.object(views.doctor_detail, 'query_budget', queries[2]):
+            directory.forget()
+            self.client.get(url)
+        self.assertEqual(registry.budget_exceeded.series, {})
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    def test_production_profile_pragmas_and_immediate_transactions(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        settings_dict = dict(connections.settings['default'], NAME=os.path.join(tmp, 'db.sqlite3'))
+        settings_dict['OPTIONS'] = settings.SQLITE_PRODUCTION_OPTIONS
+        wrapper = SQLiteDatabaseWrapper(settings_dict, alias='production-test')
+        self.addCleanup(wrapper.close)
+
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+        # atomic() takes the write lock as soon as it begins, so a second
+        # writer has to wait instead of failing later on a lock upgrade
+        wrapper.set_autocommit(True)
+        wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(settings_dict['NAME'], timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+            other.execute('BEGIN IMMEDIATE')
+        wrapper.connection.execute('ROLLBACK')
+        other.execute('BEGIN IMMEDIATE')
+        other.execute('ROLLBACK')
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_reads_go_to_replica_unless_pinned(self):
+        self.assertEqual(self.router.db_for_read(Patient), 'replica')
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+        with routers.pin_primary():
+            self.assertEqual(self.router.db_for_read(Patient), 'default')
+        with routers.track_request() as state:
+            self.assertEqual(self.router.db_for_read(Patient), 'replica')
+            self.assertEqual(self.router.db_for_write(Patient), 'default')
+            # Reads after a write in the same request see it
+            self.assertTrue(state.wrote)
+            self.assertEqual(self.router.db_for_read(Patient), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'patients'))
+        self.assertTrue(self.router.allow_migrate('default', 'patients'))
+
+    def test_without_replicas_everything_uses_default(self):
+        self.assertEqual(self.router.db_for_read(Patient), 'default')
+
+    def test_writes_make_the_client_sticky(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123'))
+        self.client.cookies.pop('pms_primary', None)
+        self.client.get(reverse('patient_list'))
+        self.assertNotIn('pms_primary', self.client.cookies)
+        self.client.post(reverse('patient_create'), {
+            'first_name': 'Zed', 'last_name': 'Sticky', 'date_of_birth': '1990-01-01',
+            'gender': 'M', 'phone_number': '123', 'address': 'x',
+        })
+        cookie = self.client.cookies['pms_primary']
+        self.assertEqual(cookie['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+
+class StartsAtTests(TestCase):
+    def test_starts_at_is_utc_and_follows_edits(self):
+        appointment = make_appointment(make_patient(), make_doctor(), days=30, hour=9, timezone='Asia/Karachi')
+        day = appointment.appointment_date
+        self.assertEqual(appointment.starts_at, datetime(day.year, day.month, day.day, 4, tzinfo=dt_timezone.utc))
+        appointment.timezone = 'America/New_York'
+        appointment.save(update_fields=['timezone'])
+        appointment.refresh_from_db()
+        self.assertIn(appointment.starts_at.hour, (13, 14))
+
+    def test_past_check_uses_the_appointment_time_zone(self):
+        # Now in Kiritimati (UTC+14) is already tomorrow morning in UTC terms
+        now = timezone.now().astimezone(get_zone('Pacific/Kiritimati'))
+        earlier = now - timedelta(hours=1)
+        appointment = Appointment(
+            patient=make_patient(), doctor=make_doctor(), appointment_date=earlier.date(),
+            appointment_time=earlier.time().replace(microsecond=0), timezone='Pacific/Kiritimati',
+        )
+        with self.assertRaisesMessage(ValidationError, 'Cannot book appointments in the past.'):
+            appointment.clean()
+        appointment.timezone = 'Mars/Olympus'
+        with self.assertRaises(ValidationError) as caught:
+            appointment.full_clean(exclude=['created_by'])
+        self.assertIn('timezone', caught.exception.message_dict)
+
+    def test_reminders_window_spans_time_zones(self):
+        patient, doctor = make_patient(), make_doctor()
+        now = timezone.now()
+        soon = [
+            make_appointment(patient, doctor, timezone=zone, **self.local(now + timedelta(minutes=minutes), zone))
+            for zone, minutes in (('Asia/Tokyo', 90), ('America/Los_Angeles', 30))
+        ]
+        make_appointment(patient, doctor, timezone='UTC', **self.local(now + timedelta(hours=3), 'UTC'))
+        make_appointment(patient, doctor, timezone='Europe/Paris', status='CANCELLED',
+                         **self.local(now + timedelta(minutes=60), 'Europe/Paris'))
+        with self.assertNumQueries(1):
+            self.assertEqual(list(due_reminders(now=now)), soon[::-1])
+
+    def local(self, instant, zone):
+        local = instant.astimezone(get_zone(zone))
+        return {'appointment_date': local.date(), 'appointment_time': local.time().replace(second=0, microsecond=0)}
+
+
+class PhoneLookupTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123'))
+
+    def test_digits_follow_the_phone_number(self):
+        patient = make_patient(phone_number='+1 (555) 123-4567')
+        self.assertEqual((patient.phone_digits, patient.phone_digits_reversed), ('15551234567', '76543215551'))
+        patient.phone_number = '0044 20 7946 0018'
+        patient.save(update_fields=['phone_number'])
+        patient.refresh_from_db()
+        self.assertEqual(patient.phone_digits, '442079460018')
+
+    def test_exact_and_suffix_matches_in_both_directions(self):
+        local = make_patient(first_name='Local', phone_number='(555) 123-4567')
+        full = make_patient(first_name='Full', phone_number='+1 555 123 4567', email='full@example.com')
+        make_patient(first_name='Other', phone_number='+1 555 765 4321', email='other@example.com')
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('patient_phone_lookup'), {'phone': '+15551234567'})
+        matches = {match['id']: match['match'] for match in response.json()['matches']}
+        self.assertEqual(matches, {full.pk: 'exact', local.pk: 'suffix'})
+
+        response = self.client.get(reverse('patient_phone_lookup'), {'phone': '555.123.4567'})
+        self.assertEqual([match['id'] for match in response.json()['matches']], [local.pk, full.pk])
+
+        response = self.client.get(reverse('patient_phone_lookup'), {'phone': '123'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DuplicateDetectionTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123'))
+
+    def test_blocking_key_follows_last_name_and_birth_date(self):
+        self.assertEqual([duplicates.soundex(name) for name in ('Robert', 'Rupert', 'Ashcraft', 'Tymczak', 'Müller')],
+                         ['R163', 'R163', 'A261', 'T522', 'M460'])
+        patient = make_patient(last_name='Smith', date_of_birth=date(1980, 5, 17))
+        self.assertEqual(patient.name_dob_key, 'S53019800517')
+        patient.last_name = 'Smyth'
+        patient.save(update_fields=['last_name'])
+        patient.refresh_from_db()
+        self.assertEqual(patient.name_dob_key, 'S53019800517')
+        patient.date_of_birth = date(1981, 5, 17)
+        patient.save(update_fields=['date_of_birth'])
+        patient.refresh_from_db()
+        self.assertEqual(patient.name_dob_key, 'S53019810517')
+
+    def test_find_duplicates_compares_within_blocks(self):
+        original = make_patient(first_name='Jonathan', last_name='Smith', phone_number='555-123-4567')
+        typo = make_patient(first_name='Jonathon', last_name='Smyth', email='js@example.org', phone_number='555-000-1111')
+        swapped = make_patient(first_name='Smith', last_name='Jonathan', date_of_birth=date(1990, 1, 1),
+                               email='JOHN.SMITH@example.com', phone_number='+1 555 123 4567')
+        # Shares phone and email with the original, but is someone else
+        make_patient(first_name='Mary', last_name='Smith', date_of_birth=date(2010, 3, 3))
+        # Shares no key with anyone, so is never compared
+        make_patient(first_name='Ann', last_name='Lee', email=None, phone_number='555-222-3333')
+
+        stats = {}
+        candidates = duplicates.find_duplicates(Patient.objects.all(), stats=stats)
+        pairs = {(candidate.patient.pk, candidate.duplicate.pk): candidate.matched for candidate in candidates}
+        self.assertEqual(set(pairs), {(original.pk, typo.pk), (original.pk, swapped.pk)})
+        self.assertEqual(pairs[(original.pk, swapped.pk)], ['name', 'phone', 'email'])
+        self.assertEqual(stats['blocks'], 3)
+
+        out, err = StringIO(), StringIO()
+        call_command('find_duplicates', stdout=out, stderr=err)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 2)
+        self.assertIn('2 candidate pair(s)', err.getvalue())
+
+    def test_create_warns_about_possible_duplicates(self):
+        existing = make_patient(first_name='Jonathan', last_name='Smith')
+        data = {
+            'first_name': 'Jon', 'last_name': 'Smith', 'date_of_birth': '1980-05-17', 'gender': 'M',
+            'email': 'other@example.com', 'phone_number': '(555) 123-4567', 'address': '2 Main Street',
+        }
+        with self.assertNumQueries(3):
+            response = self.client.post(reverse('patient_create'), data)
+        self.assertContains(response, reverse('patient_detail', args=[existing.pk]))
+        self.assertEqual(Patient.objects.count(), 1)
+
+        response = self.client.post(reverse('patient_create'), {**data, 'confirm_not_duplicate': '1'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Patient.objects.count(), 2)
+
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('patient_create'), {
+                **data, 'first_name': 'Ann', 'last_name': 'Lee', 'date_of_birth': '1999-09-09',
+                'phone_number': '555-222-3333', 'email': 'ann@example.com',
+            })
+        self.assertEqual(response.status_code, 302)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123'))
+        self.patient = make_patient()
+        self.doctor = make_doctor()
+
+    def make_past(self, days_ago, status, hour=9):
+        appointment = Appointment(
+            patient=self.patient, doctor=self.doctor, status=status,
+            appointment_date=date.today() - timedelta(days=days_ago), appointment_time=time(hour, 0),
+        )
+        appointment.save(validate=False)
+        return appointment
+
+    def test_moves_old_finished_appointments_in_batches(self):
+        old = [self.make_past(800, 'COMPLETED', hour) for hour in (9, 10, 11)]
+        old.append(self.make_past(700, 'CANCELLED'))
+        kept = [self.make_past(800, 'SCHEDULED', 14), self.make_past(30, 'COMPLETED')]
+
+        batches = []
+        moved = archive.archive_appointments(archive.default_cutoff(365), batch_size=3, progress=batches.append)
+        self.assertEqual((moved, batches), (4, [3, 4]))
+        self.assertEqual(set(Appointment.objects.values_list('pk', flat=True)), {a.pk for a in kept})
+        archived = ArchivedAppointment.objects.get(pk=old[0].pk)
+        self.assertEqual((archived.status, archived.starts_at, archived.created_at),
+                         ('COMPLETED', old[0].starts_at, old[0].created_at))
+        self.assertEqual(archive.archive_appointments(archive.default_cutoff(365)), 0)
+
+        out = StringIO()
+        call_command('archive_appointments', '--days', '10', '--dry-run', stdout=out)
+        self.assertIn('1 appointment(s)', out.getvalue())
+
+    def test_patient_history_includes_archived_appointments(self):
+        self.make_past(800, 'COMPLETED')
+        recent = self.make_past(30, 'CANCELLED')
+        upcoming = make_appointment(self.patient, self.doctor)
+        archive.archive_appointments(archive.default_cutoff(365))
+
+        history = archive.appointment_history(self.patient)
+        self.assertEqual([row['archived'] for row in history], [False, False, True])
+        self.assertEqual([row['id'] for row in history[:2]], [upcoming.pk, recent.pk])
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('patient_detail', args=[self.patient.pk]))
+        self.assertContains(response, 'Archived')
+        self.assertContains(response, reverse('appointment_detail', args=[upcoming.pk]))
+
+
+class EarliestSlotTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123'))
+        self.hourly = make_doctor(work_start=time(9, 0), work_end=time(11, 0), slot_minutes=60)
+        self.half_hourly = make_doctor(work_start=time(9, 0), work_end=time(10, 0), slot_minutes=30)
+        make_doctor(work_start=time(8, 0), work_end=time(9, 0), is_available=False)
+        make_doctor(specialization='DERM', work_start=time(8, 0), work_end=time(9, 0))
+        self.tomorrow = date.today() + timedelta(days=1)
+        make_appointment(make_patient(), self.hourly, appointment_date=self.tomorrow, appointment_time=time(9, 0))
+
+    def search(self, **params):
+        params = {'specialization': 'CARD', 'start': self.tomorrow.isoformat(), **params}
+        return self.client.get(reverse('earliest_available_slots'), params)
+
+    def test_earliest_slots_across_doctors(self):
+        with self.assertNumQueries(5):
+            response = self.search(count=3)
+        slots = [(slot['date'], slot['time'], slot['doctor']['id']) for slot in response.json()['slots']]
+        day = self.tomorrow.isoformat()
+        self.assertEqual(slots, [
+            (day, '09:00', self.half_hourly.pk), (day, '09:30', self.half_hourly.pk), (day, '10:00', self.hourly.pk),
+        ])
+
+    def test_later_days_are_read_only_when_needed(self):
+        # The first day has three free slots; two more come from the next window
+        with self.assertNumQueries(6):
+            response = self.search(count=5)
+        next_day = (self.tomorrow + timedelta(days=1)).isoformat()
+        self.assertEqual(
+            [(slot['date'], slot['time'], slot['doctor']['id']) for slot in response.json()['slots'][3:]],
+            [(next_day, '09:00', self.hourly.pk), (next_day, '09:00', self.half_hourly.pk)],
+        )
+        self.assertEqual(self.search(specialization='XYZ').status_code, 400)
+        self.assertEqual(self.search(count=0).status_code, 400)
+
+
+class AppointmentSeriesTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123'))
+        self.patient = make_patient()
+        self.doctor = make_doctor(work_start=time(9, 0), work_end=time(12, 0), slot_minutes=60)
+        self.start = date.today() + timedelta(days=7)
+
+    def post(self, **extra):
+        data = {
+            'patient': self.patient.pk, 'doctor': self.doctor.pk, 'start_date': self.start.isoformat(),
+            'appointment_time': '10:00', 'frequency': 'WEEKLY', 'occurrences': 10, 'timezone': 'Europe/London',
+            **extra,
+        }
+        return self.client.post(reverse('appointment_series_book'), data)
+
+    def test_books_every_occurrence_at_once(self):
+        week_three = self.start + timedelta(weeks=2)
+        availability.compute_availability([self.doctor], [week_three])
+        # One conflict query and one INSERT for all ten appointments (plus
+        # the test transaction's savepoint)
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(10):
+            response = self.post()
+        self.assertRedirects(response, reverse('patient_detail', args=[self.patient.pk]))
+        series = AppointmentSeries.objects.get()
+        appointments = list(series.appointments.order_by('appointment_date'))
+        self.assertEqual([a.appointment_date for a in appointments], series.get_dates())
+        self.assertEqual(appointments[0].starts_at, appointments[0].get_starts_at())
+        # bulk_create sends no signals; the cached day was dropped anyway
+        mask = availability.compute_availability([self.doctor], [week_three])[self.doctor.pk][week_three]
+        self.assertEqual(mask, 0b101)
+
+    def test_conflicts_are_reported_with_alternatives(self):
+        week_three = self.start + timedelta(weeks=2)
+        week_five = self.start + timedelta(weeks=4)
+        for day in (week_three, week_five):
+            make_appointment(make_patient(), self.doctor, appointment_date=day, appointment_time=time(10, 0))
+
+        with self.assertNumQueries(10):
+            response = self.post()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Appointment.objects.count(), 2)
+        self.assertFalse(AppointmentSeries.objects.exists())
+        self.assertContains(response, f'name="resolve_{week_three.isoformat()}" value="09:00"', status_code=409)
+        self.assertContains(response, f'name="resolve_{week_three.isoformat()}" value="11:00"', status_code=409)
+
+        response = self.post(**{f'resolve_{week_three.isoformat()}': '11:00', f'resolve_{week_five.isoformat()}': 'skip'})
+        self.assertEqual(response.status_code, 302)
+        booked = dict(AppointmentSeries.objects.get().appointments.values_list('appointment_date', 'appointment_time'))
+        self.assertEqual(len(booked), 9)
+        self.assertEqual(booked[week_three], time(11, 0))
+        self.assertNotIn(week_five, booked)
+
+
+class BulkTransitionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.sick = make_doctor()
+        self.other = make_doctor(last_name='Brown')
+        self.day = date.today() + timedelta(days=1)
+        patient = make_patient()
+        self.appointments = {
+            status: make_appointment(patient, self.sick, hour=hour, status=status)
+            for hour, status in ((9, 'SCHEDULED'), (10, 'CONFIRMED'), (11, 'CANCELLED'), (12, 'COMPLETED'))
+        }
+        self.untouched = make_appointment(patient, self.other, hour=9)
+
+    def statuses(self):
+        return dict(Appointment.objects.values_list('pk', 'status'))
+
+    def test_sick_day_cancels_in_one_update_and_drops_cached_days(self):
+        before = availability.compute_availability([self.sick], [self.day])[self.sick.pk][self.day]
+        url = reverse('appointment_bulk_status')
+        params = {'status': 'CANCELLED', 'date': self.day.isoformat(), 'doctor': self.sick.pk}
+
+        statuses = self.statuses()
+        self.assertEqual(self.client.get(url, params).json()['updated'], 2)
+        self.assertEqual(self.statuses(), statuses)
+
+        with self.assertLogs('patients.audit') as logs, self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(6):
+                response = self.client.post(url, params)
+        self.assertEqual(response.json(), {
+            'status': 'CANCELLED', 'dry_run': False, 'updated': 2, 'unchanged': 1, 'rejected': {'COMPLETED': 1},
+        })
+        self.assertIn('Status of 2 appointment(s) set to CANCELLED by staff', logs.output[0])
+        self.assertEqual(self.statuses()[self.appointments['COMPLETED'].pk], 'COMPLETED')
+        self.assertEqual(self.statuses()[self.untouched.pk], 'SCHEDULED')
+        # The cached day was dropped, so the freed 9:00 and 10:00 slots show up
+        slots = availability.slot_times(self.sick)
+        freed = (1 << slots.index(time(9, 0))) | (1 << slots.index(time(10, 0)))
+        self.assertEqual(availability.compute_availability([self.sick], [self.day])[self.sick.pk][self.day], before | freed)
+
+    def test_close_out_never_completes_cancelled_appointments(self):
+        out = StringIO()
+        call_command('close_out_day', '--date', self.day.isoformat(), '--doctor', str(self.sick.pk), stdout=out)
+        self.assertIn('2 appointment(s)', out.getvalue())
+        self.assertIn('1 cancelled', out.getvalue())
+        statuses = self.statuses()
+        self.assertEqual(statuses[self.appointments['SCHEDULED'].pk], 'COMPLETED')
+        self.assertEqual(statuses[self.appointments['CONFIRMED'].pk], 'COMPLETED')
+        self.assertEqual(statuses[self.appointments['CANCELLED'].pk], 'CANCELLED')
+
+        response = self.client.post(reverse('appointment_bulk_status'), {
+            'status': 'SCHEDULED', 'ids': ','.join(str(a.pk) for a in self.appointments.values()),
+        })
+        self.assertEqual(response.json()['rejected'], {'CANCELLED': 1, 'COMPLETED': 3})
+
+        # Too many ids are refused, not cut short
+        ids = [str(a.pk) for a in self.appointments.values()] * (transitions.BATCH_SIZE // 4 + 1)
+        response = self.client.post(reverse('appointment_bulk_status'), {'status': 'CANCELLED', 'ids': ','.join(ids)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.statuses()[self.appointments['SCHEDULED'].pk], 'COMPLETED')
+
+        # Ids past 64 bits are invalid input, not a server error
+        for params in ({'ids': str(2 ** 63)}, {'date': date.today().isoformat(), 'doctor': f'1,{2 ** 64}'}):
+            with self.subTest(params=params):
+                response = self.client.post(reverse('appointment_bulk_status'), {'status': 'CANCELLED', **params})
+                self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.patient = make_patient()
+        self.appointment = make_appointment(self.patient, make_doctor())
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_are_answered_304_without_rendering(self):
+        for url in (reverse('patient_list'), reverse('appointment_list'),
+                    reverse('patient_detail', args=[self.patient.pk])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('private', response['Cache-Control'])
+                with self.assertNumQueries(3), self.assertTemplateNotUsed('patients/base.html'):
+                    self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        url = reverse('appointment_list')
+        response = self.client.get(url)
+        # A bulk UPDATE sends no signals but moves updated_at
+        transitions.transition(Appointment.objects.all(), 'CONFIRMED')
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+        url = reverse('patient_list')
+        response = self.client.get(url)
+        Patient.objects.filter(pk=make_patient(first_name='Jane').pk).delete()
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        Patient.objects.filter(pk=self.patient.pk).delete()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+        # The ETag is per user
+        response = self.client.get(url)
+        self.client.force_login(User.objects.create_user('other', password='secret-pass-123'))
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    @override_settings(RESPONSE_CACHE_ALIAS='default')
+    def test_cached_page_is_served_until_a_signal_or_write_changes_it(self):
+        conditional.get_cache().clear()
+        url = reverse('patient_detail', args=[self.patient.pk])
+        first = self.client.get(url)
+        with self.assertNumQueries(3), self.assertTemplateNotUsed('patients/base.html'):
+            cached = self.client.get(url)
+        self.assertEqual(cached.content, first.content)
+
+        self.appointment.status = 'CANCELLED'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.save()
+        with self.assertTemplateUsed('patients/patient_detail.html'):
+            self.assertContains(self.client.get(url), 'Cancelled')
+
+        # No signal, but the stored ETag no longer matches
+        Appointment.objects.filter(pk=self.appointment.pk).update(notes='moved', updated_at=timezone.now())
+        with self.assertTemplateUsed('patients/patient_detail.html'):
+            self.client.get(url)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', password='secret-pass-123')
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+        self.doctor = make_doctor()
+        self.appointment = make_appointment(make_patient(phone_number='(555) 123-4567'), self.doctor)
+
+    def test_async_variants_answer_like_the_sync_views(self):
+        day = self.appointment.appointment_date.isoformat()
+        for name, kwargs, params in (
+            ('available_time_slots', {'doctor_id': self.doctor.pk, 'date_str': day}, {}),
+            ('available_time_slots', {'doctor_id': 10 ** 20, 'date_str': day}, {}),
+            ('doctor_availability', {}, {'doctor': self.doctor.pk, 'start': day, 'days': 2}),
+            ('doctor_availability', {}, {'doctor': f'{self.doctor.pk},{10 ** 20}'}),
+            ('patient_phone_lookup', {}, {'phone': '+1 555 123 4567'}),
+        ):
+            with self.subTest(name=name, kwargs=kwargs, params=params):
+                # Status, body, queries and availability cache traffic
+                answers = []
+                for url_name in (name, f'{name}_async'):
+                    availability.get_cache().clear()
+                    availability.cache_stats.reset()
+                    directory.get_directory()
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.client.get(reverse(url_name, kwargs=kwargs), params)
+                    answers.append((
+                        response.status_code, response.json(), len(queries), availability.cache_stats.as_dict(),
+                    ))
+                self.assertEqual(answers[1], answers[0])
+
+        response = self.client.get(reverse('appointment_list_async'), {'q': 'smi'})
+        self.assertContains(response, 'Dr. Alice Jones')
+        response = self.client.get(reverse('appointment_list_async'), {'q': 'smi'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.client.logout()
+        self.assertRedirects(
+            self.client.get(reverse('patient_list_async')), f"{reverse('login')}?next={reverse('patient_list_async')}",
+        )
+
+    async def test_asgi_requests_are_measured_and_routed(self):
+        args = [self.doctor.pk, self.appointment.appointment_date.isoformat()]
+        expected = (await self.async_client.get(reverse('available_time_slots', args=args))).json()
+        response = await self.async_client.get(reverse('available_time_slots_async', args=args))
+        self.assertEqual(response.json(), expected)
+        # Session and user; the day comes from the cache the sync view filled
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        response = await self.async_client.get(reverse('doctor_list_async'))
+        self.assertContains(response, 'Dr. Alice Jones')
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123'))
+        self.patient = make_patient()
+        make_patient(first_name='Smith', last_name='Brown', date_of_birth=date(1990, 1, 2))
+        make_patient(first_name='Mary', last_name='smithers')
+        self.doctor = make_doctor()
+        make_doctor(first_name='Bob', last_name='Jonas', email='bob@example.com', is_available=False)
+
+    def test_name_prefixes_match_surname_first_then_first_name(self):
+        queryset = Patient.objects.all()
+        self.assertEqual(
+            [str(patient) for patient in name_prefix_search(queryset, 'SMI', 10)],
+            ['John Smith', 'Mary smithers', 'Smith Brown'],
+        )
+        self.assertEqual([str(patient) for patient in name_prefix_search(queryset, 'jo smi', 10)], ['John Smith'])
+        self.assertEqual(name_prefix_search(queryset, 'smi', 2), name_prefix_search(queryset, 'smi', 10)[:2])
+        self.assertEqual(name_prefix_search(queryset, '  ', 10), [])
+
+        # Prefixes whose last character has no successor that SQLite can hold
+        edge = make_patient(first_name='Zed', last_name='Z\U0010ffff\U0010ffff')
+        self.assertEqual(name_prefix_search(queryset, 'z\U0010ffff', 10), [edge])
+        self.assertEqual(name_prefix_search(queryset, '\U0010ffff', 10), [])
+        self.assertEqual(name_prefix_search(queryset, '\ud7ff', 10), [])
+        response = self.client.get(reverse('patient_autocomplete') + '?q=%F4%8F%BF%BF')
+        self.assertEqual(response.json(), {'results': [], 'more': False})
+
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('patient_autocomplete'), {'q': 'smi'})
+        self.assertEqual(response.json()['results'][0], {'id': self.patient.pk, 'text': 'John Smith (1980-05-17)'})
+        self.assertTrue(autocomplete.patient_results('smi', limit=1)['more'])
+
+        doctors = self.client.get(reverse('doctor_autocomplete'), {'q': 'jo'}).json()
+        self.assertEqual([result['id'] for result in doctors['results']], [self.doctor.pk])
+        timezones = self.client.get(reverse('timezone_autocomplete'), {'q': 'new york'}).json()
+        self.assertEqual(timezones['results'], [{'id': 'America/New_York', 'text': 'America/New_York'}])
+
+    def test_booking_page_renders_only_selected_choices(self):
+        # session, user, and the doctor directory's version and rows, reloaded
+        # after setUp's doctors
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('appointment_book'))
+        self.assertContains(response, reverse('patient_autocomplete'))
+        self.assertNotContains(response, 'Smith Brown')
+        self.assertNotContains(response, 'Europe/Paris')
+        self.assertContains(response, '<option value="UTC" selected>UTC</option>', html=True)
+
+        response = self.client.post(reverse('appointment_book'), {
+            'patient': self.patient.pk, 'doctor': self.doctor.pk, 'appointment_date': 'not a date',
+            'appointment_time': '10:00', 'timezone': 'Europe/Paris',
+        })
+        self.assertContains(
+            response, f'<option value="{self.patient.pk}" selected>John Smith (1980-05-17)</option>', html=True,
+        )
+        self.assertContains(response, '<option value="Europe/Paris" selected>Europe/Paris</option>', html=True)
+        self.assertNotContains(response, 'Mary smithers')
+
+
+class DoctorDirectoryTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123', is_staff=True))
+        self.doctor = make_doctor()
+        make_doctor(first_name='José', last_name='Núñez', specialization='NEUR', email='jnunez@example.com')
+        make_doctor(first_name='Bob', last_name='Jonas', email='bob.smith@example.com', is_available=False)
+        make_doctor(first_name='Ann', last_name="O'Brien", specialization='PEDI', email='ann@example.org')
+
+    def test_search_matches_the_search_index(self):
+        doctors = directory.get_directory()
+        for query in ('', 'jo', 'JOSE nun', 'cardio', 'example.org', 'smith', "o'bri", 'bob jones', 'zzz'):
+            with self.subTest(query=query):
+                expected = list(filter_doctors(Doctor.objects.all(), query).order_by('last_name', 'first_name', 'pk'))
+                self.assertEqual([doctor.pk for doctor in doctors.search(query)], [doctor.pk for doctor in expected])
+        self.assertEqual(
+            [doctor.get_full_name() for doctor in doctors.search('jo', doctors.available)],
+            ['Dr. Alice Jones', 'Dr. José Núñez'],
+        )
+        self.assertEqual([doctor.pk for doctor in doctors.specialists('CARD')], [self.doctor.pk])
+
+    def test_list_paginator_walks_like_the_queryset_paginator(self):
+        for i in range(5):
+            make_doctor(first_name=f'D{i}', last_name='Jones', email=f'd{i}@example.com')
+        rows = directory.get_directory().doctors
+        expected = list(Doctor.objects.values_list('pk', flat=True))
+        paginator = ListKeysetPaginator(rows, Doctor, per_page=3)
+        seen, last_page = KeysetPaginationTests.walk(self, paginator)
+        self.assertEqual(seen, expected)
+        previous = paginator.page(last_page.previous_cursor)
+        self.assertEqual([doctor.pk for doctor in previous], expected[3:6])
+        # The cursors are the queryset paginator's
+        queryset_page = KeysetPaginator(Doctor.objects.all(), per_page=3).page(last_page.previous_cursor)
+        self.assertEqual([doctor.pk for doctor in queryset_page], expected[3:6])
+
+    def test_pages_read_doctors_from_memory(self):
+        make_appointment(make_patient(), self.doctor)
+        directory.get_directory()
+        # session and user only
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('doctor_list'), {'q': 'jones'})
+        self.assertContains(response, 'Dr. Alice Jones')
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('appointment_list'))
+        self.assertContains(response, 'Dr. Alice Jones')
+        self.assertEqual(self.client.get(reverse('doctor_detail', args=[0])).status_code, 404)
+
+        response = self.client.post(reverse('appointment_book'), {
+            'patient': Patient.objects.get().pk, 'doctor': Doctor.objects.get(first_name='Bob').pk,
+            'appointment_date': date.today() + timedelta(days=3), 'appointment_time': '10:00', 'timezone': 'UTC',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('doctor', response.context['form'].errors)
+
+    def test_changes_reload_the_directory(self):
+        loaded = directory.get_directory()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.first_name = 'Alicia'
+            self.doctor.save()
+            # Kept until the change is committed
+            self.assertIs(directory.get_directory(), loaded)
+        self.assertEqual(str(directory.get_directory().get(self.doctor.pk)), 'Dr. Alicia Jones - Cardiologist')
+
+        # A change made without signals, then announced by another process:
+        # the version moves but this process's copy is kept until it checks
+        loaded = directory.get_directory()
+        Doctor.objects.filter(pk=self.doctor.pk).update(last_name='Smith')
+        with mock.patch.object(directory, 'forget'):
+            directory.invalidate()
+        self.assertIs(directory.get_directory(), loaded)
+        loaded.checked_at -= directory.CHECK_INTERVAL
+        self.assertEqual(directory.get_directory().get(self.doctor.pk).last_name, 'Smith')
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('pms_doctor_directory_doctors 4', body)
+        self.assertRegex(body, r'pms_doctor_directory_bytes [1-9]\d*')
+
+    def test_doctors_added_elsewhere_are_read_from_the_database(self):
+        directory.get_directory()
+        # As if added by another worker a moment ago, before this one checked
+        added = Doctor.objects.bulk_create([Doctor(
+            first_name='Nina', last_name='Park', specialization='CARD', email='nina@example.com', phone_number='555 0199',
+        )])[0]
+        self.assertEqual(directory.get_directory().get(added.pk).get_full_name(), 'Dr. Nina Park')
+        self.assertEqual([doctor.pk for doctor in directory.get_directory().in_bulk([added.pk, self.doctor.pk])],
+                         [self.doctor.pk, added.pk])
+        self.assertContains(self.client.get(reverse('doctor_detail', args=[added.pk])), 'Dr. Nina Park')
+        self.assertIsNone(directory.get_directory().get(10 ** 30))
+        response = self.client.post(reverse('appointment_book'), {
+            'patient': make_patient().pk, 'doctor': added.pk,
+            'appointment_date': date.today() + timedelta(days=3), 'appointment_time': '10:00', 'timezone': 'UTC',
+        })
+        self.assertEqual(Appointment.objects.get().doctor_id, added.pk)
+
+
+class AdminPerformanceTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123'))
+        self.doctor = make_doctor()
+        self.other = make_doctor(first_name='Bob', last_name='Brown', email='bob@example.com')
+        for days in range(1, 4):
+            make_appointment(make_patient(first_name=f'P{days}'), self.doctor, days=days)
+        make_appointment(make_patient(first_name='Mary', last_name='Lee'), self.other)
+        directory.get_directory()
+
+    def test_changelist_reads_no_doctors_and_counts_no_table(self):
+        url = reverse('admin:patients_appointment_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'status__exact': 'SCHEDULED'})
+        self.assertContains(response, 'Dr. Alice Jones', count=3)
+        self.assertContains(response, 'class="autocomplete-filter"')
+        self.assertContains(response, '<input type="hidden" name="status__exact" value="SCHEDULED">', html=True)
+        # No link per doctor
+        self.assertNotContains(response, f'doctor__id__exact={self.other.pk}')
+        self.assertContains(response, '4 appointments')
+        for query in queries.captured_queries:
+            self.assertNotIn('"patients_doctor"', query['sql'])
+            if 'COUNT(' in query['sql']:
+                self.assertIn('LIMIT', query['sql'])
+
+        response = self.client.get(url, {'doctor__id__exact': self.other.pk})
+        self.assertContains(response, 'Mary Lee')
+        self.assertNotContains(response, 'P1 Smith')
+        self.assertContains(response, f'<option value="{self.other.pk}" selected>')
+
+    def test_counts_are_limited_or_estimated(self):
+        url = reverse('admin:patients_appointment_changelist')
+        with mock.patch.object(patients_admin, 'COUNT_LIMIT', 2):
+            response = self.client.get(url)
+        self.assertTrue(response.context['cl'].paginator.limited)
+        self.assertContains(response, '2+ appointments')
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        response = self.client.get(url)
+        self.assertTrue(response.context['cl'].paginator.estimated)
+        self.assertContains(response, '~4 appointments')
+        # A filtered list is counted
+        response = self.client.get(url, {'status__exact': 'CANCELLED'})
+        self.assertContains(response, '0 appointments')
+
+    def test_search_and_autocomplete_use_the_search_index(self):
+        response = self.client.get(reverse('admin:patients_appointment_changelist'), {'q': 'lee'})
+        self.assertContains(response, 'Mary Lee')
+        self.assertNotContains(response, 'P1 Smith')
+        response = self.client.get(reverse('admin:patients_patient_changelist'), {'q': '555 123'})
+        self.assertContains(response, 'Mary')
+
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'patients', 'model_name': 'appointment', 'field_name': 'doctor', 'term': 'bro',
+        })
+        self.assertEqual(response.json()['results'], [{'id': str(self.other.pk), 'text': str(self.other)}])
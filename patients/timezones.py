@@ -0,0 +1,41 @@
+"""
+Time zone lookups for appointments, on the standard library's ``zoneinfo``.
+
+Zones are resolved once per name and kept, so converting a batch of local
+appointment times to UTC costs one dictionary lookup per row.
+"""
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+from django.core.exceptions import ValidationError
+
+# Aliases and variants that only clutter the choice list
+_HIDDEN_PREFIXES = ('Etc/', 'posix/', 'right/', 'SystemV/')
+
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    return ZoneInfo(name)
+
+
+@lru_cache(maxsize=None)
+def timezone_choices():
+    names = sorted(
+        name for name in available_timezones()
+        if '/' in name and not name.startswith(_HIDDEN_PREFIXES)
+    )
+    return [('UTC', 'UTC')] + [(name, name) for name in names]
+
+
+def validate_timezone(value):
+    try:
+        get_zone(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValidationError(f'Unknown time zone "{value}".')
+
+
+def local_to_utc(day, at, zone_name):
+    """The UTC instant of wall-clock ``day`` ``at`` in ``zone_name``"""
+    local = datetime.combine(day, at).replace(tzinfo=get_zone(zone_name))
+    return local.astimezone(dt_timezone.utc)
@@ -0,0 +1,106 @@
+"""
+Bulk appointment status changes.
+
+``transition()`` moves every appointment of a queryset to a new status in
+set-based UPDATEs instead of a ``full_clean`` and ``save()`` per row. Only
+the moves in ``ALLOWED_TRANSITIONS`` are made: cancelled and completed
+appointments are final, so a day's close-out never completes a cancelled
+appointment and a sick-day cancellation leaves finished ones alone.
+
+UPDATEs send no ``post_save``, so once the transaction commits the batch is
+announced with one ``status_changed`` signal; the receivers in
+``patients.signals`` drop the cached availability of the affected days and
+write the audit log.
+"""
+from collections import Counter
+
+from django.db import router, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Appointment
+
+ALLOWED_TRANSITIONS = {
+    'SCHEDULED': {'CONFIRMED', 'CANCELLED', 'COMPLETED'},
+    'CONFIRMED': {'SCHEDULED', 'CANCELLED', 'COMPLETED'},
+    'CANCELLED': set(),
+    'COMPLETED': set(),
+}
+# Ids per UPDATE; stays under SQLite's default limit of 999 query parameters
+BATCH_SIZE = 500
+
+# Sent on commit with ``appointments`` (a list of TransitionRow), ``status``,
+# ``user`` (or None) and ``using``
+status_changed = Signal()
+
+
+class TransitionRow:
+    __slots__ = ('pk', 'doctor_id', 'appointment_date', 'previous_status')
+
+    def __init__(self, pk, doctor_id, appointment_date, previous_status):
+        self.pk = pk
+        self.doctor_id = doctor_id
+        self.appointment_date = appointment_date
+        self.previous_status = previous_status
+
+
+def allowed_sources(status):
+    return {source for source, targets in ALLOWED_TRANSITIONS.items() if status in targets}
+
+
+def _rows(queryset):
+    return [
+        TransitionRow(*values)
+        for values in queryset.order_by().values_list('pk', 'doctor_id', 'appointment_date', 'status')
+    ]
+
+
+def _update(rows, sources, status, using):
+    now = timezone.now()
+    updated = 0
+    for start in range(0, len(rows), BATCH_SIZE):
+        ids = [row.pk for row in rows[start:start + BATCH_SIZE]]
+        # The status is checked again in the UPDATE itself, in case a row
+        # changed since it was read
+        updated += Appointment.objects.using(using).filter(pk__in=ids, status__in=sources).update(
+            status=status, updated_at=now,
+        )
+    return updated
+
+
+def transition(queryset, status, user=None, dry_run=False):
+    """
+    Move the appointments of ``queryset`` to ``status`` where allowed.
+
+    Returns ``{'updated': n, 'unchanged': n, 'rejected': {status: n}}``:
+    rows already in ``status`` are unchanged, rows whose current status
+    can't move to it are rejected. With ``dry_run`` nothing is written and
+    ``updated`` is what would be.
+    """
+    if status not in ALLOWED_TRANSITIONS:
+        raise ValueError(f'Unknown status "{status}"')
+    sources = allowed_sources(status)
+    if dry_run:
+        # A preview reads like any other request (see routers)
+        rows = _rows(queryset.using(router.db_for_read(Appointment)))
+        moving = [row for row in rows if row.previous_status in sources]
+        updated = len(moving)
+    else:
+        using = router.db_for_write(Appointment)
+        with transaction.atomic(using=using):
+            rows = _rows(queryset.using(using))
+            moving = [row for row in rows if row.previous_status in sources]
+            updated = _update(moving, sources, status, using)
+            if moving:
+                transaction.on_commit(
+                    lambda: status_changed.send(
+                        sender=Appointment, appointments=moving, status=status, user=user, using=using,
+                    ),
+                    using=using,
+                )
+    rejected = Counter(row.previous_status for row in rows if row.previous_status not in sources | {status})
+    return {
+        'updated': updated,
+        'unchanged': sum(1 for row in rows if row.previous_status == status),
+        'rejected': dict(rejected),
+    }
@@ -5,9 +5,14 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
+    path('metrics', views.metrics, name='metrics'),
     
     # Patient URLs
     path('patients/', views.patient_list, name='patient_list'),
+    path('patients/export/', views.patient_export, name='patient_export'),
+    path('patients/lookup/', views.patient_phone_lookup, name='patient_phone_lookup'),
+    path('patients/search/', views.patient_search, name='patient_search'),
+    path('patients/autocomplete/', views.patient_autocomplete, name='patient_autocomplete'),
     path('patients/<int:pk>/', views.patient_detail, name='patient_detail'),
     path('patients/create/', views.patient_create, name='patient_create'),
     path('patients/<int:pk>/edit/', views.patient_update, name='patient_update'),
@@ -15,15 +20,31 @@ urlpatterns = [
     
     # Doctor URLs
     path('doctors/', views.doctor_list, name='doctor_list'),
+    path('doctors/autocomplete/', views.doctor_autocomplete, name='doctor_autocomplete'),
     path('doctors/<int:pk>/', views.doctor_detail, name='doctor_detail'),
     path('doctors/create/', views.doctor_create, name='doctor_create'),
     path('doctors/<int:pk>/edit/', views.doctor_update, name='doctor_update'),
     
     # Appointment URLs
     path('appointments/', views.appointment_list, name='appointment_list'),
+    path('appointments/export/', views.appointment_export, name='appointment_export'),
     path('appointments/<int:pk>/', views.appointment_detail, name='appointment_detail'),
     path('appointments/book/', views.appointment_book, name='appointment_book'),
+    path('appointments/book/series/', views.appointment_series_book, name='appointment_series_book'),
     path('appointments/<int:pk>/edit/', views.appointment_update, name='appointment_update'),
     path('appointments/<int:pk>/cancel/', views.appointment_cancel, name='appointment_cancel'),
+    path('appointments/bulk-status/', views.appointment_bulk_status, name='appointment_bulk_status'),
     path('appointments/slots/<int:doctor_id>/<str:date_str>/', views.available_time_slots, name='available_time_slots'),
+    path('appointments/availability/', views.doctor_availability, name='doctor_availability'),
+    path('appointments/availability/earliest/', views.earliest_available_slots, name='earliest_available_slots'),
+    path('appointments/timezones/', views.timezone_autocomplete, name='timezone_autocomplete'),
+    path('appointments/availability/stats/', views.availability_cache_stats, name='availability_cache_stats'),
+
+    # Async variants, for ASGI deployments
+    path('async/patients/', views.patient_list_async, name='patient_list_async'),
+    path('async/patients/lookup/', views.patient_phone_lookup_async, name='patient_phone_lookup_async'),
+    path('async/doctors/', views.doctor_list_async, name='doctor_list_async'),
+    path('async/appointments/', views.appointment_list_async, name='appointment_list_async'),
+    path('async/appointments/slots/<int:doctor_id>/<str:date_str>/', views.available_time_slots_async, name='available_time_slots_async'),
+    path('async/appointments/availability/', views.doctor_availability_async, name='doctor_availability_async'),
 ]
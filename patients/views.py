@@ -1,13 +1,33 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Q
+from django.conf import settings
+from django.utils import timezone
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfoNotFoundError
+from . import archive, autocomplete, availability, directory, duplicates, exports, phones, transitions
+from .conditional import conditional_page, list_state, patient_state
+from .metrics import registry
 from .models import Patient, Doctor, Appointment
-from .forms import PatientForm, UserRegisterForm, DoctorForm, AppointmentForm
-
-
+from .booking import save_appointment, SlotTaken
+from .budgets import query_budget
+from .concurrency import async_login_required
+from .forms import PatientForm, UserRegisterForm, DoctorForm, AppointmentForm, AppointmentSeriesForm
+from .pagination import apaginate, paginate, paginate_list
+from .projections import (
+    patient_list_queryset, appointment_list_queryset, upcoming_appointment_queryset,
+)
+from .search import filter_patients, filter_appointments, search_patients
+from .series import SeriesConflict, book_series
+from .timezones import get_zone
+
+
+@query_budget(3)
 def register(request):
     if request.method == 'POST':
         form = UserRegisterForm(request.POST)
@@ -21,6 +41,7 @@ def register(request):
     return render(request, 'patients/register.html', {'form': form})
 
 
+@query_budget(9)
 def login_view(request):
     if request.method == 'POST':
         username = request.POST.get('username')
@@ -35,48 +56,78 @@ def login_view(request):
     return render(request, 'patients/login.html')
 
 
+@query_budget(4)
 def logout_view(request):
     logout(request)
     messages.info(request, 'You have been logged out.')
     return redirect('login')
 
 
+def _listed_patients(request):
+    return filter_patients(Patient.objects.all(), request.GET.get('q', ''))
+
+
+@query_budget(5)
 @login_required
+@conditional_page(lambda request: list_state(_listed_patients(request)))
 def patient_list(request):
     query = request.GET.get('q', '')
-    if query:
-        patients = Patient.objects.filter(
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query) |
-            Q(phone_number__icontains=query) |
-            Q(email__icontains=query)
-        )
-    else:
-        patients = Patient.objects.all()
-    return render(request, 'patients/patient_list.html', {'patients': patients, 'query': query})
+    patients = _listed_patients(request)
+    page = paginate(request, patient_list_queryset(patients))
+    return render(request, 'patients/patient_list.html', {'patients': page, 'page': page, 'query': query})
 
 
+@query_budget(3)
 @login_required
+def patient_export(request):
+    """Stream the patient_list results (same ?q= filter) as CSV or NDJSON"""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return JsonResponse({'error': 'format must be csv or ndjson.'}, status=400)
+    return _export_response(exports.patient_export(_listed_patients(request), fmt), 'patients', fmt)
+
+
+def _export_response(chunks, name, fmt):
+    response = StreamingHttpResponse(chunks, content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{name}-{date.today():%Y%m%d}.{fmt}"'
+    return response
+
+
+@query_budget(5)
+@login_required
+@conditional_page(lambda request, pk: patient_state(pk))
 def patient_detail(request, pk):
-    patient = get_object_or_404(Patient, pk=pk)
-    return render(request, 'patients/patient_detail.html', {'patient': patient})
+    patient = get_object_or_404(Patient.objects.select_related('created_by'), pk=pk)
+    return render(request, 'patients/patient_detail.html', {
+        'patient': patient,
+        'appointment_history': archive.appointment_history(patient),
+    })
 
 
+@query_budget(4)
 @login_required
 def patient_create(request):
+    possible_duplicates = []
     if request.method == 'POST':
         form = PatientForm(request.POST)
         if form.is_valid():
             patient = form.save(commit=False)
             patient.created_by = request.user
-            patient.save()
-            messages.success(request, 'Patient created successfully!')
-            return redirect('patient_detail', pk=patient.pk)
+            # One indexed query; the user can confirm to save anyway
+            if not request.POST.get('confirm_not_duplicate'):
+                possible_duplicates = duplicates.possible_duplicates(Patient.objects.all(), patient)
+            if not possible_duplicates:
+                patient.save()
+                messages.success(request, 'Patient created successfully!')
+                return redirect('patient_detail', pk=patient.pk)
     else:
         form = PatientForm()
-    return render(request, 'patients/patient_form.html', {'form': form, 'action': 'Create'})
+    return render(request, 'patients/patient_form.html', {
+        'form': form, 'action': 'Create', 'possible_duplicates': possible_duplicates,
+    })
 
 
+@query_budget(4)
 @login_required
 def patient_update(request, pk):
     patient = get_object_or_404(Patient, pk=pk)
@@ -91,6 +142,7 @@ def patient_update(request, pk):
     return render(request, 'patients/patient_form.html', {'form': form, 'action': 'Update', 'patient': patient})
 
 
+@query_budget(7)
 @login_required
 def patient_delete(request, pk):
     patient = get_object_or_404(Patient, pk=pk)
@@ -102,35 +154,37 @@ def patient_delete(request, pk):
 
 
 # Doctor views
+def _doctor_list_page(request):
+    # Searched and paged in memory, from the doctor directory
+    doctors = directory.get_directory().search(request.GET.get('q', ''))
+    return paginate_list(request, doctors, Doctor)
+
+
+@query_budget(4)
 @login_required
 def doctor_list(request):
-    query = request.GET.get('q', '')
-    if query:
-        doctors = Doctor.objects.filter(
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query) |
-            Q(specialization__icontains=query) |
-            Q(email__icontains=query)
-        )
-    else:
-        doctors = Doctor.objects.all()
-    return render(request, 'patients/doctor_list.html', {'doctors': doctors, 'query': query})
+    page = _doctor_list_page(request)
+    return render(request, 'patients/doctor_list.html', {'doctors': page, 'page': page, 'query': request.GET.get('q', '')})
 
 
+@query_budget(4)
 @login_required
 def doctor_detail(request, pk):
-    doctor = get_object_or_404(Doctor, pk=pk)
+    doctor = directory.get_directory().get(pk)
+    if doctor is None:
+        raise Http404('No doctor matches the given query.')
     # Get upcoming appointments for this doctor
-    upcoming_appointments = Appointment.objects.filter(
-        doctor=doctor,
-        appointment_date__gte=date.today()
-    ).exclude(status='CANCELLED').order_by('appointment_date', 'appointment_time')[:10]
+    upcoming_appointments = upcoming_appointment_queryset(Appointment.objects.filter(
+        doctor_id=doctor.pk,
+        starts_at__gte=timezone.now()
+    ).exclude(status='CANCELLED')).order_by('starts_at')[:10]
     return render(request, 'patients/doctor_detail.html', {
         'doctor': doctor,
         'upcoming_appointments': upcoming_appointments
     })
 
 
+@query_budget(3)
 @login_required
 def doctor_create(request):
     if request.method == 'POST':
@@ -144,6 +198,7 @@ def doctor_create(request):
     return render(request, 'patients/doctor_form.html', {'form': form, 'action': 'Add'})
 
 
+@query_budget(4)
 @login_required
 def doctor_update(request, pk):
     doctor = get_object_or_404(Doctor, pk=pk)
@@ -159,122 +214,535 @@ def doctor_update(request, pk):
 
 
 # Appointment views
+def _appointment_list_context(request, page):
+    date_from, date_to = _date_filters(request)
+    return {
+        'appointments': page,
+        'page': page,
+        'query': request.GET.get('q', ''),
+        'status_filter': request.GET.get('status', ''),
+        'date_from': date_from,
+        'date_to': date_to,
+    }
+
+
+def _listed_appointments(request):
+    date_from, date_to = _date_filters(request)
+    return filter_appointments(
+        Appointment.objects.all(), request.GET.get('q', ''), request.GET.get('status', ''), date_from, date_to
+    )
+
+
+# The list shows patient and doctor names, so renaming one changes it too
+@query_budget(5)
 @login_required
+@conditional_page(lambda request: list_state(_listed_appointments(request), Patient, Doctor))
 def appointment_list(request):
-    query = request.GET.get('q', '')
-    status_filter = request.GET.get('status', '')
-    
-    appointments = Appointment.objects.all()
-    
-    if query:
-        appointments = appointments.filter(
-            Q(patient__first_name__icontains=query) |
-            Q(patient__last_name__icontains=query) |
-            Q(doctor__first_name__icontains=query) |
-            Q(doctor__last_name__icontains=query)
-        )
-    
-    if status_filter:
-        appointments = appointments.filter(status=status_filter)
-    
-    return render(request, 'patients/appointment_list.html', {
-        'appointments': appointments,
-        'query': query,
-        'status_filter': status_filter
-    })
+    page = paginate(request, appointment_list_queryset(_listed_appointments(request)))
+    directory.attach_doctors(page)
+    return render(request, 'patients/appointment_list.html', _appointment_list_context(request, page))
+
+
+@query_budget(3)
+@login_required
+def appointment_export(request):
+    """Stream the appointment_list results (same filters) as CSV or NDJSON"""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return JsonResponse({'error': 'format must be csv or ndjson.'}, status=400)
+    return _export_response(exports.appointment_export(_listed_appointments(request), fmt), 'appointments', fmt)
 
 
+@query_budget(3)
 @login_required
 def appointment_detail(request, pk):
-    appointment = get_object_or_404(Appointment, pk=pk)
+    appointment = get_object_or_404(Appointment.objects.select_related('patient', 'doctor', 'created_by'), pk=pk)
     return render(request, 'patients/appointment_detail.html', {'appointment': appointment})
 
 
+@query_budget(12)
 @login_required
 def appointment_book(request):
+    status = 200
     if request.method == 'POST':
         form = AppointmentForm(request.POST)
         if form.is_valid():
             appointment = form.save(commit=False)
             appointment.created_by = request.user
             try:
-                appointment.save()
+                save_appointment(appointment)
                 messages.success(request, 'Appointment booked successfully!')
                 return redirect('appointment_detail', pk=appointment.pk)
-            except Exception as e:
-                messages.error(request, f'Error booking appointment: {str(e)}')
+            except SlotTaken as e:
+                form.add_error(None, str(e))
+                status = 409
     else:
         form = AppointmentForm()
     
     # Get available doctors for display
-    available_doctors = Doctor.objects.filter(is_available=True)
+    available_doctors = directory.get_directory().available
     
     return render(request, 'patients/appointment_book.html', {
         'form': form,
         'available_doctors': available_doctors
-    })
+    }, status=status)
+
+
+def _series_resolutions(data):
+    """
+    Read the choices made for clashing sessions: ``resolve_<YYYY-MM-DD>`` is
+    an alternative time (HH:MM) or ``skip``. Returns (overrides, skipped dates).
+    """
+    overrides, skip = {}, set()
+    for name, value in data.items():
+        if not name.startswith('resolve_'):
+            continue
+        try:
+            day = _parse_date(name[len('resolve_'):])
+            if value == 'skip':
+                skip.add(day)
+            elif value:
+                overrides[day] = datetime.strptime(value, '%H:%M').time()
+        except ValueError:
+            continue
+    return overrides, skip
+
+
+@query_budget(10)
+@login_required
+def appointment_series_book(request):
+    status = 200
+    conflicts = []
+    if request.method == 'POST':
+        form = AppointmentSeriesForm(request.POST)
+        if form.is_valid():
+            series = form.save(commit=False)
+            series.created_by = request.user
+            overrides, skip = _series_resolutions(request.POST)
+            try:
+                appointments = book_series(series, overrides, skip)
+                messages.success(request, f'Booked {len(appointments)} appointment(s) in the series.')
+                return redirect('patient_detail', pk=series.patient_id)
+            except SeriesConflict as e:
+                form.add_error(None, str(e))
+                conflicts = sorted(e.conflicts.items())
+                status = 409
+    else:
+        form = AppointmentSeriesForm()
+    return render(request, 'patients/appointment_series_form.html', {
+        'form': form,
+        'conflicts': conflicts,
+    }, status=status)
 
 
+@query_budget(12)
 @login_required
 def appointment_update(request, pk):
     appointment = get_object_or_404(Appointment, pk=pk)
+    status = 200
     if request.method == 'POST':
         form = AppointmentForm(request.POST, instance=appointment)
         if form.is_valid():
             try:
-                form.save()
+                save_appointment(form.save(commit=False))
                 messages.success(request, 'Appointment updated successfully!')
                 return redirect('appointment_detail', pk=appointment.pk)
-            except Exception as e:
-                messages.error(request, f'Error updating appointment: {str(e)}')
+            except SlotTaken as e:
+                form.add_error(None, str(e))
+                status = 409
     else:
         form = AppointmentForm(instance=appointment)
     return render(request, 'patients/appointment_form.html', {
         'form': form,
         'action': 'Update',
         'appointment': appointment
-    })
+    }, status=status)
 
 
+@query_budget(4)
 @login_required
 def appointment_cancel(request, pk):
-    appointment = get_object_or_404(Appointment, pk=pk)
+    appointment = get_object_or_404(Appointment.objects.select_related('patient', 'doctor'), pk=pk)
     if request.method == 'POST':
         appointment.status = 'CANCELLED'
-        appointment.save()
+        # Cancelling can't create a conflict and must work for past appointments
+        appointment.save(validate=False, update_fields=['status', 'updated_at'])
         messages.success(request, 'Appointment cancelled successfully!')
         return redirect('appointment_list')
     return render(request, 'patients/appointment_confirm_cancel.html', {'appointment': appointment})
 
 
+@query_budget(6)
+@login_required
+def appointment_bulk_status(request):
+    """
+    API endpoint moving many appointments to a new status at once.
+
+    Parameters: ``status``, and either ``ids`` (repeated or comma separated
+    appointment ids, at most ``transitions.BATCH_SIZE``) or ``date``
+    (YYYY-MM-DD) with an optional ``doctor`` id.
+    Responds with the updated, unchanged and rejected counts; a GET only
+    previews them.
+    """
+    params = request.POST if request.method == 'POST' else request.GET
+    status = params.get('status', '')
+    if status not in transitions.ALLOWED_TRANSITIONS:
+        return JsonResponse({'error': 'Unknown or missing status.'}, status=400)
+    try:
+        ids = _parse_ids(params.getlist('ids'))
+        day = _parse_date(params.get('date'))
+        doctor_ids = _parse_ids(params.getlist('doctor'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid ids, date or doctor parameter.'}, status=400)
+    if len(ids) > transitions.BATCH_SIZE:
+        return JsonResponse({'error': f'At most {transitions.BATCH_SIZE} ids per request.'}, status=400)
+    if ids:
+        queryset = Appointment.objects.filter(pk__in=ids)
+    elif day:
+        queryset = Appointment.objects.filter(appointment_date=day)
+        if doctor_ids:
+            queryset = queryset.filter(doctor_id__in=doctor_ids)
+    else:
+        return JsonResponse({'error': 'Pass appointment ids or a date.'}, status=400)
+    dry_run = request.method != 'POST'
+    result = transitions.transition(queryset, status, user=request.user, dry_run=dry_run)
+    return JsonResponse({'status': status, 'dry_run': dry_run, **result})
+
+
+def _parse_date(value, default=None):
+    if not value:
+        return default
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _date_filters(request):
+    """The optional ?from= / ?to= date range; invalid dates are ignored"""
+    dates = []
+    for name in ('from', 'to'):
+        try:
+            dates.append(_parse_date(request.GET.get(name)))
+        except ValueError:
+            dates.append(None)
+    return dates
+
+
+def _parse_timezone(value):
+    """The ?timezone= a slot lookup is for, UTC by default; raises ValueError for unknown zones"""
+    value = value or 'UTC'
+    try:
+        get_zone(value)
+    except ZoneInfoNotFoundError:
+        raise ValueError(f'Unknown time zone "{value}".')
+    return value
+
+
+def _parse_ids(values):
+    """Comma separated ids; raises ValueError for anything but ids the database can hold"""
+    ids = []
+    for value in values:
+        ids.extend(int(part) for part in value.split(',') if part)
+    if any(not -2 ** 63 <= pk < 2 ** 63 for pk in ids):
+        raise ValueError('id out of range')
+    return ids
+
+
+@query_budget(3)
+@login_required
+def patient_phone_lookup(request):
+    """
+    API endpoint identifying callers: patients whose number matches ``phone``
+    exactly or by suffix (e.g. "+1 555 123 4567" finds "(555) 123-4567").
+    """
+    phone = request.GET.get('phone', '')
+    digits = phones.normalize_phone(phone)
+    if len(digits) < phones.MIN_SUFFIX_DIGITS:
+        return _short_phone_response()
+    return _phone_lookup_response(phone, digits, phones.lookup(_phone_lookup_queryset(), phone))
+
+
+def _short_phone_response():
+    return JsonResponse({'error': f'phone must have at least {phones.MIN_SUFFIX_DIGITS} digits.'}, status=400)
+
+
+def _phone_lookup_queryset():
+    return Patient.objects.only('first_name', 'last_name', 'date_of_birth', 'phone_number', 'phone_digits')
+
+
+def _phone_lookup_response(phone, digits, matches):
+    return JsonResponse({
+        'phone': phone,
+        'digits': digits,
+        'matches': [
+            {
+                'id': patient.pk,
+                'name': patient.get_full_name(),
+                'date_of_birth': patient.date_of_birth.isoformat(),
+                'phone_number': patient.phone_number,
+                'match': match,
+                'url': reverse('patient_detail', args=[patient.pk]),
+            }
+            for patient, match in matches
+        ],
+    })
+
+
+# session, user, the ranked ids and the patients
+@query_budget(4)
+@login_required
+def patient_search(request):
+    """
+    API endpoint returning the patients that best match ``q``, best match
+    first (see search.SearchIndex.ranked_ids).
+    """
+    query = request.GET.get('q', '')
+    patients = search_patients(query, fields=['first_name', 'last_name', 'date_of_birth', 'phone_number'])
+    return JsonResponse({
+        'query': query,
+        'results': [
+            {
+                'id': patient.pk,
+                'name': patient.get_full_name(),
+                'date_of_birth': patient.date_of_birth.isoformat(),
+                'phone_number': patient.phone_number,
+                'url': reverse('patient_detail', args=[patient.pk]),
+            }
+            for patient in patients
+        ],
+    })
+
+
+# session, user and up to two name lookups
+@query_budget(4)
+@login_required
+def patient_autocomplete(request):
+    """API endpoint for the booking forms' patient field: patients whose name starts with ``q``"""
+    return JsonResponse(autocomplete.patient_results(request.GET.get('q', '')))
+
+
+@query_budget(4)
+@login_required
+def doctor_autocomplete(request):
+    """API endpoint for the booking forms' doctor field: available doctors by name"""
+    return JsonResponse(autocomplete.doctor_results(request.GET.get('q', '')))
+
+
+@query_budget(2)
+@login_required
+def timezone_autocomplete(request):
+    """API endpoint for the booking forms' time zone field"""
+    return JsonResponse(autocomplete.timezone_results(request.GET.get('q', '')))
+
+
+def _time_slots_response(doctor, appointment_date, mask):
+    return JsonResponse({
+        'doctor': doctor.pk,
+        'date': appointment_date.isoformat(),
+        'time_slots': [
+            {'time': value.strftime('%H:%M'), 'available': bool(mask & (1 << index))}
+            for index, value in enumerate(availability.slot_times(doctor))
+        ],
+    })
+
+
+@query_budget(4)
 @login_required
 def available_time_slots(request, doctor_id, date_str):
-    """API endpoint to get available time slots for a doctor on a specific date"""
+    """
+    API endpoint to get available time slots for a doctor on a specific
+    date. Slots that have started in ``timezone`` (defaults to UTC), the
+    zone the appointment would be booked in, are not available.
+    """
+    return _time_slots(request, doctor_id, date_str)
+
+
+def _time_slots(request, doctor_id, date_str):
+    try:
+        appointment_date = _parse_date(date_str)
+        zone_name = _parse_timezone(request.GET.get('timezone'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date (expected YYYY-MM-DD) or timezone.'}, status=400)
+    doctors = availability.get_doctors([doctor_id])
+    if not doctors:
+        return JsonResponse({'error': 'Doctor not found.'}, status=404)
+    mask = availability.compute_availability(doctors, [appointment_date], zone_name=zone_name)[doctor_id][appointment_date]
+    return _time_slots_response(doctors[0], appointment_date, mask)
+
+
+def _availability_params(request):
+    """``(doctor_ids, dates, zone_name)`` of a doctor_availability request, or an error response"""
+    try:
+        doctor_ids = _parse_ids(request.GET.getlist('doctor'))
+        start_date = _parse_date(request.GET.get('start'), default=date.today())
+        days = int(request.GET.get('days', availability.DEFAULT_DAYS))
+        zone_name = _parse_timezone(request.GET.get('timezone'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid doctor, start, days or timezone parameter.'}, status=400)
+    if not doctor_ids or len(doctor_ids) > availability.MAX_DOCTORS:
+        return JsonResponse(
+            {'error': f'Pass between 1 and {availability.MAX_DOCTORS} doctor ids.'}, status=400
+        )
+    if not 1 <= days <= availability.MAX_DAYS:
+        return JsonResponse({'error': f'days must be between 1 and {availability.MAX_DAYS}.'}, status=400)
+    return doctor_ids, availability.date_range(start_date, days), zone_name
+
+
+@query_budget(4)
+@login_required
+def doctor_availability(request):
+    """
+    API endpoint returning free slots for one or more doctors over a range of days.
+
+    Query parameters: ``doctor`` (repeated or comma separated ids), ``start``
+    (YYYY-MM-DD, defaults to today), ``days`` (defaults to 14) and
+    ``timezone`` (the zone of the booking, defaults to UTC).
+    """
+    return _doctor_availability(request)
+
+
+def _doctor_availability(request):
+    params = _availability_params(request)
+    if isinstance(params, JsonResponse):
+        return params
+    doctor_ids, dates, zone_name = params
+    doctors = availability.get_doctors(doctor_ids)
+    result = availability.compute_availability(doctors, dates, zone_name=zone_name)
+    return JsonResponse(availability.serialize_availability(doctors, dates, result))
+
+
+# One query per window of days searched (see availability.earliest_slots),
+# five for a 31 day window that is fully booked
+@query_budget(8)
+@login_required
+def earliest_available_slots(request):
+    """
+    API endpoint returning the earliest free slots across all available
+    doctors of a specialization.
+
+    Query parameters: ``specialization`` (a ``Doctor.SPECIALIZATION_CHOICES``
+    code), ``start`` (YYYY-MM-DD, defaults to today), ``days`` (defaults to
+    14), ``count`` (defaults to 5) and ``timezone`` (the zone of the
+    booking, defaults to UTC).
+    """
+    specialization = request.GET.get('specialization', '')
+    if specialization not in dict(Doctor.SPECIALIZATION_CHOICES):
+        return JsonResponse({'error': 'Unknown or missing specialization.'}, status=400)
     try:
-        doctor = get_object_or_404(Doctor, pk=doctor_id)
-        appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        
-        # Define working hours (9 AM to 5 PM with 1-hour slots)
-        time_slots = []
-        for hour in range(9, 17):
-            slot_time = f"{hour:02d}:00"
-            # Check if this slot is already booked
-            is_booked = Appointment.objects.filter(
-                doctor=doctor,
-                appointment_date=appointment_date,
-                appointment_time=slot_time
-            ).exclude(status='CANCELLED').exists()
-            
-            time_slots.append({
-                'time': slot_time,
-                'available': not is_booked
-            })
-        
-        return render(request, 'patients/time_slots.html', {
-            'time_slots': time_slots,
-            'doctor': doctor,
-            'date': appointment_date
-        })
-    except Exception as e:
-        messages.error(request, f'Error fetching time slots: {str(e)}')
-        return redirect('appointment_book')
+        start_date = _parse_date(request.GET.get('start'), default=date.today())
+        days = int(request.GET.get('days', availability.DEFAULT_DAYS))
+        count = int(request.GET.get('count', availability.DEFAULT_EARLIEST))
+        zone_name = _parse_timezone(request.GET.get('timezone'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid start, days, count or timezone parameter.'}, status=400)
+    if not 1 <= days <= availability.MAX_DAYS:
+        return JsonResponse({'error': f'days must be between 1 and {availability.MAX_DAYS}.'}, status=400)
+    if not 1 <= count <= availability.MAX_EARLIEST:
+        return JsonResponse({'error': f'count must be between 1 and {availability.MAX_EARLIEST}.'}, status=400)
+    doctors = availability.get_specialists(specialization)
+    slots = availability.earliest_slots(doctors, availability.date_range(start_date, days), count, zone_name=zone_name)
+    return JsonResponse({
+        'specialization': specialization,
+        'start': start_date.isoformat(),
+        'days': days,
+        'slots': [
+            {
+                'date': day.isoformat(),
+                'time': value.strftime('%H:%M'),
+                'doctor': {'id': doctor.pk, 'name': doctor.get_full_name()},
+            }
+            for day, value, doctor in slots
+        ],
+    })
+
+
+@query_budget(2)
+@staff_member_required
+def availability_cache_stats(request):
+    """Hit/miss counters of the availability cache for this process"""
+    return JsonResponse(availability.cache_stats.as_dict())
+
+
+@query_budget(2)
+def metrics(request):
+    """Per-route request metrics in the Prometheus text format"""
+    allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    if not allowed and not request.user.is_staff:
+        return HttpResponseForbidden()
+    cache = availability.cache_stats.as_dict()
+    doctors = directory.stats()
+    extra = [
+        '# HELP pms_availability_cache_hits_total Availability cache hits.',
+        '# TYPE pms_availability_cache_hits_total counter',
+        f'pms_availability_cache_hits_total {cache["hits"]}',
+        '# HELP pms_availability_cache_misses_total Availability cache misses.',
+        '# TYPE pms_availability_cache_misses_total counter',
+        f'pms_availability_cache_misses_total {cache["misses"]}',
+        '# HELP pms_doctor_directory_doctors Doctors in this process\'s doctor directory.',
+        '# TYPE pms_doctor_directory_doctors gauge',
+        f'pms_doctor_directory_doctors {doctors["doctors"]}',
+        '# HELP pms_doctor_directory_bytes Approximate memory held by the doctor directory.',
+        '# TYPE pms_doctor_directory_bytes gauge',
+        f'pms_doctor_directory_bytes {doctors["bytes"]}',
+        '# HELP pms_doctor_directory_loads_total Doctor directory (re)loads in this process.',
+        '# TYPE pms_doctor_directory_loads_total counter',
+        f'pms_doctor_directory_loads_total {doctors["loads"]}',
+    ]
+    return HttpResponse(registry.render(extra), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Async variants of the read-heavy endpoints, for ASGI deployments (see
+# patient_management_system/asgi.py). They answer exactly like the views
+# above; templates are rendered on the request's sync thread.
+async def _render(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@query_budget(5)
+@async_login_required
+@conditional_page(lambda request: list_state(_listed_patients(request)))
+async def patient_list_async(request):
+    page = await apaginate(request, patient_list_queryset(_listed_patients(request)))
+    return await _render(request, 'patients/patient_list.html', {
+        'patients': page, 'page': page, 'query': request.GET.get('q', ''),
+    })
+
+
+@query_budget(4)
+@async_login_required
+async def doctor_list_async(request):
+    page = await sync_to_async(_doctor_list_page)(request)
+    return await _render(request, 'patients/doctor_list.html', {'doctors': page, 'page': page, 'query': request.GET.get('q', '')})
+
+
+@query_budget(5)
+@async_login_required
+@conditional_page(lambda request: list_state(_listed_appointments(request), Patient, Doctor))
+async def appointment_list_async(request):
+    page = await apaginate(request, appointment_list_queryset(_listed_appointments(request)))
+    await sync_to_async(directory.attach_doctors)(page)
+    return await _render(request, 'patients/appointment_list.html', _appointment_list_context(request, page))
+
+
+@query_budget(3)
+@async_login_required
+async def patient_phone_lookup_async(request):
+    phone = request.GET.get('phone', '')
+    digits = phones.normalize_phone(phone)
+    if len(digits) < phones.MIN_SUFFIX_DIGITS:
+        return _short_phone_response()
+    return _phone_lookup_response(phone, digits, await phones.alookup(_phone_lookup_queryset(), phone))
+
+
+# The doctors come from the in-memory directory and most doctor-days from
+# the availability cache, so the slot lookups have no independent queries
+# to overlap; they go through the sync views' code, cache and primary
+# reads included
+@query_budget(4)
+@async_login_required
+async def available_time_slots_async(request, doctor_id, date_str):
+    return await sync_to_async(_time_slots)(request, doctor_id, date_str)
+
+
+@query_budget(4)
+@async_login_required
+async def doctor_availability_async(request):
+    return await sync_to_async(_doctor_availability)(request)